@@ -0,0 +1,210 @@
+{{/*
+Manifests for a single tank. Each takes a context with .Values, .Release and .Chart so they
+can render either this release's own tank or every entry of .Values.nodes (see network.yaml).
+*/}}
+
+{{- define "bitcoincore.configmap" -}}
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: {{ include "bitcoincore.fullname" . }}
+  labels:
+    {{- include "bitcoincore.labels" . | nindent 4 }}
+data:
+  bitcoin.conf: |
+    {{ .Values.chain }}=1
+
+    {{ template "bitcoincore.check_semver" . }}
+    {{- .Values.baseConfig | nindent 4 }}
+    rpcport={{ index .Values .Values.chain "RPCPort" }}
+    rpcpassword={{ .Values.rpcpassword }}
+    zmqpubrawblock=tcp://0.0.0.0:{{ .Values.ZMQBlockPort }}
+    zmqpubrawtx=tcp://0.0.0.0:{{ .Values.ZMQTxPort }}
+    {{- .Values.defaultConfig | nindent 4 }}
+    {{- .Values.config | nindent 4 }}
+    {{- range .Values.addnode }}
+      {{- print "addnode=" . | nindent 4}}
+    {{- end }}
+{{- end }}
+
+{{- define "bitcoincore.service" -}}
+apiVersion: v1
+kind: Service
+metadata:
+  name: {{ include "bitcoincore.fullname" . }}
+  labels:
+    {{- include "bitcoincore.labels" . | nindent 4 }}
+    app: {{ include "bitcoincore.fullname" . }} 
+spec:
+  type: {{ .Values.service.type }}
+  ports:
+    - port: {{ index .Values .Values.chain "RPCPort" }}
+      targetPort: rpc
+      protocol: TCP
+      name: rpc
+    - port: {{ index .Values .Values.chain "P2PPort" }}
+      targetPort: p2p
+      protocol: TCP
+      name: p2p
+    - port: {{ .Values.ZMQTxPort }}
+      targetPort: zmq-tx
+      protocol: TCP
+      name: zmq-tx
+    - port: {{ .Values.ZMQBlockPort }}
+      targetPort: zmq-block
+      protocol: TCP
+      name: zmq-block
+    - port: {{ .Values.prometheusMetricsPort }}
+      targetPort: prom-metrics
+      protocol: TCP
+      name: prometheus-metrics
+  selector:
+    {{- include "bitcoincore.selectorLabels" . | nindent 4 }}
+{{- end }}
+
+{{- define "bitcoincore.pod" -}}
+apiVersion: v1
+kind: Pod
+metadata:
+  name: {{ include "bitcoincore.fullname" . }}
+  labels:
+    {{- include "bitcoincore.labels" . | nindent 4 }}
+    {{- with .Values.podLabels }}
+        {{- toYaml . | nindent 4 }}
+    {{- end }}
+    chain: {{ .Values.chain }}
+    RPCPort: "{{ index .Values .Values.chain "RPCPort" }}"
+    rpcpassword: {{ .Values.rpcpassword }}
+    app: {{ include "bitcoincore.fullname" . }}
+    {{- if .Values.collectLogs }}
+    collect_logs: "true"
+    {{- end }}
+  annotations:
+    init_peers: "{{ .Values.addnode | len }}"
+    {{- with .Values.podAnnotations }}
+      {{- toYaml . | nindent 4 }}
+    {{- end }}
+spec:
+  restartPolicy: "{{ .Values.restartPolicy }}"
+  {{- with .Values.imagePullSecrets }}
+  imagePullSecrets:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+  securityContext:
+    {{- toYaml .Values.podSecurityContext | nindent 4 }}
+  {{- if .Values.loadSnapshot.enabled }}
+  initContainers:
+    - name: download-blocks
+      image: "{{ .Values.loadSnapshot.image.repository }}:{{ .Values.loadSnapshot.image.tag }}"
+      imagePullPolicy: {{ .Values.loadSnapshot.image.pullPolicy }}
+      command: ["/bin/sh", "-c"]
+      args:
+        - |
+          set -o pipefail
+          mkdir -p /root/.bitcoin/{{ .Values.chain }}
+          curl -fsSL {{ .Values.loadSnapshot.url | quote }} | tar -x{{ if not (hasSuffix ".tar" .Values.loadSnapshot.url) }}z{{ end }} -C /root/.bitcoin/{{ .Values.chain }}
+      securityContext:
+        runAsUser: 0
+      volumeMounts:
+        - name: data
+          mountPath: /root/.bitcoin
+  {{- end }}
+  containers:
+    - name: {{ .Chart.Name }}
+      securityContext:
+        {{- toYaml .Values.securityContext | nindent 8 }}
+      image: "{{ .Values.image.repository }}:{{ .Values.image.tag | default .Chart.AppVersion }}"
+      imagePullPolicy: {{ .Values.image.pullPolicy }}
+      ports:
+        - name: rpc
+          containerPort: {{ index .Values .Values.chain "RPCPort" }}
+          protocol: TCP
+        - name: p2p
+          containerPort: {{ index .Values .Values.chain "P2PPort" }}
+          protocol: TCP
+        - name: zmq-tx
+          containerPort: {{ .Values.ZMQTxPort }}
+          protocol: TCP
+        - name: zmq-block
+          containerPort: {{ .Values.ZMQBlockPort }}
+          protocol: TCP
+      livenessProbe:
+        {{- toYaml .Values.livenessProbe | nindent 8 }}
+      readinessProbe:
+        {{- toYaml .Values.readinessProbe | nindent 8 }}
+        tcpSocket:
+          port: {{ index .Values .Values.chain "RPCPort" }}
+      resources:
+        {{- toYaml .Values.resources | nindent 8 }}
+      volumeMounts:
+        {{- with .Values.volumeMounts }}
+          {{- toYaml . | nindent 8 }}
+        {{- end }}
+        - mountPath: /root/.bitcoin
+          name: data
+        - mountPath: /root/.bitcoin/bitcoin.conf
+          name: config
+          subPath: bitcoin.conf
+    {{- if .Values.metricsExport }}
+    - name: prometheus
+      image: bitcoindevproject/bitcoin-exporter:latest
+      imagePullPolicy: IfNotPresent
+      ports:
+        - name: prom-metrics
+          containerPort: {{ .Values.prometheusMetricsPort }}
+          protocol: TCP
+      env:
+        - name: BITCOIN_RPC_HOST
+          value: "127.0.0.1"
+        - name: BITCOIN_RPC_PORT
+          value: "{{ index .Values .Values.chain "RPCPort" }}"
+        - name: BITCOIN_RPC_USER
+          value: user
+        - name: BITCOIN_RPC_PASSWORD
+          value: {{ .Values.rpcpassword }}
+        {{- if .Values.metrics }}
+        - name: METRICS
+          value: {{ .Values.metrics }}
+        {{- end }}
+    {{- end}}
+  volumes:
+    {{- with .Values.volumes }}
+      {{- toYaml . | nindent 4 }}
+    {{- end }}
+    - name: data
+      emptyDir: {}
+    - name: config
+      configMap:
+        name: {{ include "bitcoincore.fullname" . }}
+  {{- with .Values.nodeSelector }}
+  nodeSelector:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+  {{- with .Values.affinity }}
+  affinity:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+  {{- with .Values.tolerations }}
+  tolerations:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+{{- end }}
+
+{{- define "bitcoincore.servicemonitor" -}}
+{{- if .Values.metricsExport }}
+apiVersion: monitoring.coreos.com/v1
+kind: ServiceMonitor
+metadata:
+  name: {{ include "bitcoincore.fullname" . }}
+  labels:
+    app.kubernetes.io/name: bitcoind-metrics
+    app.kubernetes.io/instance: {{ .Release.Name }}
+    release: prometheus
+spec:
+  endpoints:
+    - port: prometheus-metrics
+  selector:
+    matchLabels:
+      app: {{ include "bitcoincore.fullname" . }}
+{{- end }}
+{{- end }}
@@ -1,18 +1,51 @@
+import base64
+import heapq
+import http.client
+import json
+import math
+import mmap
 import os
 import re
+import subprocess
 import sys
-from datetime import datetime
-from io import BytesIO
-from typing import Optional
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Iterator, Optional, Union
 
 import click
-from test_framework.messages import ser_uint256
-from test_framework.p2p import MESSAGEMAP
+from kubernetes.client.models import V1Pod
+from kubernetes.client.rest import ApiException
 from urllib3.exceptions import MaxRetryError
 
-from .constants import BITCOINCORE_CONTAINER
-from .k8s import get_default_namespace_or, get_mission, pod_log
+from .constants import BITCOINCORE_CONTAINER, DECODE_LEVELS
+from .k8s import (
+    get_default_namespace_or,
+    get_mission,
+    get_pod,
+    get_services,
+    pod_log,
+    port_forward,
+)
+from .pod_logs import LOG_CHUNK_SIZE, LogSource, iter_log_chunks
 from .process import run_command
+from .util import (
+    k8s_timestamp,
+    normalize_k8s_timestamp,
+    parse_duration,
+    parse_k8s_timestamp,
+)
+
+# bitcoind's RPC_TYPE_ERROR, returned when a parameter has the wrong JSON type
+RPC_TYPE_ERROR = -3
 
 
 @click.group(name="bitcoin")
@@ -38,36 +71,411 @@ def rpc(tank: str, method: str, params: str, namespace: Optional[str]):
 
 
 def _rpc(tank: str, method: str, params: str, namespace: Optional[str] = None):
+    namespace = get_default_namespace_or(namespace)
+    params = [str(param) for param in params or ()]
+    # bitcoin-cli only options (-generate, -rpcwallet=, -named...) need bitcoin-cli itself
+    if method.startswith("-") or any(param.startswith("-") for param in params):
+        return _rpc_exec(tank, method, params, namespace)
+    try:
+        result = get_tank_rpc(tank, namespace).call(method, [_rpc_param(p) for p in params])
+    except RPCTransportError:
+        # No port-forward to this tank (RBAC, old chart labels, a redeployed pod...), go
+        # through kubectl exec. The next call starts over with a fresh client.
+        drop_tank_rpc(tank, namespace)
+        return _rpc_exec(tank, method, params, namespace)
+    except (OSError, http.client.HTTPException):
+        # The request may have reached bitcoind, so it isn't sent again
+        drop_tank_rpc(tank, namespace)
+        raise
+    except RPCError as e:
+        if e.code != RPC_TYPE_ERROR:
+            raise
+        # We guessed a parameter's type wrong, bitcoin-cli knows which ones are strings
+        return _rpc_exec(tank, method, params, namespace)
+    # Print results the way bitcoin-cli does
+    if result is None:
+        return ""
+    if isinstance(result, str):
+        return result + "\n"
+    return _format_result(result) + "\n"
+
+
+def _format_result(value, level: int = 0) -> str:
+    """
+    JSON text like bitcoin-cli prints it: indented by two spaces, with amounts exactly as
+    bitcoind sent them (TankRPC parses them as Decimal) and empty arrays and objects split
+    over two lines
+    """
+    if isinstance(value, (dict, list)):
+        indent = "  " * (level + 1)
+        if isinstance(value, dict):
+            items = [
+                f"{indent}{json.dumps(key, ensure_ascii=False)}: {_format_result(item, level + 1)}"
+                for key, item in value.items()
+            ]
+            brackets = "{}"
+        else:
+            items = [f"{indent}{_format_result(item, level + 1)}" for item in value]
+            brackets = "[]"
+        body = ",\n".join(items) + ("\n" if items else "")
+        return f"{brackets[0]}\n{body}{'  ' * level}{brackets[1]}"
+    if isinstance(value, Decimal):
+        return str(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _rpc_exec(tank: str, method: str, params: list[str], namespace: str):
     # bitcoin-cli should be able to read bitcoin.conf inside the container
     # so no extra args like port, chain, username or password are needed
-    namespace = get_default_namespace_or(namespace)
     if params:
-        cmd = f"kubectl -n {namespace} exec {tank} --container {BITCOINCORE_CONTAINER} -- bitcoin-cli {method} {' '.join(map(str, params))}"
+        cmd = f"kubectl -n {namespace} exec {tank} --container {BITCOINCORE_CONTAINER} -- bitcoin-cli {method} {' '.join(params)}"
     else:
         cmd = f"kubectl -n {namespace} exec {tank} --container {BITCOINCORE_CONTAINER} -- bitcoin-cli {method}"
     return run_command(cmd)
 
 
+def _rpc_param(param: str):
+    """Command line argument to JSON-RPC parameter: JSON if it parses, otherwise a string"""
+    try:
+        return json.loads(param)
+    except ValueError:
+        return param
+
+
+class RPCError(Exception):
+    """An error returned by bitcoind, formatted like bitcoin-cli reports it"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"error code: {code}\nerror message:\n{message}")
+        self.code = code
+        self.message = message
+
+
+class RPCTransportError(Exception):
+    """The JSON-RPC connection to a tank could not be opened"""
+
+
+class PortForwardConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to a pod port through an API server port-forward, reopened on demand.
+    Reopening it fails if the pod was replaced by a new one of the same name since.
+    """
+
+    def __init__(
+        self, pod_name: str, namespace: str, port: int, timeout: float = 60, uid: str = ""
+    ):
+        super().__init__("localhost", port, timeout=timeout)
+        self.pod_name = pod_name
+        self.namespace = namespace
+        self.uid = uid
+        self._forward = None
+        self._opened = False
+
+    def connect(self):
+        if self._opened and self.uid:
+            try:
+                replaced = get_pod(self.pod_name, self.namespace).metadata.uid != self.uid
+            except ApiException as e:
+                raise RPCTransportError(f"Could not read tank {self.pod_name}: {e.reason}") from e
+            if replaced:
+                raise RPCTransportError(f"Tank {self.pod_name} was redeployed")
+        self._opened = True
+        try:
+            self._forward = port_forward(self.pod_name, self.port, self.namespace)
+        except ApiException as e:
+            raise RPCTransportError(f"Could not port-forward to {self.pod_name}: {e.reason}") from e
+        self.sock = self._forward.socket(self.port)
+        self.sock.settimeout(self.timeout)
+
+    def close(self):
+        super().close()
+        if self._forward:
+            self._forward.close()
+            self._forward = None
+
+
+class TankRPC:
+    """
+    JSON-RPC client for one tank, using the `RPCPort` and `rpcpassword` labels of its pod.
+    The connection is kept alive between calls, which are serialized.
+    """
+
+    def __init__(self, tank: V1Pod, timeout: float = 60):
+        labels = tank.metadata.labels or {}
+        try:
+            port = int(labels["RPCPort"])
+            credentials = f"user:{labels['rpcpassword']}"
+        except KeyError as e:
+            raise RPCTransportError(f"Tank {tank.metadata.name} has no {e} label") from e
+        self.connection = PortForwardConnection(
+            tank.metadata.name, tank.metadata.namespace, port, timeout, tank.metadata.uid or ""
+        )
+        self.headers = {
+            "Authorization": f"Basic {base64.b64encode(credentials.encode()).decode()}",
+            "Content-Type": "application/json",
+        }
+        self._lock = threading.Lock()
+        self._id = 0
+
+    def call(self, method: str, params: list):
+        with self._lock:
+            self._id += 1
+            body = json.dumps(
+                {"jsonrpc": "1.0", "id": self._id, "method": method, "params": params}
+            )
+            status, data = self._post(body)
+        if status == 401:
+            raise RPCTransportError("Authorization failed: Incorrect rpcuser or rpcpassword")
+        try:
+            # Decimal keeps amounts like 0.00001000 as bitcoind wrote them
+            reply = json.loads(data, parse_float=Decimal)
+        except ValueError as e:
+            raise Exception(f"server returned HTTP error {status}") from e
+        if reply.get("error"):
+            raise RPCError(reply["error"]["code"], reply["error"]["message"])
+        return reply["result"]
+
+    def _post(self, body: str) -> tuple[int, bytes]:
+        reused = self.connection.sock is not None
+        try:
+            self.connection.request("POST", "/", body, self.headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            self.connection.close()
+            if not reused:
+                raise
+        # bitcoind closed the idle keep-alive connection before reading our request: retry once
+        self.connection.request("POST", "/", body, self.headers)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+_tank_rpcs: dict[tuple[str, str], TankRPC] = {}
+_tank_rpcs_lock = threading.Lock()
+
+
+def get_tank_rpc(tank: str, namespace: Optional[str] = None) -> TankRPC:
+    """Return the pooled JSON-RPC client for `tank`, creating it on first use"""
+    namespace = get_default_namespace_or(namespace)
+    with _tank_rpcs_lock:
+        rpc = _tank_rpcs.get((namespace, tank))
+    if rpc is None:
+        try:
+            pod = get_pod(tank, namespace)
+        except ApiException as e:
+            raise RPCTransportError(f"Could not read tank {tank}: {e.reason}") from e
+        rpc = TankRPC(pod)
+        with _tank_rpcs_lock:
+            rpc = _tank_rpcs.setdefault((namespace, tank), rpc)
+    return rpc
+
+
+def drop_tank_rpc(tank: str, namespace: Optional[str] = None) -> None:
+    namespace = get_default_namespace_or(namespace)
+    with _tank_rpcs_lock:
+        rpc = _tank_rpcs.pop((namespace, tank), None)
+    if rpc:
+        rpc.close()
+
+
+def parse_since(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_duration(value)
+    except ValueError:
+        raise click.BadParameter(f"{value} is not a duration like 90s, 10m or 2h") from None
+
+
+def parse_since_time(ctx, param, value) -> Optional[str]:
+    """Parse an RFC 3339 time, UTC unless it says otherwise, to a Kubernetes log timestamp"""
+    if value is None:
+        return None
+    try:
+        # fromisoformat only accepts a "Z" suffix from Python 3.11
+        moment = datetime.fromisoformat(re.sub(r"[zZ]$", "+00:00", value))
+    except ValueError:
+        raise click.BadParameter(f"{value} is not a time like 2024-06-01T12:00:00Z") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return k8s_timestamp(moment)
+
+
 @bitcoin.command()
 @click.argument("tank", type=str, required=True)
 @click.option("--namespace", default=None, show_default=True)
-def debug_log(tank: str, namespace: Optional[str]):
+@click.option("--tail", type=click.IntRange(min=0), help="Only the last N lines of the log")
+@click.option("--since", callback=parse_since, help="Only lines newer than e.g. 30s, 10m, 2h")
+@click.option(
+    "--since-time", callback=parse_since_time, help="Only lines at or after this RFC 3339 time"
+)
+@click.option(
+    "--limit-bytes",
+    type=click.IntRange(min=1),
+    help="Read at most this many bytes of log, timestamps included with --since-time or --output",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Write the log to this file, resuming where the last download to it stopped",
+)
+def debug_log(
+    tank: str,
+    namespace: Optional[str],
+    tail: Optional[int],
+    since: Optional[int],
+    since_time: Optional[str],
+    limit_bytes: Optional[int],
+    output: Optional[Path],
+):
     """
     Fetch the Bitcoin Core debug log from <tank pod name>
+
+    The log is streamed as it is read, with --tail, --since and --limit-bytes applied by the
+    API server; past a --since-time or resume point, --limit-bytes is applied as it streams
+    in. With --output, a later run appends only the lines logged since the last one, so a
+    large log can be fetched in parts with --limit-bytes.
     """
+    if since is not None and since_time is not None:
+        raise click.UsageError("--since and --since-time can't be combined")
     namespace = get_default_namespace_or(namespace)
-    cmd = f"kubectl logs {tank} --namespace {namespace}"
+    options = {"since_seconds": since, "tail_lines": tail, "limit_bytes": limit_bytes}
     try:
-        print(run_command(cmd))
+        if output:
+            _download_debug_log(tank, namespace, output, since_time, options)
+        elif since_time:
+            for lines in _debug_log_lines(tank, namespace, since_time, 0, options):
+                click.echo("".join(f"{text}\n" for _, text in lines), nl=False)
+        else:
+            response = pod_log(tank, BITCOINCORE_CONTAINER, namespace=namespace, **options)
+            try:
+                for chunk in response.stream(LOG_CHUNK_SIZE):
+                    click.echo(chunk, nl=False)
+            finally:
+                response.release_conn()
+    except click.ClickException:
+        raise
     except Exception as e:
         print(f"{e}")
 
 
+def _debug_log_lines(
+    tank: str, namespace: str, start: Optional[str], skip: int, options: dict
+) -> Iterator[list[tuple[str, str]]]:
+    """
+    Batches of the (timestamp, text) of a tank's debug log lines from timestamp `start` on,
+    leaving out the first `skip` lines at `start` itself. The API only takes a start in whole
+    seconds before now, so a little more is requested and the rest filtered out here.
+    """
+    limit = None
+    if start:
+        seconds = max(1, math.ceil(time.time() - parse_k8s_timestamp(start).timestamp()) + 1)
+        if options["since_seconds"] is None or seconds < options["since_seconds"]:
+            options = {**options, "since_seconds": seconds}
+        # The lines before `start` would count towards a limit the server applies, and a
+        # resume could spend all of it on lines it already has, so the limit is applied here
+        limit, options = options["limit_bytes"], {**options, "limit_bytes": None}
+    source = LogSource(tank, namespace, BITCOINCORE_CONTAINER)
+    # A line cut off by limit_bytes is left for the next download
+    for lines in iter_log_chunks(
+        source, follow=False, partial_lines=not options["limit_bytes"], **options
+    ):
+        if start:
+            kept = []
+            for timestamp, text in lines:
+                if timestamp < start:
+                    continue
+                if timestamp == start and skip:
+                    skip -= 1
+                    continue
+                kept.append((timestamp, text))
+            lines = kept
+        if limit is not None:
+            kept = []
+            for timestamp, text in lines:
+                if limit <= 0:
+                    break
+                kept.append((timestamp, text))
+                # As the server counts them, up to the line that reaches the limit
+                limit -= len(f"{timestamp} {text}\n".encode())
+            lines = kept
+        if lines:
+            yield lines
+        if limit is not None and limit <= 0:
+            return
+
+
+def _download_debug_log(
+    tank: str, namespace: str, output: Path, since_time: Optional[str], options: dict
+) -> None:
+    """
+    Append a tank's debug log to `output`, resuming after the last line written to it.
+
+    Next to the file, <file>.resume records the timestamp of the last line written, how many
+    lines had that timestamp and the size of the file when it was written. A download that
+    was interrupted after writing more than that is cut back to the recorded size.
+    """
+    resume = output.with_name(f"{output.name}.resume")
+    state = {"tank": tank, "namespace": namespace, "timestamp": None, "lines": 0, "size": 0}
+    if output.exists():
+        if not resume.exists():
+            raise click.ClickException(
+                f"{output} exists but wasn't written by debug-log, so it can't be resumed"
+            )
+        try:
+            state = json.loads(resume.read_text())
+            size = state["size"]
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(f"Can't resume from {resume}: {e}") from None
+        if (state["tank"], state["namespace"]) != (tank, namespace):
+            raise click.ClickException(
+                f"{output} has the log of {state['tank']} in {state['namespace']}, not {tank}"
+            )
+        if output.stat().st_size < size:
+            raise click.ClickException(f"{output} is shorter than {resume} expects")
+
+    start, skip = state["timestamp"], state["lines"]
+    if since_time and (start is None or since_time > start):
+        start, skip = since_time, 0
+
+    with open(output, "r+b" if output.exists() else "wb") as f:
+        f.truncate(state["size"])
+        f.seek(state["size"])
+        for lines in _debug_log_lines(tank, namespace, start, skip, options):
+            f.write("".join(f"{text}\n" for _, text in lines).encode())
+            f.flush()
+            last = lines[-1][0]
+            same = sum(1 for timestamp, _ in lines if timestamp == last)
+            state["lines"] = same + (state["lines"] if last == state["timestamp"] else 0)
+            state["timestamp"] = last
+            state["size"] = f.tell()
+            partial = resume.with_name(f"{resume.name}.tmp")
+            partial.write_text(json.dumps(state))
+            os.replace(partial, resume)
+    if not resume.exists():
+        # Nothing to write yet, but the file is ours to resume
+        resume.write_text(json.dumps(state))
+
+
 @bitcoin.command()
 @click.argument("pattern", type=str, required=True)
 @click.option("--show-k8s-timestamps", is_flag=True, default=False, show_default=True)
 @click.option("--no-sort", is_flag=True, default=False, show_default=True)
-def grep_logs(pattern: str, show_k8s_timestamps: bool, no_sort: bool):
+@click.option("--since", callback=parse_since, help="Only search logs newer than e.g. 30s, 10m, 2h")
+@click.option("--tail", type=click.IntRange(min=0), help="Only search the last N lines of each log")
+def grep_logs(
+    pattern: str,
+    show_k8s_timestamps: bool,
+    no_sort: bool,
+    since: Optional[int],
+    tail: Optional[int],
+):
     """
     Grep combined bitcoind logs using regex <pattern>
     """
@@ -78,59 +486,160 @@ def grep_logs(pattern: str, show_k8s_timestamps: bool, no_sort: bool):
         print(f"{e}")
         sys.exit(1)
 
-    matching_logs = []
-    longest_namespace_len = 0
+    longest_namespace_len = max((len(tank.metadata.namespace) for tank in tanks), default=0)
 
-    for tank in tanks:
-        if len(tank.metadata.namespace) > longest_namespace_len:
-            longest_namespace_len = len(tank.metadata.namespace)
+    try:
+        for timestamp, tank, entry in grep_tank_logs(
+            pattern, tanks, since_seconds=since, tail_lines=tail, sort=not no_sort
+        ):
+            pod_name = tank.metadata.name
+            if timestamp is None:
+                # The log of this tank could not be read
+                print(f"{pod_name}: {entry}")
+            elif show_k8s_timestamps:
+                print(
+                    f"{pod_name} {tank.metadata.namespace:<{longest_namespace_len}} {timestamp} {entry}"
+                )
+            else:
+                print(f"{pod_name} {tank.metadata.namespace:<{longest_namespace_len}} {entry}")
+    except KeyboardInterrupt:
+        print("Interrupted streaming log!")
 
-        pod_name = tank.metadata.name
-        logs = pod_log(pod_name, BITCOINCORE_CONTAINER)
 
-        if logs is not False:
-            try:
-                for line in logs:
-                    log_entry = line.decode("utf-8").rstrip()
-                    if re.search(pattern, log_entry):
-                        matching_logs.append((log_entry, tank.metadata.namespace, pod_name))
-            except Exception as e:
-                print(e)
-            except KeyboardInterrupt:
-                print("Interrupted streaming log!")
+# Sentinel a log reader queues after the last line of its log
+LOG_END = object()
 
-    # Sort logs if needed
-    if not no_sort:
-        matching_logs.sort(key=lambda x: x[0])
 
-    # Print matching logs
-    for log_entry, namespace, pod_name in matching_logs:
-        try:
-            # Split the log entry into Kubernetes timestamp, Bitcoin timestamp, and the rest of the log
-            k8s_timestamp, rest = log_entry.split(" ", 1)
-            bitcoin_timestamp, log_message = rest.split(" ", 1)
+def _read_tank_log(
+    tank: V1Pod,
+    regex: re.Pattern,
+    put: Callable,
+    since_seconds: Optional[int],
+    tail_lines: Optional[int],
+    watermark_every: Optional[int],
+):
+    """
+    Stream one tank's log and `put` (timestamp, entry) for each entry matching `regex`,
+    then LOG_END, or the exception that stopped it. Every `watermark_every` lines without
+    a match it puts (timestamp, None) so a merge consuming it can move past that time.
+    """
+    try:
+        logs = pod_log(
+            tank.metadata.name,
+            BITCOINCORE_CONTAINER,
+            namespace=tank.metadata.namespace,
+            since_seconds=since_seconds,
+            tail_lines=tail_lines,
+            timestamps=True,
+        )
+        unmatched = 0
+        for line in logs:
+            timestamp, _, entry = line.decode("utf-8", errors="replace").rstrip().partition(" ")
+            if regex.search(entry):
+                put((normalize_k8s_timestamp(timestamp), entry))
+                unmatched = 0
+            elif watermark_every:
+                unmatched += 1
+                if unmatched >= watermark_every:
+                    put((normalize_k8s_timestamp(timestamp), None))
+                    unmatched = 0
+    except Exception as e:
+        put(e)
+    else:
+        put(LOG_END)
 
-            # Format the output based on the show_k8s_timestamps option
-            if show_k8s_timestamps:
-                print(
-                    f"{pod_name} {namespace:<{longest_namespace_len}} {k8s_timestamp} {bitcoin_timestamp} {log_message}"
-                )
+
+def grep_tank_logs(
+    pattern: str,
+    tanks: list[V1Pod],
+    since_seconds: Optional[int] = None,
+    tail_lines: Optional[int] = None,
+    sort: bool = True,
+    buffer_lines: int = 1000,
+) -> Iterator[tuple[Optional[str], V1Pod, Union[str, Exception]]]:
+    """
+    Search the bitcoind logs of `tanks` concurrently, yielding (k8s timestamp, tank, entry)
+    for every log entry matching `pattern`. Each tank's log is already in time order, so
+    with `sort` the streams are merged on a heap and yielded in time order as they are
+    read; otherwise entries are yielded as they arrive. At most `buffer_lines` entries per
+    tank are held in memory. A tank whose log can't be read yields (None, tank, exception).
+    """
+    regex = re.compile(pattern)
+
+    def start_reader(tank: V1Pod, put: Callable, watermark_every: Optional[int]):
+        threading.Thread(
+            target=_read_tank_log,
+            args=(tank, regex, put, since_seconds, tail_lines, watermark_every),
+            daemon=True,
+        ).start()
+
+    if not sort:
+        shared: Queue = Queue(maxsize=buffer_lines)
+        for i, tank in enumerate(tanks):
+            start_reader(tank, partial(lambda i, item: shared.put((i, item)), i), None)
+        running = len(tanks)
+        while running:
+            i, item = shared.get()
+            if item is LOG_END or isinstance(item, Exception):
+                running -= 1
+                if item is not LOG_END:
+                    yield None, tanks[i], item
             else:
-                print(
-                    f"{pod_name} {namespace:<{longest_namespace_len}} {bitcoin_timestamp} {log_message}"
-                )
-        except ValueError:
-            # If we can't parse the timestamps, just print the original log entry
-            print(f"{pod_name}: {log_entry}")
+                yield item[0], tanks[i], item[1]
+        return
 
-    return matching_logs
+    queues: list[Queue] = []
+    for tank in tanks:
+        queues.append(Queue(maxsize=buffer_lines))
+        start_reader(tank, queues[-1].put, buffer_lines)
+
+    # Holds the oldest unconsumed entry of every tank log that hasn't ended
+    heap: list[tuple[str, int, Optional[str]]] = []
+    errors: list[tuple[int, Exception]] = []
+
+    def pull(i: int):
+        item = queues[i].get()
+        if isinstance(item, Exception):
+            errors.append((i, item))
+        elif item is not LOG_END:
+            heapq.heappush(heap, (item[0], i, item[1]))
+
+    for i in range(len(tanks)):
+        pull(i)
+    while heap or errors:
+        while errors:
+            i, error = errors.pop()
+            yield None, tanks[i], error
+        if not heap:
+            break
+        timestamp, i, entry = heapq.heappop(heap)
+        if entry is not None:
+            yield timestamp, tanks[i], entry
+        pull(i)
 
 
 @bitcoin.command()
 @click.argument("tank_a", type=str, required=True)
 @click.argument("tank_b", type=str, required=True)
 @click.option("--chain", default="regtest", show_default=True)
-def messages(tank_a: str, tank_b: str, chain: str):
+@click.option(
+    "--decode",
+    type=click.Choice(DECODE_LEVELS),
+    default="summary",
+    show_default=True,
+    help="header: no bodies, summary: summarize large messages like block and inv, full: all fields",
+)
+@click.option(
+    "--follow", "-f", is_flag=True, default=False, help="Keep printing new messages as they arrive"
+)
+@click.option(
+    "--interval",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Seconds between polls for new messages with --follow",
+)
+def messages(tank_a: str, tank_b: str, chain: str, decode: str, follow: bool, interval: float):
     """
     Fetch messages sent between <tank_a pod name> and <tank_b pod name> in [chain]
 
@@ -160,18 +669,30 @@ def messages(tank_a: str, tank_b: str, chain: str):
         namespace_b = get_default_namespace_or(namespace_b)
 
         # Get the messages
-        messages = get_messages(
-            tank_a, tank_b, chain, namespace_a=namespace_a, namespace_b=namespace_b
-        )
-
-        if not messages:
-            print(
-                f"No messages found between {tank_a} ({namespace_a}) and {tank_b} ({namespace_b})"
+        if follow:
+            messages = follow_messages(
+                tank_a,
+                tank_b,
+                chain,
+                namespace_a=namespace_a,
+                namespace_b=namespace_b,
+                level=decode,
+                interval=interval,
+            )
+        else:
+            messages = get_messages(
+                tank_a,
+                tank_b,
+                chain,
+                namespace_a=namespace_a,
+                namespace_b=namespace_b,
+                level=decode,
             )
-            return
 
         # Process and print messages
+        found = False
         for message in messages:
+            found = True
             if not (message.get("time") and isinstance(message["time"], (int, float))):
                 continue
 
@@ -186,163 +707,297 @@ def messages(tank_a: str, tank_b: str, chain: str):
                 continue
 
             body_str = ", ".join(f"{key}: {value}" for key, value in body_dict.items())
-            print(f"{timestamp} {direction} {msgtype} {body_str}")
+            print(f"{timestamp} {direction} {msgtype} {body_str}", flush=follow)
+
+        if not found:
+            print(
+                f"No messages found between {tank_a} ({namespace_a}) and {tank_b} ({namespace_b})"
+            )
 
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"Error fetching messages between nodes {tank_a} and {tank_b}: {e}")
 
 
-def get_messages(tank_a: str, tank_b: str, chain: str, namespace_a: str, namespace_b: str):
+@bitcoin.command()
+@click.argument("output", type=click.Path(file_okay=False, path_type=Path))
+@click.option("--chain", default="regtest", show_default=True)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of tanks to download captures from at a time",
+)
+def export_messages(output: Path, chain: str, jobs: int):
     """
-    Fetch messages from the message capture files
+    Download every tank's message captures to <output> and index them for query-messages
     """
-    subdir = "" if chain == "main" else f"{chain}/"
-    base_dir = f"/root/.bitcoin/{subdir}message_capture"
+    from .capture import build_capture_store
+
+    tanks = get_mission("tank")
+    capture_dir = output / "raw"
+
+    # Outbound connections are made to service IPs, inbound ones come from pod IPs
+    peer_names = {}
+    tank_names = {tank.metadata.name for tank in tanks}
+    for namespace in {tank.metadata.namespace for tank in tanks}:
+        for service in get_services(namespace):
+            if service.metadata.name in tank_names and service.spec.cluster_ip:
+                peer_names[service.spec.cluster_ip] = f"{service.metadata.name}.{namespace}"
+    for tank in tanks:
+        if tank.status.pod_ip:
+            peer_names[tank.status.pod_ip] = f"{tank.metadata.name}.{tank.metadata.namespace}"
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                download_message_capture,
+                tank,
+                chain,
+                capture_dir / f"{tank.metadata.name}.{tank.metadata.namespace}",
+            ): tank
+            for tank in tanks
+        }
+        for future in as_completed(futures):
+            tank = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Could not download captures from {tank.metadata.name}: {e}")
 
-    # Get the IP of node_b
-    cmd = f"kubectl get pod {tank_b} -o jsonpath='{{.status.podIP}}' --namespace {namespace_b}"
-    tank_b_ip = run_command(cmd).strip()
+    rows = build_capture_store(capture_dir, output, peer_names)
+    print(f"Exported {rows} messages from {len(tanks)} tanks to {output}")
 
-    # Get the service IP of node_b
+
+def download_message_capture(tank: V1Pod, chain: str, destination: Path) -> None:
+    """Stream a tank's message_capture directory into `destination` with tar"""
+    subdir = "" if chain == "main" else f"{chain}/"
+    base_dir = f"/root/.bitcoin/{subdir}message_capture"
     cmd = (
-        f"kubectl get service {tank_b} -o jsonpath='{{.spec.clusterIP}}' --namespace {namespace_b}"
+        f"kubectl exec {tank.metadata.name} --namespace {tank.metadata.namespace} "
+        f"--container {BITCOINCORE_CONTAINER} -- tar -C {base_dir} -cf - ."
+    )
+    destination.mkdir(parents=True, exist_ok=True)
+    process = subprocess.Popen(
+        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, executable="bash"
     )
-    tank_b_service_ip = run_command(cmd).strip()
+    with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(destination, filter="data")
+        else:
+            tar.extractall(destination)
+    if process.wait() != 0:
+        raise Exception(process.stderr.read().decode().strip())
+
+
+def parse_time(ctx, param, value) -> Optional[int]:
+    """Parse an ISO 8601 time, UTC unless it says otherwise, to microseconds since the epoch"""
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise click.BadParameter(f"{value} is not an ISO 8601 time") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1_000_000)
+
+
+@bitcoin.command()
+@click.argument("store", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option("--msgtype", multiple=True, help="Only this message type (repeatable)")
+@click.option("--tank", multiple=True, help="Only messages captured by this tank (repeatable)")
+@click.option("--peer", multiple=True, help="Only messages exchanged with this peer (repeatable)")
+@click.option("--since", callback=parse_time, help="Only messages at or after this ISO time")
+@click.option("--until", callback=parse_time, help="Only messages before this ISO time")
+@click.option("--direction", type=click.Choice(["sent", "recv"]), default=None)
+@click.option("--count", is_flag=True, default=False, help="Only print the number of messages")
+def query_messages(
+    store: Path,
+    msgtype: tuple[str],
+    tank: tuple[str],
+    peer: tuple[str],
+    since: Optional[int],
+    until: Optional[int],
+    direction: Optional[str],
+    count: bool,
+):
+    """
+    Query messages exported by export-messages in <store>
+    """
+    from .capture import CaptureStore
+
+    with CaptureStore(store) as capture:
+
+        def names(requested: tuple[str], available: list[str]) -> Optional[set[str]]:
+            # "tank-0001" matches tank-0001 in any namespace
+            if not requested:
+                return None
+            return {n for n in available if n in requested or n.split(".")[0] in requested}
+
+        messages = capture.query(
+            msgtypes=set(msgtype) or None,
+            start=since,
+            end=until,
+            tanks=names(tank, capture.tanks),
+            peers=names(peer, capture.peers),
+            outbound=None if direction is None else direction == "sent",
+        )
+        if count:
+            print(sum(1 for _ in messages))
+            return
+        for message in messages:
+            timestamp = datetime.fromtimestamp(message["time"] / 1e6, timezone.utc)
+            arrow = ">>>" if message["outbound"] else "<<<"
+            print(
+                f"{timestamp:%Y-%m-%d %H:%M:%S.%f} {message['tank']} {arrow} {message['peer']} "
+                f"{message['msgtype']} {message['size']}"
+            )
+
+
+def get_messages(
+    tank_a: str,
+    tank_b: str,
+    chain: str,
+    namespace_a: str,
+    namespace_b: str,
+    level: str = "full",
+) -> Iterator[dict]:
+    """
+    Fetch messages from the message capture files, yielding them in time order
+    Bodies are decoded to `level`, one of DECODE_LEVELS
+    """
+    from .capture import iter_raw_messages
+
+    base_dir = message_capture_dir(chain)
+    tank_b_ip, tank_b_service_ip = get_tank_ips(tank_b, namespace_b)
 
     # List directories in the message capture folder
     cmd = f"kubectl exec {tank_a} --namespace {namespace_a} -- ls {base_dir}"
 
     dirs = run_command(cmd).splitlines()
 
-    messages = []
+    with tempfile.TemporaryDirectory(prefix="warnet-messages-") as tmpdir, ExitStack() as stack:
+        streams = []
+        for dir_name in dirs:
+            if tank_b_ip in dir_name or tank_b_service_ip in dir_name:
+                for file, outbound in [["msgs_recv.dat", False], ["msgs_sent.dat", True]]:
+                    file_path = f"{base_dir}/{dir_name}/{file}"
+                    # Copy the file out of the container and parse it in place from disk
+                    local_path = Path(tmpdir) / f"{dir_name}-{file}"
+                    cmd = f"kubectl exec {tank_a} --namespace {namespace_a} -- cat {file_path}"
+                    with local_path.open("wb") as f:
+                        subprocess.run(
+                            cmd, shell=True, stdout=f, stderr=subprocess.DEVNULL, executable="bash"
+                        )
+                    if local_path.stat().st_size == 0:
+                        continue
+                    f = stack.enter_context(local_path.open("rb"))
+                    data = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                    stream = iter_raw_messages(data, outbound, level=level)
+                    # Generators must release their view of the map before it is closed
+                    stack.callback(stream.close)
+                    streams.append(stream)
+
+        # Each capture file is in time order already
+        yield from heapq.merge(*streams, key=lambda message: message["time"])
+
+
+def message_capture_dir(chain: str) -> str:
+    subdir = "" if chain == "main" else f"{chain}/"
+    return f"/root/.bitcoin/{subdir}message_capture"
 
-    for dir_name in dirs:
-        if tank_b_ip in dir_name or tank_b_service_ip in dir_name:
-            for file, outbound in [["msgs_recv.dat", False], ["msgs_sent.dat", True]]:
-                file_path = f"{base_dir}/{dir_name}/{file}"
-                # Fetch the file contents from the container
-                cmd = f"kubectl exec {tank_a} --namespace {namespace_a} -- cat {file_path}"
-                import subprocess
 
-                blob = subprocess.run(
-                    cmd, shell=True, capture_output=True, executable="bash"
-                ).stdout
+def get_tank_ips(tank: str, namespace: str) -> tuple[str, str]:
+    """
+    The pod IP and service IP of a tank, which name its peer directories in message captures
+    """
+    cmd = f"kubectl get pod {tank} -o jsonpath='{{.status.podIP}}' --namespace {namespace}"
+    pod_ip = run_command(cmd).strip()
+    cmd = f"kubectl get service {tank} -o jsonpath='{{.spec.clusterIP}}' --namespace {namespace}"
+    service_ip = run_command(cmd).strip()
+    return pod_ip, service_ip
+
+
+def follow_messages(
+    tank_a: str,
+    tank_b: str,
+    chain: str,
+    namespace_a: str,
+    namespace_b: str,
+    level: str = "full",
+    interval: float = 1.0,
+) -> Iterator[dict]:
+    """
+    Yield the messages captured between two tanks as they arrive, polling every `interval`
+    seconds. Capture files only grow, so each poll fetches just the bytes past the last
+    complete record read from each file and decodes the new records. Messages are in
+    time order within each poll.
+    """
+    from .capture import iter_raw_messages
 
-                # Parse the blob
-                json = parse_raw_messages(blob, outbound)
-                messages = messages + json
+    base_dir = message_capture_dir(chain)
+    tank_b_ips = [ip for ip in get_tank_ips(tank_b, namespace_b) if ip]
+    outbound_files = {"msgs_recv.dat": False, "msgs_sent.dat": True}
+    # Bytes consumed from each capture file, by "<peer dir>/<file>"
+    offsets: dict[str, int] = {}
 
-    messages.sort(key=lambda x: x["time"])
-    return messages
+    while True:
+        batch = []
+        for path, size in get_capture_sizes(tank_a, namespace_a, base_dir).items():
+            dir_name, file = path.split("/", 1)
+            if file not in outbound_files or not any(ip in dir_name for ip in tank_b_ips):
+                continue
+            start = offsets.get(path, 0)
+            if size < start:
+                # Truncated, e.g. the tank was restarted with a fresh data directory
+                start = 0
+            elif size == start:
+                continue
+            data = read_capture_suffix(tank_a, namespace_a, f"{base_dir}/{path}", start)
+            consumed = 0
+            for message in iter_raw_messages(data, outbound_files[file], level=level, offsets=True):
+                consumed = message.pop("offset") + message["size"]
+                batch.append(message)
+            # A record still being written is fetched again on the next poll
+            offsets[path] = start + consumed
+        batch.sort(key=lambda message: message["time"])
+        yield from batch
+        time.sleep(interval)
+
+
+def get_capture_sizes(tank: str, namespace: str, base_dir: str) -> dict[str, int]:
+    """
+    Sizes of the message capture files of a tank, by "<peer dir>/<file>"
+    """
+    cmd = f"kubectl exec {tank} --namespace {namespace} -- sh -c 'cd {base_dir} && wc -c */*.dat'"
+    result = subprocess.run(
+        cmd, shell=True, capture_output=True, text=True, executable="bash", check=False
+    )
+    sizes = {}
+    for line in result.stdout.splitlines():
+        size, _, path = line.strip().partition(" ")
+        # Skip the "total" line
+        if "/" in path:
+            sizes[path.strip()] = int(size)
+    return sizes
 
 
-# This function is a hacked-up copy of process_file() from
-# Bitcoin Core contrib/message-capture/message-capture-parser.py
-def parse_raw_messages(blob: bytes, outbound: bool):
-    TIME_SIZE = 8
-    LENGTH_SIZE = 4
-    MSGTYPE_SIZE = 12
+def read_capture_suffix(tank: str, namespace: str, file_path: str, start: int) -> bytes:
+    """
+    The bytes of a file in a tank from offset `start` on
+    """
+    cmd = f"kubectl exec {tank} --namespace {namespace} -- tail -c +{start + 1} {file_path}"
+    result = subprocess.run(
+        cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, executable="bash"
+    )
+    return result.stdout
 
-    messages = []
-    offset = 0
-    while True:
-        # Read the Header
-        header_len = TIME_SIZE + LENGTH_SIZE + MSGTYPE_SIZE
-        tmp_header_raw = blob[offset : offset + header_len]
 
-        offset = offset + header_len
-        if not tmp_header_raw:
-            break
-        tmp_header = BytesIO(tmp_header_raw)
-        time = int.from_bytes(tmp_header.read(TIME_SIZE), "little")  # type: int
-        msgtype = tmp_header.read(MSGTYPE_SIZE).split(b"\x00", 1)[0]  # type: bytes
-        length = int.from_bytes(tmp_header.read(LENGTH_SIZE), "little")  # type: int
-
-        # Start converting the message to a dictionary
-        msg_dict = {}
-        msg_dict["outbound"] = outbound
-        msg_dict["time"] = time
-        msg_dict["size"] = length  # "size" is less readable here, but more readable in the output
-
-        msg_ser = BytesIO(blob[offset : offset + length])
-        offset = offset + length
-
-        # Determine message type
-        if msgtype not in MESSAGEMAP:
-            # Unrecognized message type
-            try:
-                msgtype_tmp = msgtype.decode()
-                if not msgtype_tmp.isprintable():
-                    raise UnicodeDecodeError
-                msg_dict["msgtype"] = msgtype_tmp
-            except UnicodeDecodeError:
-                msg_dict["msgtype"] = "UNREADABLE"
-            msg_dict["body"] = msg_ser.read().hex()
-            msg_dict["error"] = "Unrecognized message type."
-            messages.append(msg_dict)
-            # print(f"WARNING - Unrecognized message type {msgtype}", file=sys.stderr)
-            continue
-
-        # Deserialize the message
-        msg = MESSAGEMAP[msgtype]()
-        msg_dict["msgtype"] = msgtype.decode()
+def parse_raw_messages(blob: bytes, outbound: bool):
+    from .capture import iter_raw_messages
 
-        try:
-            msg.deserialize(msg_ser)
-        except KeyboardInterrupt:
-            raise
-        except Exception:
-            # Unable to deserialize message body
-            msg_ser.seek(0, os.SEEK_SET)
-            msg_dict["body"] = msg_ser.read().hex()
-            msg_dict["error"] = "Unable to deserialize message."
-            messages.append(msg_dict)
-            # print("WARNING - Unable to deserialize message", file=sys.stderr)
-            continue
-
-        # Convert body of message into a jsonable object
-        if length:
-            msg_dict["body"] = to_jsonable(msg)
-        messages.append(msg_dict)
-    return messages
-
-
-def to_jsonable(obj: str):
-    HASH_INTS = [
-        "blockhash",
-        "block_hash",
-        "hash",
-        "hashMerkleRoot",
-        "hashPrevBlock",
-        "hashstop",
-        "prev_header",
-        "sha256",
-        "stop_hash",
-    ]
-
-    HASH_INT_VECTORS = [
-        "hashes",
-        "headers",
-        "vHave",
-        "vHash",
-    ]
-
-    if hasattr(obj, "__dict__"):
-        return obj.__dict__
-    elif hasattr(obj, "__slots__"):
-        ret = {}  # type: Any
-        for slot in obj.__slots__:
-            val = getattr(obj, slot, None)
-            if slot in HASH_INTS and isinstance(val, int):
-                ret[slot] = ser_uint256(val).hex()
-            elif slot in HASH_INT_VECTORS and all(isinstance(a, int) for a in val):
-                ret[slot] = [ser_uint256(a).hex() for a in val]
-            else:
-                ret[slot] = to_jsonable(val)
-        return ret
-    elif isinstance(obj, list):
-        return [to_jsonable(a) for a in obj]
-    elif isinstance(obj, bytes):
-        return obj.hex()
-    else:
-        return obj
+    return list(iter_raw_messages(blob, outbound))
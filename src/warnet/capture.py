@@ -0,0 +1,500 @@
+import heapq
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from contextlib import ExitStack
+from io import SEEK_CUR, BytesIO
+from pathlib import Path
+from typing import Callable, Container, Iterable, Iterator, Optional, Union
+
+from test_framework.messages import CTransaction, deser_compact_size, hash256, ser_uint256
+from test_framework.p2p import MESSAGEMAP
+
+from .constants import DECODE_LEVELS
+
+# Message capture record header: time (microseconds), msgtype (NUL padded), payload length
+CAPTURE_HEADER = struct.Struct("<Q12sI")
+
+
+# This function is a hacked-up copy of process_file() from
+# Bitcoin Core contrib/message-capture/message-capture-parser.py
+def iter_raw_messages(
+    data: Union[bytes, memoryview, mmap.mmap],
+    outbound: bool,
+    msgtypes: Optional[Container[str]] = None,
+    decode: Optional[Container[str]] = None,
+    offsets: bool = False,
+    level: str = "full",
+) -> Iterator[dict]:
+    """
+    Lazily parse the records of a message capture file (msgs_recv.dat or msgs_sent.dat).
+    Only records whose msgtype is in `msgtypes` are yielded, and only bodies of msgtypes
+    in `decode` are deserialized; `None` means all of them. Records are read in place
+    from `data`, and a truncated record at the end (a file still being written) is ignored.
+    With `offsets`, each record also has the "offset" of its payload in `data`.
+    `level` is one of DECODE_LEVELS: "header" yields no bodies at all, "summary" replaces
+    the body of msgtypes in SUMMARIZERS with a short summary read from the raw payload,
+    and "full" deserializes every body.
+    """
+    if level not in DECODE_LEVELS:
+        raise ValueError(f"Unknown decode level {level!r}, expected one of {DECODE_LEVELS}")
+    if level == "header":
+        decode = ()
+    with memoryview(data) as view:
+        offset = 0
+        end = len(view)
+        while offset + CAPTURE_HEADER.size <= end:
+            time, msgtype, length = CAPTURE_HEADER.unpack_from(view, offset)
+            body_start = offset + CAPTURE_HEADER.size
+            if body_start + length > end:
+                break
+            offset = body_start + length
+            msgtype = msgtype.split(b"\x00", 1)[0]
+
+            # Start converting the message to a dictionary
+            msg_dict = {}
+            msg_dict["outbound"] = outbound
+            msg_dict["time"] = time
+            # "size" is less readable here, but more readable in the output
+            msg_dict["size"] = length
+            if offsets:
+                msg_dict["offset"] = body_start
+
+            # Determine message type
+            if msgtype not in MESSAGEMAP:
+                # Unrecognized message type
+                msgtype_str = msgtype.decode(errors="replace")
+                msg_dict["msgtype"] = msgtype_str if msgtype_str.isprintable() else "UNREADABLE"
+                if msgtypes is not None and msg_dict["msgtype"] not in msgtypes:
+                    continue
+                if level != "header":
+                    msg_dict["body"] = view[body_start:offset].hex()
+                msg_dict["error"] = "Unrecognized message type."
+                yield msg_dict
+                continue
+
+            msg_dict["msgtype"] = msgtype.decode()
+            if msgtypes is not None and msg_dict["msgtype"] not in msgtypes:
+                continue
+            if decode is not None and msg_dict["msgtype"] not in decode:
+                yield msg_dict
+                continue
+
+            summarize = SUMMARIZERS.get(msg_dict["msgtype"]) if level == "summary" else None
+            if summarize:
+                try:
+                    msg_dict["body"] = summarize(view[body_start:offset])
+                except KeyboardInterrupt:
+                    raise
+                except Exception:
+                    msg_dict["body"] = view[body_start:offset].hex()
+                    msg_dict["error"] = "Unable to summarize message."
+                yield msg_dict
+                continue
+
+            # Deserialize the message
+            msg = MESSAGEMAP[msgtype]()
+            try:
+                msg.deserialize(BytesIO(view[body_start:offset]))
+            except KeyboardInterrupt:
+                raise
+            except Exception:
+                # Unable to deserialize message body
+                msg_dict["body"] = view[body_start:offset].hex()
+                msg_dict["error"] = "Unable to deserialize message."
+                yield msg_dict
+                continue
+
+            # Convert body of message into a jsonable object
+            if length:
+                msg_dict["body"] = to_jsonable(msg)
+            yield msg_dict
+
+
+def _hash(raw: Union[bytes, memoryview]) -> str:
+    # Hashes are displayed in RPC byte order so they can be searched for in logs
+    return bytes(raw[::-1]).hex()
+
+
+def _block_hash(header: Union[bytes, memoryview]) -> str:
+    return hash256(header)[::-1].hex()
+
+
+def summarize_inv(payload: memoryview) -> dict:
+    """inv, getdata and notfound: the number of entries and the first and last hash"""
+    f = BytesIO(payload)
+    count = deser_compact_size(f)
+    start = f.tell()
+    summary = {"count": count}
+    if count:
+        # Each entry is a 4 byte type followed by a 32 byte hash
+        summary["first"] = _hash(payload[start + 4 : start + 36])
+        summary["last"] = _hash(payload[start + 36 * count - 32 : start + 36 * count])
+    return summary
+
+
+def summarize_headers(payload: memoryview) -> dict:
+    """headers: the number of headers and the first and last block hash"""
+    f = BytesIO(payload)
+    count = deser_compact_size(f)
+    start = f.tell()
+    summary = {"count": count}
+    if count:
+        # Each header is 80 bytes followed by a zero transaction count
+        summary["first"] = _block_hash(payload[start : start + 80])
+        last = start + 81 * (count - 1)
+        summary["last"] = _block_hash(payload[last : last + 80])
+    return summary
+
+
+def summarize_block(payload: memoryview) -> dict:
+    """block: the block hash, its parent and the txids of its transactions"""
+    f = BytesIO(payload)
+    f.seek(80)
+    txids = []
+    for _ in range(deser_compact_size(f)):
+        tx = CTransaction()
+        tx.deserialize(f)
+        txids.append(tx.rehash())
+    return {
+        "hash": _block_hash(payload[:80]),
+        "prev": _hash(payload[4:36]),
+        "tx_count": len(txids),
+        "txids": txids,
+    }
+
+
+def summarize_cmpctblock(payload: memoryview) -> dict:
+    """cmpctblock: the block hash and the number of short ids and prefilled transactions"""
+    f = BytesIO(payload)
+    # Header and nonce
+    f.seek(88)
+    shortids = deser_compact_size(f)
+    f.seek(6 * shortids, SEEK_CUR)
+    return {
+        "hash": _block_hash(payload[:80]),
+        "shortids": shortids,
+        "prefilled": deser_compact_size(f),
+    }
+
+
+# Summaries read the raw payload of messages that are expensive to deserialize in full
+SUMMARIZERS: dict[str, Callable[[memoryview], dict]] = {
+    "inv": summarize_inv,
+    "getdata": summarize_inv,
+    "notfound": summarize_inv,
+    "headers": summarize_headers,
+    "block": summarize_block,
+    "cmpctblock": summarize_cmpctblock,
+}
+
+HASH_INTS = {
+    "blockhash",
+    "block_hash",
+    "hash",
+    "hashMerkleRoot",
+    "hashPrevBlock",
+    "hashstop",
+    "prev_header",
+    "sha256",
+    "stop_hash",
+}
+HASH_INT_VECTORS = {
+    "hashes",
+    "headers",
+    "vHave",
+    "vHash",
+}
+_SLOTS: dict[type, tuple[tuple[str, bool, bool], ...]] = {}
+
+
+def _slots(cls: type) -> tuple[tuple[str, bool, bool], ...]:
+    """(name, is hash, is hash vector) for each slot of `cls`, computed once per class"""
+    slots = _SLOTS.get(cls)
+    if slots is None:
+        slots = tuple((slot, slot in HASH_INTS, slot in HASH_INT_VECTORS) for slot in cls.__slots__)
+        _SLOTS[cls] = slots
+    return slots
+
+
+def to_jsonable(obj: str):
+    if hasattr(obj, "__dict__"):
+        return obj.__dict__
+    elif hasattr(obj, "__slots__"):
+        ret = {}  # type: Any
+        for slot, is_hash, is_hash_vector in _slots(type(obj)):
+            val = getattr(obj, slot, None)
+            if is_hash and isinstance(val, int):
+                ret[slot] = ser_uint256(val).hex()
+            elif is_hash_vector and all(isinstance(a, int) for a in val):
+                ret[slot] = [ser_uint256(a).hex() for a in val]
+            else:
+                ret[slot] = to_jsonable(val)
+        return ret
+    elif isinstance(obj, list):
+        return [to_jsonable(a) for a in obj]
+    elif isinstance(obj, bytes):
+        return obj.hex()
+    else:
+        return obj
+
+
+# One array per column, in native byte order, as array typecodes
+COLUMNS = {
+    "time": "Q",  # microseconds since the epoch, as recorded by bitcoind
+    "tank": "I",  # index into meta.json "tanks"
+    "peer": "I",  # index into meta.json "peers"
+    "outbound": "B",
+    "msgtype": "H",  # index into meta.json "msgtypes"
+    "size": "I",
+    "file": "I",  # index into meta.json "files", the raw capture file holding the payload
+    "offset": "Q",  # payload offset in that file
+}
+META_FILE = "meta.json"
+STORE_VERSION = 1
+CAPTURE_FILES = [("msgs_recv.dat", False), ("msgs_sent.dat", True)]
+
+
+class CaptureStoreWriter:
+    """
+    Write message capture records to a directory of column files. Records are added one
+    tank at a time, in time order, and each tank becomes a segment of consecutive rows.
+    """
+
+    def __init__(self, directory: Path, flush_rows: int = 65536):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_rows = flush_rows
+        self.rows = 0
+        self.segments: list[dict] = []
+        self.strings: dict[str, dict[str, int]] = {
+            "tanks": {},
+            "peers": {},
+            "msgtypes": {},
+            "files": {},
+        }
+        self._files = {name: (self.directory / f"{name}.bin").open("wb") for name in COLUMNS}
+        self._buffers = {name: array(code) for name, code in COLUMNS.items()}
+
+    def _intern(self, kind: str, value: str) -> int:
+        return self.strings[kind].setdefault(value, len(self.strings[kind]))
+
+    def add_segment(self, tank: str, records: Iterable[dict]) -> int:
+        """
+        Append one tank's records, which need "time", "peer", "outbound", "msgtype", "size",
+        "file" and "offset". Returns the number of rows written.
+        """
+        tank_index = self._intern("tanks", tank)
+        start = self.rows
+        buffers = self._buffers
+        for record in records:
+            buffers["time"].append(record["time"])
+            buffers["tank"].append(tank_index)
+            buffers["peer"].append(self._intern("peers", record["peer"]))
+            buffers["outbound"].append(record["outbound"])
+            buffers["msgtype"].append(self._intern("msgtypes", record["msgtype"]))
+            buffers["size"].append(record["size"])
+            buffers["file"].append(self._intern("files", record["file"]))
+            buffers["offset"].append(record["offset"])
+            self.rows += 1
+            if len(buffers["time"]) >= self.flush_rows:
+                self._flush()
+        self.segments.append({"tank": tank, "start": start, "end": self.rows})
+        return self.rows - start
+
+    def _flush(self):
+        for name, buffer in self._buffers.items():
+            buffer.tofile(self._files[name])
+            del buffer[:]
+
+    def close(self):
+        self._flush()
+        for f in self._files.values():
+            f.close()
+        meta = {
+            "version": STORE_VERSION,
+            "rows": self.rows,
+            "columns": COLUMNS,
+            "segments": self.segments,
+            **{kind: list(values) for kind, values in self.strings.items()},
+        }
+        with (self.directory / META_FILE).open("w") as f:
+            json.dump(meta, f, indent=2)
+
+    def __enter__(self) -> "CaptureStoreWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_capture_store(
+    capture_dir: Path, store_dir: Path, peer_names: Optional[dict[str, str]] = None
+) -> int:
+    """
+    Build a capture store from downloaded message_capture directories laid out as
+    <capture_dir>/<tank>/<peer address>_<port>/msgs_{recv,sent}.dat. Peer addresses found
+    in `peer_names` are stored under that name (e.g. the tank behind a pod or service IP).
+    Returns the number of records written.
+    """
+    capture_dir = Path(capture_dir)
+    peer_names = peer_names or {}
+    rows = 0
+    with CaptureStoreWriter(store_dir) as writer:
+        for tank_dir in sorted(p for p in capture_dir.iterdir() if p.is_dir()):
+            with ExitStack() as stack:
+                streams = []
+                for peer_dir in sorted(p for p in tank_dir.iterdir() if p.is_dir()):
+                    address = peer_dir.name.rsplit("_", 1)[0]
+                    peer = peer_names.get(address, peer_dir.name)
+                    for file, outbound in CAPTURE_FILES:
+                        path = peer_dir / file
+                        if not path.exists() or path.stat().st_size == 0:
+                            continue
+                        f = stack.enter_context(path.open("rb"))
+                        data = stack.enter_context(
+                            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        )
+                        stream = _with_source(
+                            iter_raw_messages(data, outbound, decode=(), offsets=True),
+                            peer,
+                            str(path.relative_to(capture_dir)),
+                        )
+                        stack.callback(stream.close)
+                        streams.append(stream)
+                # Each capture file is in time order, so the tank's segment is too
+                merged = heapq.merge(*streams, key=lambda record: record["time"])
+                rows += writer.add_segment(tank_dir.name, merged)
+    return rows
+
+
+def _with_source(records: Iterator[dict], peer: str, file: str) -> Iterator[dict]:
+    try:
+        for record in records:
+            record["peer"] = peer
+            record["file"] = file
+            yield record
+    finally:
+        records.close()
+
+
+class CaptureStore:
+    """
+    Read-only view of a capture store written by CaptureStoreWriter. Columns are memory
+    mapped, so opening a store is cheap however many records it holds.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with (self.directory / META_FILE).open() as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported capture store version {self.meta['version']}")
+        self.tanks: list[str] = self.meta["tanks"]
+        self.peers: list[str] = self.meta["peers"]
+        self.msgtypes: list[str] = self.meta["msgtypes"]
+        self.files: list[str] = self.meta["files"]
+        self._stack = ExitStack()
+        self.columns: dict[str, memoryview] = {}
+        for name, code in self.meta["columns"].items():
+            path = self.directory / f"{name}.bin"
+            if path.stat().st_size == 0:
+                self.columns[name] = memoryview(b"").cast(code)
+                continue
+            f = self._stack.enter_context(path.open("rb"))
+            data = self._stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            view = memoryview(data).cast(code)
+            self._stack.callback(view.release)
+            self.columns[name] = view
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self) -> "CaptureStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def query(
+        self,
+        msgtypes: Optional[Container[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        tanks: Optional[Container[str]] = None,
+        peers: Optional[Container[str]] = None,
+        outbound: Optional[bool] = None,
+    ) -> Iterator[dict]:
+        """
+        Yield the records matching every given filter in time order. `start` and `end` are
+        microseconds since the epoch, `end` exclusive.
+        """
+        msgtype_ids = (
+            None if msgtypes is None else {i for i, m in enumerate(self.msgtypes) if m in msgtypes}
+        )
+        peer_ids = None if peers is None else {i for i, p in enumerate(self.peers) if p in peers}
+        segments = [s for s in self.meta["segments"] if tanks is None or s["tank"] in tanks]
+        rows = heapq.merge(
+            *[
+                self._scan(segment, msgtype_ids, peer_ids, start, end, outbound)
+                for segment in segments
+            ],
+            key=lambda row: self.columns["time"][row],
+        )
+        for row in rows:
+            yield self.record(row)
+
+    def count(self, **filters) -> int:
+        return sum(1 for _ in self.query(**filters))
+
+    def record(self, row: int) -> dict:
+        columns = self.columns
+        return {
+            "time": columns["time"][row],
+            "tank": self.tanks[columns["tank"][row]],
+            "peer": self.peers[columns["peer"][row]],
+            "outbound": bool(columns["outbound"][row]),
+            "msgtype": self.msgtypes[columns["msgtype"][row]],
+            "size": columns["size"][row],
+            "file": self.files[columns["file"][row]],
+            "offset": columns["offset"][row],
+        }
+
+    def payload(self, record: dict, capture_dir: Path) -> bytes:
+        """Read a record's raw payload from the capture files the store was built from"""
+        with (Path(capture_dir) / record["file"]).open("rb") as f:
+            f.seek(record["offset"])
+            return f.read(record["size"])
+
+    def _scan(
+        self,
+        segment: dict,
+        msgtype_ids: Optional[set[int]],
+        peer_ids: Optional[set[int]],
+        start: Optional[int],
+        end: Optional[int],
+        outbound: Optional[bool],
+    ) -> Iterator[int]:
+        times = self.columns["time"]
+        first, last = segment["start"], segment["end"]
+        # Segments are sorted by time, so the time range is two binary searches
+        if start is not None:
+            first = bisect_left(times, start, first, last)
+        if end is not None:
+            last = bisect_left(times, end, first, last)
+        msgtype_column = self.columns["msgtype"]
+        peer_column = self.columns["peer"]
+        outbound_column = self.columns["outbound"]
+        for row in range(first, last):
+            if msgtype_ids is not None and msgtype_column[row] not in msgtype_ids:
+                continue
+            if peer_ids is not None and peer_column[row] not in peer_ids:
+                continue
+            if outbound is not None and bool(outbound_column[row]) != outbound:
+                continue
+            yield row
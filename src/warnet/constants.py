@@ -17,6 +17,19 @@ INGRESS_NAMESPACE = "ingress"
 WARGAMES_NAMESPACE_PREFIX = "wargames-"
 KUBE_INTERNAL_NAMESPACES = ["kube-node-lease", "kube-public", "kube-system", "kubernetes-dashboard"]
 HELM_COMMAND = "helm upgrade --install"
+# Release holding every tank when a network is deployed with `warnet deploy --bulk`
+BULK_NETWORK_RELEASE = "warnet-network"
+# Tank pods are annotated with a hash of their chart and values so unchanged nodes can be skipped
+VALUES_HASH_ANNOTATION = "warnet.dev/values-hash"
+# Scenario archives built by `warnet run`, by content hash
+SCENARIO_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))) / "warnet" / "scenarios"
+)
+# ConfigMaps holding a test_framework archive are named by its hash and shared by commanders
+TEST_FRAMEWORK_CONFIG_MAP_PREFIX = "warnet-test-framework-"
+# ...and labelled so `warnet down` can delete them along with the commanders
+TEST_FRAMEWORK_LABELS = {"app.kubernetes.io/name": "warnet-test-framework"}
+TEST_FRAMEWORK_SELECTOR = ",".join(f"{k}={v}" for k, v in TEST_FRAMEWORK_LABELS.items())
 
 TANK_MISSION = "tank"
 COMMANDER_MISSION = "commander"
@@ -45,6 +58,10 @@ NAMESPACES_CHART_LOCATION = CHARTS_DIR.joinpath("namespaces")
 FORK_OBSERVER_CHART = str(files("resources.charts").joinpath("fork-observer"))
 CADDY_CHART = str(files("resources.charts").joinpath("caddy"))
 CADDY_INGRESS_NAME = "caddy-ingress"
+SNAPSHOT_SERVER_CHART = str(CHARTS_DIR.joinpath("snapshot-server"))
+# Release, pod and service serving loadSnapshot tarballs to the tanks in a namespace
+SNAPSHOT_SERVER_RELEASE = "snapshot-server"
+SNAPSHOT_SERVER_DIR = "/srv/snapshots"
 
 DEFAULT_NETWORK = Path("6_node_bitcoin")
 DEFAULT_NAMESPACES = Path("two_namespaces_two_users")
@@ -194,3 +211,6 @@ KUBECTL_BLESSED_NAME_AND_CHECKSUMS = [
         "checksum": "08909b92e62004f4f1222dfd39214085383ea368bdd15c762939469c23484634",
     },
 ]
+
+# How much of a captured P2P message body to decode, see warnet.capture.iter_raw_messages
+DECODE_LEVELS = ("header", "summary", "full")
@@ -1,17 +1,15 @@
-import io
 import json
 import os
 import subprocess
 import sys
 import time
-import zipapp
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
 import click
-import inquirer
-from inquirer.themes import GreenPassion
+import yaml
 from kubernetes.client.models import V1Pod
 from rich import print
 from rich.console import Console
@@ -19,28 +17,48 @@ from rich.prompt import Confirm, Prompt
 from rich.table import Table
 
 from .constants import (
-    BITCOINCORE_CONTAINER,
+    BULK_NETWORK_RELEASE,
     COMMANDER_CHART,
-    COMMANDER_CONTAINER,
     COMMANDER_MISSION,
+    SCENARIO_CACHE_DIR,
     TANK_MISSION,
+    TEST_FRAMEWORK_CONFIG_MAP_PREFIX,
+    TEST_FRAMEWORK_LABELS,
+    TEST_FRAMEWORK_SELECTOR,
 )
 from .k8s import (
+    SNAPSHOT_COMPRESSION,
+    PodInformer,
     can_delete_pods,
+    delete_config_maps_by_selector,
+    delete_helm_releases,
     delete_pod,
+    delete_pods_by_selector,
+    ensure_config_map,
     get_default_namespace,
     get_default_namespace_or,
+    get_helm_releases,
     get_mission,
     get_namespaces,
     get_pod,
     get_pods,
-    pod_log,
     snapshot_bitcoin_datadir,
+    snapshot_bitcoin_datadir_to_store,
     wait_for_init,
+    wait_for_inits,
     wait_for_pod,
     write_file_to_container,
 )
+from .pod_logs import LogSource, merged_pod_logs, primary_container
 from .process import run_command, stream_command
+from .scenario_bundle import (
+    CONFIG_MAP_LIMIT,
+    cached_archive,
+    scenario_module,
+    scenario_sources,
+    test_framework_sources,
+)
+from .snapshot_store import SnapshotStore
 
 console = Console()
 
@@ -125,8 +143,14 @@ def stop_all_scenarios(scenarios):
     default=False,
     help="Skip confirmations",
 )
+@click.option(
+    "--fast",
+    is_flag=True,
+    default=False,
+    help="Delete tanks and commanders through the Kubernetes API instead of helm and kubectl",
+)
 @click.command()
-def down(force):
+def down(force, fast):
     """Bring down a running warnet quickly"""
 
     def uninstall_release(namespace, release_name):
@@ -139,6 +163,10 @@ def down(force):
         subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return f"Initiated deletion of pod: {pod_name} in namespace {namespace}"
 
+    def delete_test_framework_layers(namespace):
+        deleted = delete_config_maps_by_selector(TEST_FRAMEWORK_SELECTOR, namespace)
+        return f"Deleted {deleted} test_framework layers in namespace {namespace}"
+
     if not can_delete_pods():
         click.secho("You do not have permission to bring down the network.", fg="red")
         return
@@ -147,6 +175,10 @@ def down(force):
     release_list: list[dict[str, str]] = []
     for v1namespace in namespaces:
         namespace = v1namespace.metadata.name
+        if fast:
+            for release in get_helm_releases(namespace):
+                release_list.append({"namespace": namespace, "name": release})
+            continue
         command = f"helm list --namespace {namespace} -o json"
         result = run_command(command)
         if result:
@@ -155,6 +187,8 @@ def down(force):
                 release_list.append({"namespace": namespace, "name": release["name"]})
 
     if not force:
+        import inquirer
+
         affected_namespaces = set([entry["namespace"] for entry in release_list])
         namespace_listing = "\n  ".join(affected_namespaces)
         confirmed = "confirmed"
@@ -182,6 +216,9 @@ def down(force):
             click.secho("Operation cancelled by user", fg="yellow")
             sys.exit(0)
 
+    if fast and fast_down([ns.metadata.name for ns in namespaces], release_list):
+        return
+
     with ThreadPoolExecutor(max_workers=10) as executor:
         futures = []
 
@@ -196,6 +233,10 @@ def down(force):
         for pod in pods:
             futures.append(executor.submit(delete_pod, pod.metadata.name, pod.metadata.namespace))
 
+        # The test_framework layers commanders shared, which belong to no release
+        for v1namespace in namespaces:
+            futures.append(executor.submit(delete_test_framework_layers, v1namespace.metadata.name))
+
         # Wait for all tasks to complete and print results
         for future in as_completed(futures):
             console.print(f"[yellow]{future.result()}[/yellow]")
@@ -205,6 +246,85 @@ def down(force):
     console.print("[bold green]Warnet teardown process completed.[/bold green]")
 
 
+def fast_down(
+    namespaces: list[str],
+    release_list: list[dict[str, str]],
+    timeout: int = 300,
+    sync_timeout: int = 30,
+) -> bool:
+    """
+    Tear down tanks and commanders with a handful of API calls per namespace: one collection
+    delete for their pods and batched deletes for their configmaps, services and release
+    secrets, and the test_framework layers of their commanders. Any other Helm releases are
+    uninstalled with helm as usual.
+
+    Returns False, having deleted nothing, if the pods couldn't be listed within
+    `sync_timeout` seconds: without them, tank releases can't be told from others.
+    """
+    informer = PodInformer(label_selector="mission").start()
+    try:
+        if not informer.wait_for(lambda informer: True, timeout=sync_timeout):
+            console.print(f"[bold red]Couldn't list pods within {sync_timeout}s[/bold red]")
+            console.print("[yellow]Falling back to helm uninstall[/yellow]")
+            return False
+        for namespace in namespaces:
+            pods = informer.pods(namespace=namespace)
+            instances = {
+                (pod.metadata.labels or {}).get("app.kubernetes.io/instance", pod.metadata.name)
+                for pod in pods
+            }
+            releases = [r["name"] for r in release_list if r["namespace"] == namespace]
+            warnet_releases = [r for r in releases if r in instances or r == BULK_NETWORK_RELEASE]
+            for release in releases:
+                if release not in warnet_releases:
+                    cmd = f"helm uninstall {release} --namespace {namespace} --wait=false"
+                    subprocess.Popen(
+                        cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                    )
+                    console.print(
+                        f"[yellow]Initiated uninstall for: {release} in namespace {namespace}[/yellow]"
+                    )
+            if pods:
+                delete_pods_by_selector("mission", namespace=namespace)
+                console.print(
+                    f"[yellow]Deleting {len(pods)} pods in namespace {namespace}[/yellow]"
+                )
+            if instances or warnet_releases:
+                delete_helm_releases(warnet_releases, list(instances), namespace=namespace)
+                console.print(
+                    f"[yellow]Deleted {len(warnet_releases)} releases in namespace {namespace}[/yellow]"
+                )
+            layers = delete_config_maps_by_selector(TEST_FRAMEWORK_SELECTOR, namespace)
+            if layers:
+                console.print(
+                    f"[yellow]Deleted {layers} test_framework layers in namespace {namespace}[/yellow]"
+                )
+
+        remaining = None
+        last_report = 0.0
+
+        def report(informer: PodInformer) -> bool:
+            # Called on every watch event, so print at most once a second
+            nonlocal remaining, last_report
+            count = len(informer.pods())
+            if count != remaining and (count == 0 or time.monotonic() - last_report >= 1):
+                remaining = count
+                last_report = time.monotonic()
+                console.print(f"[yellow]Pods remaining: {count}[/yellow]")
+            return count == 0
+
+        if not informer.wait_for(report, timeout=timeout):
+            remaining = len(informer.pods())
+            console.print(
+                f"[bold red]{remaining} pods still terminating after {timeout}s[/bold red]"
+            )
+            return True
+    finally:
+        informer.stop()
+    console.print("[bold green]Warnet teardown process completed.[/bold green]")
+    return True
+
+
 def get_active_network(namespace):
     """Get the name of the active network (Helm release) in the given namespace"""
     cmd = f"helm list --namespace {namespace} --output json"
@@ -219,6 +339,80 @@ def get_active_network(namespace):
     return None
 
 
+def get_warnet_data() -> bytes:
+    """
+    Tank data for the warnet.json every commander is given. Scenarios may drive tanks in
+    any namespace, so this lists the tanks of all of them.
+    """
+    tanks = [
+        {
+            "tank": tank.metadata.name,
+            "chain": tank.metadata.labels["chain"],
+            "rpc_host": tank.status.pod_ip,
+            "rpc_port": int(tank.metadata.labels["RPCPort"]),
+            "rpc_user": "user",
+            "rpc_password": tank.metadata.labels["rpcpassword"],
+            "init_peers": [],
+        }
+        for tank in get_mission(TANK_MISSION)
+    ]
+    return json.dumps(tanks).encode()
+
+
+def bundle_scenario(
+    scenario_path: Path, scenario_dir: Path, namespace: str, verbose: bool = False
+) -> tuple[bytes, Optional[str]]:
+    """
+    The archive of a scenario and the name of the test_framework ConfigMap it runs with,
+    if any. Archives are cached by content, and test_framework is shipped separately as a
+    ConfigMap that every commander in the namespace shares.
+    """
+    module_name = scenario_module(scenario_path, scenario_dir)
+    sources = scenario_sources(scenario_path, scenario_dir)
+    if verbose:
+        for path in sources:
+            print(f"Including: {path}")
+    test_framework = test_framework_sources(scenario_dir)
+    layer = None
+    if test_framework:
+        layer_digest, layer_data = cached_archive(test_framework, scenario_dir, SCENARIO_CACHE_DIR)
+        if len(layer_data) <= CONFIG_MAP_LIMIT:
+            layer = f"{TEST_FRAMEWORK_CONFIG_MAP_PREFIX}{layer_digest[:16]}"
+        else:
+            sources += test_framework
+    _, archive_data = cached_archive(
+        sources, scenario_dir, SCENARIO_CACHE_DIR, main=f"{module_name}:main"
+    )
+    if layer and ensure_config_map(
+        layer,
+        {"test_framework.zip": layer_data},
+        namespace=namespace,
+        labels=TEST_FRAMEWORK_LABELS,
+    ):
+        print(f"Created test_framework layer: {layer}")
+    return archive_data, layer
+
+
+def commander_helm_command(
+    name: str, namespace: str, layer: Optional[str], additional_args: tuple[str, ...]
+) -> list[str]:
+    helm_command = [
+        "helm",
+        "upgrade",
+        "--install",
+        "--namespace",
+        namespace,
+        "--set",
+        f"fullnameOverride={name}",
+    ]
+    if layer:
+        helm_command.extend(["--set", f"testFramework.configMap={layer}"])
+    if additional_args:
+        helm_command.extend(["--set", f"args={' '.join(additional_args)}"])
+    helm_command.extend([name, COMMANDER_CHART])
+    return helm_command
+
+
 @click.command(context_settings={"ignore_unknown_options": True})
 @click.argument("scenario_file", type=click.Path(exists=True, file_okay=True, dir_okay=False))
 @click.option(
@@ -252,81 +446,13 @@ def run(
     if additional_args and ("--help" in additional_args or "-h" in additional_args):
         return subprocess.run([sys.executable, scenario_path, "--help"])
 
-    # Collect tank data for warnet.json
     name = f"commander-{scenario_name.replace('_', '')}-{int(time.time())}"
-    tankpods = get_mission("tank")
-    tanks = [
-        {
-            "tank": tank.metadata.name,
-            "chain": tank.metadata.labels["chain"],
-            "rpc_host": tank.status.pod_ip,
-            "rpc_port": int(tank.metadata.labels["RPCPort"]),
-            "rpc_user": "user",
-            "rpc_password": tank.metadata.labels["rpcpassword"],
-            "init_peers": [],
-        }
-        for tank in tankpods
-    ]
-
-    # Encode tank data for warnet.json
-    warnet_data = json.dumps(tanks).encode()
-
-    # Create in-memory buffer to store python archive instead of writing to disk
-    archive_buffer = io.BytesIO()
-
-    # No need to copy the entire scenarios/ directory into the archive
-    def filter(path):
-        if any(needle in str(path) for needle in [".pyc", ".csv", ".DS_Store"]):
-            return False
-        if any(
-            needle in str(path)
-            for needle in ["__init__.py", "commander.py", "test_framework", scenario_path.name]
-        ):
-            print(f"Including: {path}")
-            return True
-        return False
-
-    # In case the scenario file is not in the root of the archive directory,
-    # we need to specify its relative path as a submodule
-    # First get the path of the file relative to the source directory
-    relative_path = scenario_path.relative_to(scenario_dir)
-    # Remove the '.py' extension
-    relative_name = relative_path.with_suffix("")
-    # Replace path separators with dots and pray the user included __init__.py
-    module_name = ".".join(relative_name.parts)
-    # Compile python archive
-    zipapp.create_archive(
-        source=scenario_dir,
-        target=archive_buffer,
-        main=f"{module_name}:main",
-        compressed=True,
-        filter=filter,
-    )
-
-    # Encode the binary data as Base64
-    archive_buffer.seek(0)
-    archive_data = archive_buffer.read()
+    warnet_data = get_warnet_data()
+    archive_data, layer = bundle_scenario(scenario_path, scenario_dir, namespace, verbose=True)
 
     # Start the commander pod with python and init containers
     try:
-        # Construct Helm command
-        helm_command = [
-            "helm",
-            "upgrade",
-            "--install",
-            "--namespace",
-            namespace,
-            "--set",
-            f"fullnameOverride={name}",
-        ]
-
-        # Add additional arguments
-        if additional_args:
-            helm_command.extend(["--set", f"args={' '.join(additional_args)}"])
-
-        helm_command.extend([name, COMMANDER_CHART])
-
-        # Execute Helm command
+        helm_command = commander_helm_command(name, namespace, layer, additional_args)
         result = subprocess.run(helm_command, check=True, capture_output=True, text=True)
 
         if result.returncode == 0:
@@ -358,12 +484,155 @@ def run(
 
 
 @click.command()
-@click.argument("pod_name", type=str, default="")
+@click.argument("batch_file", type=click.Path(exists=True, file_okay=True, dir_okay=False))
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Number of commanders to install and upload to at once",
+)
+@click.option("--namespace", default=None, show_default=True)
+def run_batch(batch_file: str, jobs: int, namespace: Optional[str]):
+    """
+    Run many scenarios at once, as listed in a YAML <batch_file>
+
+    \b
+    For example:
+    scenarios:
+      - file: scenarios/miner_std.py
+        args: ["--allnodes", "--interval=10"]
+      - file: scenarios/tx_flood.py
+        source_dir: scenarios
+        count: 5
+
+    Paths are relative to the batch file. Tank data and each scenario's archive are built
+    once, and commanders are started concurrently.
+    """
+    namespace = get_default_namespace_or(namespace)
+    batch_path = Path(batch_file).resolve()
+    with open(batch_path) as f:
+        entries = (yaml.safe_load(f) or {}).get("scenarios") or []
+    if not entries:
+        print(f"No scenarios in {batch_file}")
+        return
+    if not isinstance(entries, list):
+        raise click.UsageError(f"scenarios in {batch_file} must be a list")
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get("file"), str):
+            raise click.UsageError(f"Scenario {index} in {batch_file} has no file")
+        if not isinstance(entry.get("args") or [], list):
+            raise click.UsageError(f"The args of scenario {index} in {batch_file} aren't a list")
+        if not isinstance(entry.get("count", 1), int) or entry.get("count", 1) < 1:
+            raise click.UsageError(f"The count of scenario {index} in {batch_file} isn't positive")
+
+    warnet_data = get_warnet_data()
+    archives = {}
+    commanders = []
+    timestamp = int(time.time())
+    for entry in entries:
+        scenario_path = (batch_path.parent / entry["file"]).resolve()
+        source_dir = entry.get("source_dir")
+        scenario_dir = (
+            (batch_path.parent / source_dir).resolve() if source_dir else scenario_path.parent
+        )
+        key = (scenario_path, scenario_dir)
+        if key not in archives:
+            archives[key] = bundle_scenario(scenario_path, scenario_dir, namespace)
+        archive_data, layer = archives[key]
+        args = tuple(str(arg) for arg in entry.get("args") or [])
+        for _ in range(int(entry.get("count", 1))):
+            name = f"commander-{scenario_path.stem.replace('_', '')}-{timestamp}-{len(commanders)}"
+            commanders.append(
+                (name, archive_data, commander_helm_command(name, namespace, layer, args))
+            )
+
+    def install(name: str, helm_command: list[str]) -> tuple[str, subprocess.CompletedProcess]:
+        return name, subprocess.run(helm_command, capture_output=True, text=True)
+
+    def upload(name: str, archive_data: bytes) -> tuple[str, bool]:
+        return name, bool(
+            write_file_to_container(name, "init", "/shared/warnet.json", warnet_data, namespace)
+            and write_file_to_container(
+                name, "init", "/shared/archive.pyz", archive_data, namespace
+            )
+        )
+
+    print(f"Starting {len(commanders)} scenario commanders with {jobs} concurrent jobs")
+    installed = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(install, name, cmd) for name, _, cmd in commanders]
+        for future in as_completed(futures):
+            name, result = future.result()
+            if result.returncode == 0:
+                installed.append(name)
+            else:
+                print(f"Failed to deploy scenario commander {name}: {result.stderr.strip()}")
+
+        # Upload to each commander as soon as its init container is up
+        archive_by_name = {name: archive_data for name, archive_data, _ in commanders}
+        futures = [
+            executor.submit(upload, name, archive_by_name[name])
+            for name in wait_for_inits(
+                installed, namespace, label_selector=f"mission={COMMANDER_MISSION}"
+            )
+        ]
+        started = sorted(name for name, ok in (f.result() for f in futures) if ok)
+
+    for name in started:
+        print(f"Commander pod name: {name}")
+    if len(started) == len(commanders):
+        print(f"Successfully started {len(started)} scenarios")
+    else:
+        print(f"Started {len(started)} of {len(commanders)} scenarios, these failed:")
+        for name in sorted({name for name, _, _ in commanders} - set(started)):
+            print(f"  {name}")
+
+
+@click.command()
+@click.argument("pod_names", type=str, nargs=-1)
+@click.option(
+    "--selector",
+    "-l",
+    type=str,
+    help="Show the logs of every pod matching this label selector, e.g. mission=tank",
+)
 @click.option("--follow", "-f", is_flag=True, default=False, help="Follow logs")
 @click.option("--namespace", type=str, default="default", show_default=True)
-def logs(pod_name: str, follow: bool, namespace: str):
-    """Show the logs of a pod"""
-    return _logs(pod_name, follow, namespace)
+@click.option(
+    "--max-streams",
+    type=click.IntRange(min=1),
+    default=32,
+    show_default=True,
+    help="Number of log streams to have open at a time",
+)
+def logs(
+    pod_names: tuple[str], selector: Optional[str], follow: bool, namespace: str, max_streams: int
+):
+    """
+    Show the logs of a pod
+
+    With several <pod_names> or a --selector, the logs of all those pods are read
+    concurrently and merged in timestamp order, each line prefixed by its pod name. With
+    more pods than --max-streams, their logs are first saved to temporary files, so nothing
+    is printed until every log has been read.
+    """
+    if not pod_names and not selector:
+        return _logs("", follow, namespace)
+
+    try:
+        if selector:
+            pods = get_pods(label_selector=selector, namespace=namespace)
+        else:
+            pods = [get_pod(name, namespace=namespace) for name in pod_names]
+    except Exception as e:
+        print(f"Error getting pods: {e}")
+        return
+    if not pods:
+        print(f"No pods match {selector} in namespace ({namespace})")
+        return
+    _print_pod_logs(pods, follow, max_streams)
 
 
 def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
@@ -389,6 +658,9 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
             print(f"Could not fetch any pods in namespace ({namespace})")
             return
 
+        import inquirer
+        from inquirer.themes import GreenPassion
+
         q = [
             inquirer.List(
                 name="pod",
@@ -404,31 +676,44 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
 
     try:
         pod = get_pod(pod_name, namespace=namespace)
-        eligible_container_names = [BITCOINCORE_CONTAINER, COMMANDER_CONTAINER]
-        available_container_names = [container.name for container in pod.spec.containers]
-        container_name = next(
-            (
-                container_name
-                for container_name in available_container_names
-                if container_name in eligible_container_names
-            ),
-            None,
-        )
-        if not container_name:
-            print("Could not determine primary container.")
-            return
     except Exception as e:
         print(f"Error getting pods. Could not determine primary container: {e}")
         return
+    _print_pod_logs([pod], follow)
 
-    try:
-        stream = pod_log(
-            pod_name, container_name=container_name, namespace=namespace, follow=follow
+
+def _print_pod_logs(pods: list[V1Pod], follow: bool, max_streams: int = 32):
+    """
+    Print the logs of the primary container of `pods` in timestamp order, a batch of lines
+    at a time. Lines are prefixed by their pod's name when there are several pods.
+    """
+    sources = []
+    for pod in pods:
+        container_name = primary_container(pod)
+        if container_name:
+            sources.append(LogSource(pod.metadata.name, pod.metadata.namespace, container_name))
+        else:
+            print(f"Could not determine primary container of {pod.metadata.name}.")
+    if not sources:
+        return
+    if follow and len(sources) > max_streams:
+        raise click.UsageError(
+            f"Following {len(sources)} pods needs --max-streams {len(sources)} or more"
         )
-        for line in stream:
-            click.echo(line.decode("utf-8").rstrip())
-    except Exception as e:
-        print(e)
+
+    width = max(len(source.pod) for source in sources)
+    try:
+        for item in merged_pod_logs(sources, follow=follow, max_streams=max_streams):
+            if not isinstance(item, list):
+                i, error = item
+                print(f"{sources[i].pod}: {error}")
+            elif len(sources) == 1:
+                click.echo("".join(f"{line.text}\n" for line in item), nl=False)
+            else:
+                click.echo(
+                    "".join(f"{sources[line.source].pod:<{width}} {line.text}\n" for line in item),
+                    nl=False,
+                )
     except KeyboardInterrupt:
         print("Interrupted streaming log!")
 
@@ -449,7 +734,28 @@ def _logs(pod_name: str, follow: bool, namespace: Optional[str] = None):
     type=str,
     help="Comma-separated list of directories and/or files to include in the snapshot",
 )
-def snapshot(tank_name, snapshot_all, output, filter):
+@click.option(
+    "--compression",
+    type=click.Choice(list(SNAPSHOT_COMPRESSION)),
+    default="gzip",
+    show_default=True,
+    help="Compression of the snapshot files, done locally",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Number of tanks to snapshot at a time with --all",
+)
+@click.option(
+    "--store",
+    is_flag=True,
+    help="Add the snapshot to a deduplicated snapshot store in the output directory",
+)
+@click.option("--name", type=str, help="Snapshot name in the store, defaults to the UTC time")
+def snapshot(tank_name, snapshot_all, output, filter, compression, jobs, store, name):
     """Create a snapshot of a tank's Bitcoin data or snapshot all tanks"""
     tanks = get_mission("tank")
 
@@ -461,12 +767,25 @@ def snapshot(tank_name, snapshot_all, output, filter):
     os.makedirs(output, exist_ok=True)
 
     filter_list = [f.strip() for f in filter.split(",")] if filter else None
+    snapshot_store = SnapshotStore(Path(output)) if store else None
+    name = name or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     if snapshot_all:
-        snapshot_all_tanks(tanks, output, filter_list)
+        snapshot_all_tanks(
+            tanks, output, filter_list, compression, jobs, store=snapshot_store, name=name
+        )
     elif tank_name:
-        snapshot_single_tank(tank_name, tanks, output, filter_list)
+        snapshot_single_tank(
+            tank_name, tanks, output, filter_list, compression, store=snapshot_store, name=name
+        )
     else:
-        select_and_snapshot_tank(tanks, output, filter_list)
+        select_and_snapshot_tank(
+            tanks, output, filter_list, compression, store=snapshot_store, name=name
+        )
+    if snapshot_store:
+        console.print(
+            f"Snapshot {name}: stored {snapshot_store.new_chunks} new chunks "
+            f"({snapshot_store.new_bytes / 1e6:.1f} MB) in {output}"
+        )
 
 
 def find_tank_by_name(tanks, tank_name):
@@ -476,25 +795,66 @@ def find_tank_by_name(tanks, tank_name):
     return None
 
 
-def snapshot_all_tanks(tanks, output_dir, filter_list):
-    with console.status("[bold yellow]Snapshotting all tanks...[/bold yellow]"):
-        for tank in tanks:
-            tank_name = tank.metadata.name
-            chain = tank.metadata.labels["chain"]
-            snapshot_tank(tank_name, chain, output_dir, filter_list)
-    console.print("[bold green]All tank snapshots completed.[/bold green]")
+def snapshot_all_tanks(
+    tanks, output_dir, filter_list, compression="gzip", jobs=4, store=None, name=None
+):
+    done = 0
+    failed = 0
+    with (
+        console.status("[bold yellow]Snapshotting all tanks...[/bold yellow]") as status,
+        ThreadPoolExecutor(max_workers=jobs) as executor,
+    ):
+        futures = [
+            executor.submit(
+                snapshot_tank,
+                tank.metadata.name,
+                tank.metadata.labels["chain"],
+                output_dir,
+                filter_list,
+                compression,
+                tank.metadata.namespace,
+                store,
+                name,
+            )
+            for tank in tanks
+        ]
+        for future in as_completed(futures):
+            done += 1
+            failed += not future.result()
+            status.update(
+                f"[bold yellow]Snapshotting all tanks... {done}/{len(tanks)}[/bold yellow]"
+            )
+    if failed:
+        console.print(f"[bold red]{failed} of {len(tanks)} tank snapshots failed.[/bold red]")
+    else:
+        console.print("[bold green]All tank snapshots completed.[/bold green]")
 
 
-def snapshot_single_tank(tank_name, tanks, output_dir, filter_list):
+def snapshot_single_tank(
+    tank_name, tanks, output_dir, filter_list, compression="gzip", store=None, name=None
+):
     tank = find_tank_by_name(tanks, tank_name)
     if tank:
         chain = tank.metadata.labels["chain"]
-        snapshot_tank(tank_name, chain, output_dir, filter_list)
+        path = snapshot_tank(
+            tank_name,
+            chain,
+            output_dir,
+            filter_list,
+            compression,
+            tank.metadata.namespace,
+            store,
+            name,
+        )
+        if not store:
+            print_untar_hint(path, chain)
     else:
         console.print(f"[bold red]No active tank found with name: {tank_name}[/bold red]")
 
 
-def select_and_snapshot_tank(tanks, output_dir, filter_list):
+def select_and_snapshot_tank(
+    tanks, output_dir, filter_list, compression="gzip", store=None, name=None
+):
     table = Table(title="Active Tanks", show_header=True, header_style="bold magenta")
     table.add_column("Number", style="cyan", justify="right")
     table.add_column("Tank Name", style="green")
@@ -518,17 +878,92 @@ def select_and_snapshot_tank(tanks, output_dir, filter_list):
     selected_tank = tanks[int(choice) - 1]
     tank_name = selected_tank.metadata.name
     chain = selected_tank.metadata.labels["chain"]
-    snapshot_tank(tank_name, chain, output_dir, filter_list)
-
-
-def snapshot_tank(tank_name, chain, output_dir, filter_list):
+    path = snapshot_tank(
+        tank_name,
+        chain,
+        output_dir,
+        filter_list,
+        compression,
+        selected_tank.metadata.namespace,
+        store,
+        name,
+    )
+    if not store:
+        print_untar_hint(path, chain)
+
+
+def snapshot_tank(
+    tank_name,
+    chain,
+    output_dir,
+    filter_list,
+    compression="gzip",
+    namespace=None,
+    store: Optional[SnapshotStore] = None,
+    name: Optional[str] = None,
+) -> Optional[Path]:
+    """
+    Snapshot a tank to a tarball in `output_dir`, or into `store` as snapshot `name`.
+    Returns the tarball or manifest path, or None if the snapshot failed or was empty.
+    """
     try:
-        output_path = Path(output_dir).resolve()
-        snapshot_bitcoin_datadir(tank_name, chain, str(output_path), filter_list)
-        console.print(
-            f"[bold green]Successfully created snapshot for tank: {tank_name}[/bold green]"
-        )
+        if store:
+            manifest = snapshot_bitcoin_datadir_to_store(
+                tank_name, chain, store, name, filter_list, namespace
+            )
+            path = store.manifest_path(name, tank_name) if manifest else None
+        else:
+            output_path = Path(output_dir).resolve()
+            path = snapshot_bitcoin_datadir(
+                tank_name, chain, str(output_path), filter_list, namespace, compression
+            )
+        if path:
+            console.print(
+                f"[bold green]Successfully created snapshot for tank: {tank_name}[/bold green]"
+            )
+        return path
     except Exception as e:
         console.print(
             f"[bold red]Failed to create snapshot for tank {tank_name}: {str(e)}[/bold red]"
         )
+        return None
+
+
+@click.command()
+@click.argument("store", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.argument("tank_name")
+@click.argument("destination", type=click.Path(path_type=Path))
+@click.option("--name", type=str, help="Snapshot to restore, defaults to the latest of the tank")
+@click.option(
+    "--tar",
+    "as_tar",
+    is_flag=True,
+    help="Write a .tar.gz for loadSnapshot to <destination> instead of a datadir",
+)
+def restore_snapshot(store: Path, tank_name: str, destination: Path, name: str, as_tar: bool):
+    """Rebuild <tank_name>'s datadir from a snapshot store (see snapshot --store)"""
+    snapshot_store = SnapshotStore(store)
+    try:
+        manifest = snapshot_store.read_manifest(tank_name, name)
+    except FileNotFoundError as e:
+        console.print(f"[bold red]{e}[/bold red]")
+        sys.exit(1)
+    if as_tar:
+        with open(destination, "wb") as f:
+            snapshot_store.write_tar(manifest, f)
+    else:
+        try:
+            snapshot_store.restore(manifest, destination)
+        except ValueError as e:
+            console.print(f"[bold red]{e}[/bold red]")
+            sys.exit(1)
+    console.print(
+        f"[bold green]Restored {len(manifest['files'])} files of {tank_name} from snapshot "
+        f"{manifest['name']} to {destination}[/bold green]"
+    )
+
+
+def print_untar_hint(path: Optional[Path], chain: str):
+    if path:
+        console.print("To untar and repopulate the directory, use the following command:")
+        console.print(f"tar -xf {path} -C /path/to/destination/.bitcoin/{chain}")
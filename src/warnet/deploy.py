@@ -1,6 +1,12 @@
+import hashlib
+import json
+import shlex
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
@@ -9,6 +15,7 @@ import yaml
 
 from .constants import (
     BITCOIN_CHART_LOCATION,
+    BULK_NETWORK_RELEASE,
     CADDY_CHART,
     DEFAULTS_FILE,
     DEFAULTS_NAMESPACE_FILE,
@@ -20,17 +27,25 @@ from .constants import (
     NAMESPACES_CHART_LOCATION,
     NAMESPACES_FILE,
     NETWORK_FILE,
+    SNAPSHOT_SERVER_CHART,
+    SNAPSHOT_SERVER_DIR,
+    SNAPSHOT_SERVER_RELEASE,
+    TANK_MISSION,
+    VALUES_HASH_ANNOTATION,
     WARGAMES_NAMESPACE_PREFIX,
 )
 from .k8s import (
+    exec_in_pod,
     get_default_namespace,
     get_default_namespace_or,
     get_mission,
     get_namespaces_by_type,
+    pod_is_ready,
     wait_for_ingress_controller,
     wait_for_pod_ready,
 )
 from .process import stream_command
+from .snapshot_store import SnapshotStore
 
 HINT = "\nAre you trying to run a scenario? See `warnet run --help`"
 
@@ -55,33 +70,49 @@ def validate_directory(ctx, param, value):
 @click.option("--debug", is_flag=True)
 @click.option("--namespace", type=str, help="Specify a namespace in which to deploy the network")
 @click.option("--to-all-users", is_flag=True, help="Deploy network to all user namespaces")
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of tank Helm releases to install concurrently",
+)
+@click.option("--bulk", is_flag=True, help="Deploy all tanks as a single Helm release")
+@click.option("--force", is_flag=True, help="Redeploy tanks even if their values are unchanged")
 @click.argument("unknown_args", nargs=-1)
-def deploy(directory, debug, namespace, to_all_users, unknown_args):
+def deploy(directory, debug, namespace, to_all_users, jobs, bulk, force, unknown_args):
     """Deploy a warnet with topology loaded from <directory>"""
     if unknown_args:
         raise click.BadParameter(f"Unknown args: {unknown_args}{HINT}")
+    if bulk and (jobs > 1 or force):
+        # A bulk network is one release, always upgraded as a whole
+        raise click.UsageError("--jobs and --force don't apply to --bulk")
 
     if to_all_users:
         namespaces = get_namespaces_by_type(WARGAMES_NAMESPACE_PREFIX)
         for namespace in namespaces:
-            _deploy(directory, debug, namespace.metadata.name, False)
+            _deploy(directory, debug, namespace.metadata.name, False, jobs, bulk, force)
     else:
-        _deploy(directory, debug, namespace, to_all_users)
+        _deploy(directory, debug, namespace, to_all_users, jobs, bulk, force)
 
 
-def _deploy(directory, debug, namespace, to_all_users):
+def _deploy(directory, debug, namespace, to_all_users, jobs=1, bulk=False, force=False):
     """Deploy a warnet with topology loaded from <directory>"""
     directory = Path(directory)
 
     if to_all_users:
         namespaces = get_namespaces_by_type(WARGAMES_NAMESPACE_PREFIX)
         for namespace in namespaces:
-            deploy(directory, debug, namespace.metadata.name, False)
+            deploy(directory, debug, namespace.metadata.name, False, jobs, bulk, force)
         return
 
     if (directory / NETWORK_FILE).exists():
         dl = deploy_logging_stack(directory, debug)
-        deploy_network(directory, debug, namespace=namespace)
+        if bulk:
+            deploy_network_bulk(directory, debug, namespace=namespace)
+        else:
+            deploy_network(directory, debug, namespace=namespace, jobs=jobs, force=force)
         df = deploy_fork_observer(directory, debug)
         if dl | df:
             deploy_ingress(debug)
@@ -229,7 +260,13 @@ rpc_password = "tabconf2024"
     return True
 
 
-def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str] = None):
+def deploy_network(
+    directory: Path,
+    debug: bool = False,
+    namespace: Optional[str] = None,
+    jobs: int = 1,
+    force: bool = False,
+) -> bool:
     network_file_path = directory / NETWORK_FILE
     defaults_file_path = directory / DEFAULTS_FILE
 
@@ -237,35 +274,346 @@ def deploy_network(directory: Path, debug: bool = False, namespace: Optional[str
 
     with network_file_path.open() as f:
         network_file = yaml.safe_load(f)
+    with defaults_file_path.open() as f:
+        defaults = merge_values(load_chart_values(), yaml.safe_load(f) or {})
+    chart_digest = get_chart_digest()
+
+    # Tanks that are already up with exactly these values are left alone. Failed, pending or
+    # terminating ones are redeployed whatever their values.
+    deployed_hashes = {}
+    if not force:
+        for tank in get_mission(TANK_MISSION, namespace=namespace):
+            if not pod_is_ready(tank) or tank.metadata.deletion_timestamp:
+                continue
+            annotations = tank.metadata.annotations or {}
+            deployed_hashes[tank.metadata.name] = annotations.get(VALUES_HASH_ANNOTATION)
+
+    snapshots = prepare_snapshots(
+        directory,
+        {
+            node.get("name"): merge_values(defaults, {k: v for k, v in node.items() if k != "name"})
+            for node in network_file["nodes"]
+        },
+        namespace,
+        debug,
+    )
+    if snapshots is None:
+        return False
 
-    for node in network_file["nodes"]:
-        click.echo(f"Deploying node: {node.get('name')}")
-        try:
-            temp_override_file_path = ""
+    # Render every node's override file and Helm command before installing anything. The
+    # files only need to outlive the helm calls.
+    with tempfile.TemporaryDirectory(prefix="warnet-deploy-") as override_dir:
+        releases = []
+        unchanged = []
+        for node in network_file["nodes"]:
             node_name = node.get("name")
             node_config_override = {k: v for k, v in node.items() if k != "name"}
+            if node_name in snapshots:
+                node_config_override = merge_values(node_config_override, snapshots[node_name])
+
+            values = merge_values(defaults, node_config_override)
+            values_hash = hashlib.sha256(
+                json.dumps([chart_digest, values], sort_keys=True).encode()
+            ).hexdigest()
+            if deployed_hashes.get(node_name) == values_hash:
+                unchanged.append(node_name)
+                continue
+            node_config_override = merge_values(
+                node_config_override, {"podAnnotations": {VALUES_HASH_ANNOTATION: values_hash}}
+            )
 
             cmd = f"{HELM_COMMAND} {node_name} {BITCOIN_CHART_LOCATION} --namespace {namespace} -f {defaults_file_path}"
             if debug:
                 cmd += " --debug"
 
-            if node_config_override:
-                with tempfile.NamedTemporaryFile(
-                    mode="w", suffix=".yaml", delete=False
-                ) as temp_file:
-                    yaml.dump(node_config_override, temp_file)
-                    temp_override_file_path = Path(temp_file.name)
-                cmd = f"{cmd} -f {temp_override_file_path}"
+            override_file_path = Path(override_dir) / f"{node_name}.yaml"
+            with override_file_path.open("w") as f:
+                yaml.dump(node_config_override, f)
+            cmd = f"{cmd} -f {override_file_path}"
+            releases.append((node_name, cmd))
+
+        if unchanged:
+            click.echo(f"Skipping {len(unchanged)} unchanged nodes: {', '.join(unchanged)}")
+
+        if jobs > 1:
+            return run_helm_releases(releases, jobs)
+
+        for node_name, cmd in releases:
+            click.echo(f"Deploying node: {node_name}")
+            try:
+                if not stream_command(cmd):
+                    click.echo(f"Failed to run Helm command: {cmd}")
+                    return False
+            except Exception as e:
+                click.echo(f"Error: {e}")
+                return False
+        return True
 
-            if not stream_command(cmd):
-                click.echo(f"Failed to run Helm command: {cmd}")
-                return
+
+def load_chart_values() -> dict:
+    """Default values of the bitcoincore chart, without the bulk-mode node list"""
+    with (Path(BITCOIN_CHART_LOCATION) / "values.yaml").open() as f:
+        chart_values = yaml.safe_load(f)
+    chart_values.pop("nodes", None)
+    return chart_values
+
+
+def get_chart_digest() -> str:
+    """Hash of the bitcoincore chart's metadata and templates"""
+    chart_dir = Path(BITCOIN_CHART_LOCATION)
+    digest = hashlib.sha256()
+    for path in [chart_dir / "Chart.yaml", *sorted((chart_dir / "templates").iterdir())]:
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def merge_values(base: dict, override: dict) -> dict:
+    """
+    Merge Helm values the way a later `-f` file does: maps merge recursively, any other
+    value replaces the base, and null removes the key.
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_values(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def get_snapshot_source(directory: Path, load_snapshot: dict) -> tuple[str, tuple]:
+    """
+    The name the snapshot server keeps a loadSnapshot source under, and the source: a
+    local tarball (`file`, relative to the network directory), a tank in a snapshot store
+    (`store: {path, tank, name}`), or a remote `url`. Names are content hashes, or the
+    URL's hash, so every node loading the same snapshot shares one copy.
+    """
+    if load_snapshot.get("file"):
+        path = directory / load_snapshot["file"]
+        if path.name.endswith(".tar"):
+            suffix = ".tar"
+        elif path.name.endswith((".tar.gz", ".tgz")):
+            suffix = ".tar.gz"
+        else:
+            raise ValueError(f"{path} is not a .tar or .tar.gz snapshot")
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        return digest.hexdigest()[:32] + suffix, ("file", path)
+    if load_snapshot.get("store"):
+        config = load_snapshot["store"]
+        path = directory / config["path"]
+        if not (path / "manifests").is_dir():
+            raise FileNotFoundError(f"{path} is not a snapshot store")
+        store = SnapshotStore(path)
+        manifest = store.read_manifest(config["tank"], config.get("name"))
+        digest = hashlib.sha256(json.dumps(manifest["files"], sort_keys=True).encode())
+        return digest.hexdigest()[:32] + ".tar.gz", ("store", store, manifest)
+    url = load_snapshot.get("url")
+    if not url:
+        raise ValueError("loadSnapshot needs a url, file or store")
+    suffix = ".tar" if url.endswith(".tar") else ".tar.gz"
+    return hashlib.sha256(url.encode()).hexdigest()[:32] + suffix, ("url", url)
+
+
+def upload_snapshot(namespace: str, name: str, source: tuple) -> None:
+    """Put one snapshot on the snapshot server, fetching URLs from inside the cluster"""
+    target = f"{SNAPSHOT_SERVER_DIR}/{name}"
+    partial = f"{SNAPSHOT_SERVER_DIR}/.{name}.partial"
+    if source[0] == "url":
+        command = f"curl -fsSL -o {partial} {shlex.quote(source[1])} && mv {partial} {target}"
+        exec_in_pod(
+            SNAPSHOT_SERVER_RELEASE,
+            namespace,
+            ["sh", "-c", command],
+            lambda _: None,
+            container="fetch",
+        )
+        return
+    with tempfile.TemporaryFile() as tmp:
+        if source[0] == "store":
+            _, store, manifest = source
+            store.write_tar(manifest, tmp)
+            size = tmp.tell()
+            tmp.seek(0)
+            f = tmp
+        else:
+            size = source[1].stat().st_size
+            f = source[1].open("rb")
+        with f:
+            # Only a complete upload is renamed into place for the tanks to fetch
+            command = (
+                f"head -c {size} > {partial} && "
+                f'[ "$(wc -c < {partial})" -eq {size} ] && mv {partial} {target}'
+            )
+            exec_in_pod(
+                SNAPSHOT_SERVER_RELEASE,
+                namespace,
+                ["sh", "-c", command],
+                lambda _: None,
+                stdin=f,
+                container="fetch",
+            )
+
+
+def prepare_snapshots(
+    directory: Path, node_values: dict[str, dict], namespace: str, debug: bool = False
+) -> Optional[dict[str, dict]]:
+    """
+    Serve every snapshot the nodes load from a snapshot server in `namespace`, so each
+    distinct snapshot is uploaded or downloaded once however many tanks load it. Returns
+    the values pointing each of those nodes' loadSnapshot at the server, or None if a
+    snapshot could not be prepared.
+    """
+    server_url = f"http://{SNAPSHOT_SERVER_RELEASE}.{namespace}.svc"
+    sources = {}
+    overrides = {}
+    for node_name, values in node_values.items():
+        load_snapshot = values.get("loadSnapshot") or {}
+        if not load_snapshot.get("enabled"):
+            continue
+        if str(load_snapshot.get("url", "")).startswith(f"{server_url}/"):
+            continue
+        try:
+            name, source = get_snapshot_source(directory, load_snapshot)
+        except (OSError, ValueError) as e:
+            click.echo(f"Error: Unable to load the snapshot for {node_name}: {e}")
+            return None
+        sources[name] = source
+        overrides[node_name] = {
+            "loadSnapshot": {"url": f"{server_url}/{name}", "file": None, "store": None}
+        }
+    if not sources:
+        return {}
+
+    cmd = (
+        f"{HELM_COMMAND} {SNAPSHOT_SERVER_RELEASE} {SNAPSHOT_SERVER_CHART} --namespace {namespace}"
+    )
+    if debug:
+        cmd += " --debug"
+    if not stream_command(cmd):
+        click.echo(f"Failed to run Helm command: {cmd}")
+        return None
+    if not wait_for_pod_ready(SNAPSHOT_SERVER_RELEASE, namespace):
+        return None
+
+    listing = []
+    exec_in_pod(
+        SNAPSHOT_SERVER_RELEASE,
+        namespace,
+        ["ls", "-1", SNAPSHOT_SERVER_DIR],
+        listing.append,
+        container="fetch",
+    )
+    cached = set(b"".join(listing).decode().split())
+    missing = [name for name in sources if name not in cached]
+    click.echo(
+        f"Serving {len(sources)} snapshots to {len(overrides)} nodes "
+        f"({len(sources) - len(missing)} already cached)"
+    )
+    for name in missing:
+        click.echo(f"Uploading snapshot: {name}")
+        try:
+            upload_snapshot(namespace, name, sources[name])
+        except Exception as e:
+            click.echo(f"Error: Unable to upload snapshot {name}: {e}")
+            return None
+    return overrides
+
+
+def deploy_network_bulk(directory: Path, debug: bool = False, namespace: Optional[str] = None):
+    """
+    Deploy every tank in network.yaml as one release of the bitcoincore chart. Each node's
+    values are merged here (chart defaults, node-defaults.yaml, then the node's own entry)
+    and the chart renders one set of tank manifests per node in a single Helm call.
+    """
+    network_file_path = directory / NETWORK_FILE
+    defaults_file_path = directory / DEFAULTS_FILE
+
+    namespace = get_default_namespace_or(namespace)
+
+    with defaults_file_path.open() as f:
+        defaults = merge_values(load_chart_values(), yaml.safe_load(f) or {})
+    with network_file_path.open() as f:
+        network_file = yaml.safe_load(f)
+
+    nodes = [
+        {
+            "name": node.get("name"),
+            "values": merge_values(defaults, {k: v for k, v in node.items() if k != "name"}),
+        }
+        for node in network_file["nodes"]
+    ]
+    snapshots = prepare_snapshots(
+        directory, {node["name"]: node["values"] for node in nodes}, namespace, debug
+    )
+    if snapshots is None:
+        return False
+    for node in nodes:
+        if node["name"] in snapshots:
+            node["values"] = merge_values(node["values"], snapshots[node["name"]])
+    click.echo(f"Deploying {len(nodes)} nodes as release: {BULK_NETWORK_RELEASE}")
+
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml") as values_file:
+        yaml.dump({"nodes": nodes}, values_file)
+        values_file.flush()
+        cmd = f"{HELM_COMMAND} {BULK_NETWORK_RELEASE} {BITCOIN_CHART_LOCATION} --namespace {namespace} -f {values_file.name}"
+        if debug:
+            cmd += " --debug"
+        try:
+            return stream_command(cmd)
         except Exception as e:
             click.echo(f"Error: {e}")
-            return
-        finally:
-            if temp_override_file_path:
-                Path(temp_override_file_path).unlink()
+            return False
+
+
+def run_helm_releases(releases: list[tuple[str, str]], jobs: int) -> bool:
+    """
+    Run (release name, Helm command) pairs on a pool of `jobs` workers. Each release's output
+    is printed as one block, prefixed with its name, once it finishes. After the first failure
+    no further releases are started.
+    """
+    failed = threading.Event()
+
+    def run_release(name: str, cmd: str):
+        if failed.is_set():
+            return name, None, 0.0
+        start = time.monotonic()
+        result = subprocess.run(
+            ["bash", "-c", cmd], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        if result.returncode != 0:
+            failed.set()
+        return name, result, time.monotonic() - start
+
+    deployed = 0
+    click.echo(f"Deploying {len(releases)} nodes with {jobs} concurrent jobs")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_release, name, cmd) for name, cmd in releases]
+        for future in as_completed(futures):
+            name, result, elapsed = future.result()
+            if result is None:
+                continue
+            for line in result.stdout.splitlines():
+                click.echo(f"[{name}] {line}")
+            if result.returncode == 0:
+                deployed += 1
+                click.secho(f"Deployed node: {name} ({elapsed:.1f}s)", fg="green")
+            else:
+                click.secho(f"Failed to deploy node: {name} ({elapsed:.1f}s)", fg="red")
+
+    if failed.is_set():
+        skipped = len(releases) - len([f for f in futures if f.result()[1] is not None])
+        click.secho(
+            f"Deployed {deployed} of {len(releases)} nodes, {skipped} not started", fg="red"
+        )
+        return False
+    click.secho(f"Deployed {deployed} nodes", fg="green")
+    return True
 
 
 def deploy_namespaces(directory: Path):
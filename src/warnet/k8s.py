@@ -1,18 +1,31 @@
+import base64
+import gzip
+import hashlib
+import io
 import json
+import logging
 import os
+import re
+import shlex
+import shutil
+import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
+import weakref
 from pathlib import Path
-from time import sleep
-from typing import Optional
+from time import monotonic
+from typing import BinaryIO, Callable, Iterator, Optional
 
 import yaml
 from kubernetes import client, config, watch
 from kubernetes.client import CoreV1Api
-from kubernetes.client.models import V1Namespace, V1Pod, V1PodList
+from kubernetes.client.models import V1Namespace, V1Pod, V1PodList, V1Service
 from kubernetes.client.rest import ApiException
 from kubernetes.dynamic import DynamicClient
-from kubernetes.stream import stream
+from kubernetes.stream import portforward, stream
+from kubernetes.stream.ws_client import PortForward
 
 from .constants import (
     CADDY_INGRESS_NAME,
@@ -23,34 +36,120 @@ from .constants import (
     LOGGING_NAMESPACE,
 )
 from .process import run_command, stream_command
+from .snapshot_store import SnapshotStore
+
+logger = logging.getLogger(__name__)
 
 
 class K8sError(Exception):
     pass
 
 
+# Process-wide ApiClients keyed by (KUBECONFIG, context). Each entry remembers the mtimes
+# of the kubeconfig files it was built from so a rewrite (e.g. by `warnet auth` in another
+# process) is picked up on the next lookup.
+_api_clients: dict[
+    tuple[str, Optional[str]], tuple[tuple[Optional[int], ...], client.ApiClient]
+] = {}
+_api_clients_lock = threading.Lock()
+
+
+def _kubeconfig_paths() -> list[str]:
+    """The files KUBECONFIG lists, separated like PATH"""
+    return [path for path in KUBECONFIG.split(os.pathsep) if path]
+
+
+def _kubeconfig_mtimes() -> tuple[Optional[int], ...]:
+    """The mtime of each KUBECONFIG file, None for those that don't exist"""
+    mtimes = []
+    for path in _kubeconfig_paths():
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def get_api_client(context: Optional[str] = None) -> client.ApiClient:
+    """
+    Return the shared ApiClient for KUBECONFIG and `context` (None for the current context).
+    The kubeconfig is only parsed the first time, so all callers share one connection pool.
+    """
+    key = (KUBECONFIG, context)
+    mtimes = _kubeconfig_mtimes()
+    with _api_clients_lock:
+        cached = _api_clients.get(key)
+        if cached and cached[0] == mtimes:
+            return cached[1]
+        configuration = client.Configuration()
+        # The client takes current-context from the last file that sets it, kubectl from
+        # the first, so resolve it the way kubectl does
+        config.load_kube_config(
+            config_file=KUBECONFIG,
+            context=context or get_kubeconfig().current_context,
+            client_configuration=configuration,
+        )
+        # Room for the 32 concurrent requests or log streams commands use by default, as
+        # the default is 5 per CPU
+        configuration.connection_pool_maxsize = max(configuration.connection_pool_maxsize, 32)
+        api_client = client.ApiClient(configuration)
+        _api_clients[key] = (mtimes, api_client)
+        return api_client
+
+
+def invalidate_api_clients() -> None:
+    """Drop all cached ApiClients so the next call re-reads the kubeconfig"""
+    with _api_clients_lock:
+        _api_clients.clear()
+
+
 def get_static_client() -> CoreV1Api:
-    config.load_kube_config(config_file=KUBECONFIG)
-    return client.CoreV1Api()
+    return CoreV1Api(get_api_client())
+
+
+def get_stream_client() -> CoreV1Api:
+    """
+    Return a CoreV1Api for use with kubernetes.stream. stream() swaps out the request method
+    of the ApiClient while it runs, so it must not share the pooled client with other threads.
+    """
+    return CoreV1Api(client.ApiClient(get_api_client().configuration))
 
 
 def get_dynamic_client() -> DynamicClient:
-    config.load_kube_config(config_file=KUBECONFIG)
-    return DynamicClient(client.ApiClient())
+    return DynamicClient(get_api_client())
 
 
-def get_pods() -> list[V1Pod]:
+# ApiClients whose credentials may not list pods across all namespaces
+_cluster_scope_forbidden: "weakref.WeakSet[client.ApiClient]" = weakref.WeakSet()
+
+
+def get_pods(label_selector: Optional[str] = None, namespace: Optional[str] = None) -> list[V1Pod]:
+    """
+    List pods matching `label_selector` in `namespace`, or in all non-internal namespaces.
+    Filtering happens server-side. Without a namespace a single cluster-wide LIST is used,
+    falling back to one LIST per namespace if RBAC forbids it.
+    """
     sclient = get_static_client()
-    pods: list[V1Pod] = []
-    namespaces = get_namespaces()
-    for ns in namespaces:
-        namespace = ns.metadata.name
+    if namespace:
+        return sclient.list_namespaced_pod(namespace, label_selector=label_selector).items
+
+    if sclient.api_client not in _cluster_scope_forbidden:
         try:
-            pod_list: V1PodList = sclient.list_namespaced_pod(namespace)
-            for pod in pod_list.items:
-                pods.append(pod)
-        except Exception as e:
-            raise e
+            pod_list: V1PodList = sclient.list_pod_for_all_namespaces(label_selector=label_selector)
+            return [
+                pod
+                for pod in pod_list.items
+                if pod.metadata.namespace not in KUBE_INTERNAL_NAMESPACES
+            ]
+        except ApiException as e:
+            if e.status != 403:
+                raise
+            _cluster_scope_forbidden.add(sclient.api_client)
+
+    pods: list[V1Pod] = []
+    for ns in get_namespaces():
+        pod_list = sclient.list_namespaced_pod(ns.metadata.name, label_selector=label_selector)
+        pods.extend(pod_list.items)
     return pods
 
 
@@ -60,13 +159,13 @@ def get_pod(name: str, namespace: Optional[str] = None) -> V1Pod:
     return sclient.read_namespaced_pod(name=name, namespace=namespace)
 
 
-def get_mission(mission: str) -> list[V1Pod]:
-    pods = get_pods()
-    crew: list[V1Pod] = []
-    for pod in pods:
-        if "mission" in pod.metadata.labels and pod.metadata.labels["mission"] == mission:
-            crew.append(pod)
-    return crew
+def get_mission(mission: str, namespace: Optional[str] = None) -> list[V1Pod]:
+    return get_pods(label_selector=f"mission={mission}", namespace=namespace)
+
+
+def get_services(namespace: Optional[str] = None) -> list[V1Service]:
+    namespace = get_default_namespace_or(namespace)
+    return get_static_client().list_namespaced_service(namespace).items
 
 
 def get_pod_exit_status(pod_name, namespace: Optional[str] = None):
@@ -144,176 +243,710 @@ def delete_pod(pod_name: str, namespace: Optional[str] = None) -> bool:
     return stream_command(command)
 
 
+def delete_pods_by_selector(
+    label_selector: str, namespace: Optional[str] = None, grace_period_seconds: int = 0
+) -> None:
+    """Delete every pod in `namespace` matching `label_selector` with a single API call"""
+    namespace = get_default_namespace_or(namespace)
+    get_static_client().delete_collection_namespaced_pod(
+        namespace, label_selector=label_selector, grace_period_seconds=grace_period_seconds
+    )
+
+
+def delete_config_maps_by_selector(label_selector: str, namespace: Optional[str] = None) -> int:
+    """Delete the configmaps in `namespace` matching `label_selector`, returning how many"""
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    config_maps = sclient.list_namespaced_config_map(namespace, label_selector=label_selector)
+    if config_maps.items:
+        sclient.delete_collection_namespaced_config_map(namespace, label_selector=label_selector)
+    return len(config_maps.items)
+
+
+def get_helm_releases(namespace: Optional[str] = None) -> list[str]:
+    """Names of the Helm releases in `namespace`, read from Helm's release secrets"""
+    namespace = get_default_namespace_or(namespace)
+    secrets = get_static_client().list_namespaced_secret(namespace, label_selector="owner=helm")
+    return sorted(
+        {
+            secret.metadata.labels["name"]
+            for secret in secrets.items
+            if secret.metadata.labels and "name" in secret.metadata.labels
+        }
+    )
+
+
+def label_in_selectors(key: str, values: list[str], batch_size: int = 100) -> list[str]:
+    """Split a `key in (values)` label selector into batches that keep request URLs short"""
+    values = sorted(values)
+    return [
+        f"{key} in ({','.join(values[i : i + batch_size])})"
+        for i in range(0, len(values), batch_size)
+    ]
+
+
+def delete_helm_releases(
+    releases: list[str], instances: list[str], namespace: Optional[str] = None
+) -> None:
+    """
+    Remove Helm releases without running `helm uninstall`: the configmaps, services and
+    servicemonitors labelled with one of `instances` are deleted in batches, followed by
+    every revision secret of `releases`. Pods are left to the caller.
+    """
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    custom_api = client.CustomObjectsApi(get_api_client())
+    for selector in label_in_selectors("app.kubernetes.io/instance", instances):
+        sclient.delete_collection_namespaced_config_map(namespace, label_selector=selector)
+        try:
+            sclient.delete_collection_namespaced_service(namespace, label_selector=selector)
+        except ApiException as e:
+            if e.status != 405:
+                raise
+            # Older clusters cannot delete services as a collection
+            for service in sclient.list_namespaced_service(
+                namespace, label_selector=selector
+            ).items:
+                sclient.delete_namespaced_service(service.metadata.name, namespace)
+        try:
+            custom_api.delete_collection_namespaced_custom_object(
+                "monitoring.coreos.com", "v1", namespace, "servicemonitors", label_selector=selector
+            )
+        except ApiException as e:
+            # No prometheus operator installed, so there are no servicemonitors
+            if e.status != 404:
+                raise
+    for selector in label_in_selectors("name", releases):
+        sclient.delete_collection_namespaced_secret(
+            namespace, label_selector=f"owner=helm,{selector}"
+        )
+
+
+class Kubeconfig:
+    """
+    The kubeconfig as kubectl sees it, resolved in process. KUBECONFIG may list several
+    files, merged as kubectl merges them: the first file to set a value or define a named
+    context, cluster or user wins.
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    @classmethod
+    def load(cls, paths: list[str]) -> "Kubeconfig":
+        merged = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            data = open_kubeconfig(path) or {}
+            for key, value in data.items():
+                if key in ("contexts", "clusters", "users"):
+                    names = {entry["name"] for entry in merged.get(key, [])}
+                    merged.setdefault(key, []).extend(
+                        entry for entry in value or [] if entry["name"] not in names
+                    )
+                elif key not in merged or not merged[key]:
+                    merged[key] = value
+        return cls(merged)
+
+    def _entry(self, kind: str, name: Optional[str]) -> Optional[dict]:
+        return next((e for e in self.data.get(kind) or [] if e["name"] == name), None)
+
+    @property
+    def current_context(self) -> Optional[str]:
+        return self.data.get("current-context") or None
+
+    @property
+    def context(self) -> dict:
+        """The current context's settings: its cluster, user and namespace"""
+        entry = self._entry("contexts", self.current_context)
+        return (entry or {}).get("context") or {}
+
+    @property
+    def namespace(self) -> Optional[str]:
+        return self.context.get("namespace") or None
+
+    @property
+    def cluster(self) -> dict:
+        return get_cluster_of_current_context(self.data)
+
+    def minify(self) -> dict:
+        """Only the current context and its cluster and user, like `kubectl config view --minify`"""
+        context = self._entry("contexts", self.current_context)
+        cluster = self._entry("clusters", self.context.get("cluster"))
+        user = self._entry("users", self.context.get("user"))
+        return {
+            "apiVersion": self.data.get("apiVersion", "v1"),
+            "kind": self.data.get("kind", "Config"),
+            "current-context": self.current_context or "",
+            "contexts": [context] if context else [],
+            "clusters": [cluster] if cluster else [],
+            "users": [user] if user else [],
+            "preferences": self.data.get("preferences") or {},
+        }
+
+
+# The Kubeconfig for each KUBECONFIG value, with the mtimes of the files it was read from
+_kubeconfigs: dict[str, tuple[tuple[Optional[int], ...], Kubeconfig]] = {}
+_kubeconfigs_lock = threading.Lock()
+
+
+def get_kubeconfig() -> Kubeconfig:
+    """The parsed kubeconfig, only read again once one of its files changes"""
+    mtimes = _kubeconfig_mtimes()
+    with _kubeconfigs_lock:
+        cached = _kubeconfigs.get(KUBECONFIG)
+        if cached and cached[0] == mtimes:
+            return cached[1]
+        kubeconfig = Kubeconfig.load(_kubeconfig_paths())
+        _kubeconfigs[KUBECONFIG] = (mtimes, kubeconfig)
+        return kubeconfig
+
+
 def get_default_namespace() -> str:
-    command = "kubectl config view --minify -o jsonpath='{..namespace}'"
     try:
-        kubectl_namespace = run_command(command)
-    except Exception as e:
+        namespace = get_kubeconfig().namespace
+    except K8sError as e:
         print(e)
-        if str(e).find("command not found"):
-            print(
-                "It looks like kubectl is not installed. Please install it to continue: "
-                "https://kubernetes.io/docs/tasks/tools/"
-            )
         sys.exit(1)
-    return kubectl_namespace if kubectl_namespace else DEFAULT_NAMESPACE
+    return namespace if namespace else DEFAULT_NAMESPACE
 
 
 def get_default_namespace_or(namespace: Optional[str]) -> str:
     return namespace if namespace else get_default_namespace()
 
 
+# Local file suffix for each snapshot compression
+SNAPSHOT_COMPRESSION = {"gzip": ".tar.gz", "zstd": ".tar.zst", "none": ".tar"}
+# Bytes of stdin sent per exec websocket frame
+EXEC_STDIN_CHUNK_SIZE = 1 << 16
+
+
+class SnapshotWriter:
+    """
+    Compress a tar stream into `path` as it arrives. gzip runs on all cores through pigz
+    when it is installed and through zlib otherwise; zstd needs the zstd command.
+    """
+
+    def __init__(self, path: Path, compression: str = "gzip"):
+        if compression == "zstd" and not shutil.which("zstd"):
+            raise RuntimeError("zstd compression needs the zstd command installed")
+        self._file = open(path, "wb")  # noqa: SIM115 closed by close()
+        self._process: Optional[subprocess.Popen] = None
+        if compression == "zstd":
+            command = ["zstd", "-q", "-T0", "-c"]
+        elif compression == "gzip" and shutil.which("pigz"):
+            command = ["pigz", "-c"]
+        else:
+            command = None
+        if command:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self._file)
+            self._out = self._process.stdin
+        elif compression == "gzip":
+            self._out = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=6)
+        else:
+            self._out = self._file
+
+    def write(self, data: bytes) -> None:
+        self._out.write(data)
+
+    def close(self) -> None:
+        try:
+            if self._out is not self._file:
+                self._out.close()
+            if self._process and self._process.wait() != 0:
+                raise RuntimeError(
+                    f"{self._process.args[0]} exited with {self._process.returncode}"
+                )
+        finally:
+            self._file.close()
+
+
+def exec_in_pod(
+    pod_name: str,
+    namespace: str,
+    command: list[str],
+    stdout: Callable[[bytes], None],
+    stdin: Optional[BinaryIO] = None,
+    container: Optional[str] = None,
+) -> str:
+    """
+    Run `command` in a pod, passing its stdout to `stdout` in chunks as they arrive over the
+    exec websocket and, if given, sending it the contents of `stdin`. The exec protocol
+    cannot close stdin, so a command reading it must stop on its own, e.g. with `head -c`.
+    Returns stderr, and raises RuntimeError if the command fails.
+    """
+    kwargs = {"container": container} if container else {}
+    resp = stream(
+        get_stream_client().connect_get_namespaced_pod_exec,
+        pod_name,
+        namespace,
+        command=command,
+        stderr=True,
+        stdin=stdin is not None,
+        stdout=True,
+        tty=False,
+        _preload_content=False,
+        binary=True,
+        **kwargs,
+    )
+    stderr = []
+    try:
+        while resp.is_open():
+            # Don't wait for output while there is still input to send
+            resp.update(timeout=0 if stdin else 1)
+            if resp.peek_stdout():
+                stdout(resp.read_stdout())
+            if resp.peek_stderr():
+                stderr.append(resp.read_stderr())
+            if stdin:
+                chunk = stdin.read(EXEC_STDIN_CHUNK_SIZE)
+                if chunk:
+                    resp.write_stdin(chunk)
+                else:
+                    stdin = None
+        code = resp.returncode
+    finally:
+        resp.close()
+    stderr = b"".join(stderr).decode(errors="replace")
+    if code != 0:
+        raise RuntimeError(f"{command[0]} exited with {code}: {stderr.strip()}")
+    return stderr
+
+
+def get_snapshot_paths(
+    pod_name: str, namespace: str, datadir: str, filters: Optional[list[str]]
+) -> list[str]:
+    """
+    The paths in `datadir`, relative to it, that a snapshot with `filters` includes
+    """
+    # Filter down to the specified list of directories and files
+    # This allows for creating snapshots of only the relevant data, e.g.,
+    # we may want to snapshot the blocks but not snapshot peers.dat or the node
+    # wallets.
+    #
+    # TODO: never snapshot bitcoin.conf, as this is managed by the helm config
+    if not filters:
+        return ["."]
+    names = " -o ".join(f"-name {shlex.quote(f)}" for f in filters)
+    output = []
+    exec_in_pod(
+        pod_name,
+        namespace,
+        ["sh", "-c", f"cd {datadir} && find . \\( -type f -o -type d \\) \\( {names} \\)"],
+        output.append,
+    )
+    return [p for p in b"".join(output).decode().splitlines() if p.strip()]
+
+
+def read_tar_from_pod(
+    pod_name: str, namespace: str, command: list[str], member: Callable[[str, BinaryIO], None]
+) -> None:
+    """
+    Run a command that writes a tar to stdout in a pod, calling `member` with the path and
+    contents of each regular file in the tar as it streams in
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with open(write_fd, "wb") as pipe:
+                exec_in_pod(pod_name, namespace, command, pipe.write)
+        except BaseException as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with open(read_fd, "rb") as pipe, tarfile.open(fileobj=pipe, mode="r|") as tar:
+            for info in tar:
+                if info.isfile():
+                    member(os.path.normpath(info.name), tar.extractfile(info))
+            # Drain anything after the end of archive so the producer can finish
+            while pipe.read(1 << 16):
+                pass
+    finally:
+        producer.join()
+    if errors:
+        raise errors[0]
+
+
+def snapshot_bitcoin_datadir_to_store(
+    pod_name: str,
+    chain: str,
+    store: SnapshotStore,
+    name: str,
+    filters: Optional[list[str]] = None,
+    namespace: Optional[str] = None,
+    batch_size: int = 200,
+) -> Optional[dict]:
+    """
+    Snapshot a tank's datadir for `chain` into a content-addressed store as snapshot `name`.
+    The tank hashes its files first, and only files the store does not already hold are
+    streamed out, so tanks sharing block files transfer them once. Returns the manifest, or
+    None if nothing matched the filters.
+    """
+    namespace = get_default_namespace_or(namespace)
+    datadir = f"/root/.bitcoin/{chain}"
+    paths = get_snapshot_paths(pod_name, namespace, datadir, filters)
+    if not paths:
+        print(f"No matching files or directories found in {pod_name}.")
+        return None
+
+    listing = []
+    quoted = " ".join(shlex.quote(p) for p in paths)
+    exec_in_pod(
+        pod_name,
+        namespace,
+        ["sh", "-c", f"cd {datadir} && find {quoted} -type f -exec sha256sum {{}} +"],
+        listing.append,
+    )
+    files = {}
+    missing = []
+    for line in b"".join(listing).decode().splitlines():
+        digest, _, path = line.partition("  ")
+        path = os.path.normpath(path)
+        if store.get_file(digest):
+            files[path] = digest
+        else:
+            missing.append(path)
+
+    def add(path: str, contents: BinaryIO):
+        # Files like debug.log may have changed since they were hashed
+        files[path] = store.add_file(contents)
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i : i + batch_size]
+        read_tar_from_pod(pod_name, namespace, ["tar", "-cf", "-", "-C", datadir, *batch], add)
+    return store.write_manifest(name, pod_name, namespace, chain, files)
+
+
 def snapshot_bitcoin_datadir(
     pod_name: str,
     chain: str,
     local_path: str = "./",
     filters: list[str] = None,
     namespace: Optional[str] = None,
-) -> None:
+    compression: str = "gzip",
+) -> Optional[Path]:
+    """
+    Stream a tar of a tank's datadir for `chain` straight to a file in `local_path`,
+    compressing it locally, so the pod needs no scratch space. `filters` limits the
+    snapshot to files and directories with those names. Returns the snapshot path, or None
+    if nothing matched the filters.
+    """
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
+    datadir = f"/root/.bitcoin/{chain}"
+    paths = get_snapshot_paths(pod_name, namespace, datadir, filters)
+    if not paths:
+        print(f"No matching files or directories found in {pod_name}.")
+        return None
 
+    local_file_path = (
+        Path(local_path) / f"{pod_name}_bitcoin_data{SNAPSHOT_COMPRESSION[compression]}"
+    )
+    partial_path = local_file_path.with_name(local_file_path.name + ".partial")
+    writer = SnapshotWriter(partial_path, compression)
     try:
-        sclient.read_namespaced_pod(name=pod_name, namespace=namespace)
-
-        # Filter down to the specified list of directories and files
-        # This allows for creating snapshots of only the relevant data, e.g.,
-        # we may want to snapshot the blocks but not snapshot peers.dat or the node
-        # wallets.
-        #
-        # TODO: never snapshot bitcoin.conf, as this is managed by the helm config
-        if filters:
-            find_command = [
-                "find",
-                f"/root/.bitcoin/{chain}",
-                "(",
-                "-type",
-                "f",
-                "-o",
-                "-type",
-                "d",
-                ")",
-                "(",
-                "-name",
-                filters[0],
-            ]
-            for f in filters[1:]:
-                find_command.extend(["-o", "-name", f])
-            find_command.append(")")
-        else:
-            # If no filters, get everything in the Bitcoin directory (TODO: exclude bitcoin.conf)
-            find_command = ["find", f"/root/.bitcoin/{chain}"]
+        try:
+            exec_in_pod(
+                pod_name, namespace, ["tar", "-cf", "-", "-C", datadir, *paths], writer.write
+            )
+        finally:
+            writer.close()
+        partial_path.rename(local_file_path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return local_file_path
 
-        resp = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=find_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
 
-        file_list = []
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                file_list.extend(resp.read_stdout().strip().split("\n"))
-            if resp.peek_stderr():
-                print(f"Error: {resp.read_stderr()}")
+class PodInformer:
+    """
+    In-memory view of the pods matching `label_selector`, kept current by one LIST followed
+    by a WATCH from the list's resourceVersion. Pods are indexed by mission, namespace and
+    name, and callers can block on predicates over the cache instead of re-listing pods.
+    Failed requests are logged and retried, waiting twice as long after each failure in a
+    row, up to `max_retry_delay` seconds.
+    """
 
-        resp.close()
-        if not file_list:
-            print("No matching files or directories found.")
+    def __init__(
+        self,
+        label_selector: str = "mission",
+        namespace: Optional[str] = None,
+        watch_timeout: int = 60,
+        max_retry_delay: float = 30,
+    ):
+        self.label_selector = label_selector
+        self.namespace = namespace
+        self.watch_timeout = watch_timeout
+        self.max_retry_delay = max_retry_delay
+        self.synced = False
+        self.last_error: Optional[Exception] = None
+        # Bumped on every change to the cache, so callers can tell whether to look again
+        self.revision = 0
+        self._pods: dict[tuple[str, str], V1Pod] = {}
+        self._missions: dict[str, dict[tuple[str, str], V1Pod]] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._watch: Optional[watch.Watch] = None
+        self._thread = threading.Thread(target=self._run, name="pod-informer", daemon=True)
+
+    def start(self) -> "PodInformer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+        with self._condition:
+            self._condition.notify_all()
+
+    def pods(self, mission: Optional[str] = None, namespace: Optional[str] = None) -> list[V1Pod]:
+        with self._condition:
+            pods = self._missions.get(mission, {}) if mission else self._pods
+            return [pod for (ns, _), pod in pods.items() if namespace is None or ns == namespace]
+
+    def get(self, name: str, namespace: str) -> Optional[V1Pod]:
+        with self._condition:
+            return self._pods.get((namespace, name))
+
+    def wait_for(
+        self, predicate: Callable[["PodInformer"], bool], timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Block until `predicate(informer)` is true, re-evaluating it only when the cache
+        changes. Returns False if `timeout` seconds pass first.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._condition:
+            while True:
+                if self.synced and predicate(self):
+                    return True
+                remaining = None if deadline is None else deadline - monotonic()
+                if self._stopped.is_set() or (remaining is not None and remaining <= 0):
+                    return False
+                self._condition.wait(remaining)
+
+    def _list_func(self, sclient: CoreV1Api):
+        if self.namespace:
+            return lambda **kwargs: sclient.list_namespaced_pod(self.namespace, **kwargs)
+        return sclient.list_pod_for_all_namespaces
+
+    def _run(self) -> None:
+        resource_version = None
+        failures = 0
+        while not self._stopped.is_set():
+            try:
+                list_func = self._list_func(get_static_client())
+                if resource_version is None:
+                    pod_list: V1PodList = list_func(label_selector=self.label_selector)
+                    self._replace(pod_list.items)
+                    resource_version = pod_list.metadata.resource_version
+                    failures = 0
+                self._watch = watch.Watch()
+                for event in self._watch.stream(
+                    list_func,
+                    label_selector=self.label_selector,
+                    resource_version=resource_version,
+                    timeout_seconds=self.watch_timeout,
+                ):
+                    pod = event["object"]
+                    resource_version = pod.metadata.resource_version
+                    self._apply(event["type"], pod)
+                # The watch timed out as asked, so the connection is working
+                failures = 0
+                continue
+            except ApiException as e:
+                resource_version = None
+                if e.status == 403 and not self.namespace:
+                    # Not allowed to watch the whole cluster, fall back to our own namespace
+                    self.namespace = get_default_namespace()
+                    continue
+                if e.status == 410:
+                    # Our resourceVersion was compacted away: start over with a LIST
+                    continue
+                self.last_error = e
+                reason = f"{e.status} {e.reason}"
+            except Exception as e:
+                resource_version = None
+                self.last_error = e
+                reason = str(e)
+            failures += 1
+            delay = min(2 ** (failures - 1), self.max_retry_delay)
+            logger.warning(
+                f"Watching pods ({self.label_selector}) failed {failures} time(s) in a row, "
+                f"retrying in {delay}s: {reason}"
+            )
+            self._stopped.wait(delay)
+
+    def _replace(self, pods: list[V1Pod]) -> None:
+        with self._condition:
+            self._pods.clear()
+            self._missions.clear()
+            for pod in pods:
+                self._index(pod)
+            self.synced = True
+            self.revision += 1
+            self._condition.notify_all()
+
+    def _apply(self, event_type: str, pod: V1Pod) -> None:
+        with self._condition:
+            if event_type == "DELETED":
+                key = (pod.metadata.namespace, pod.metadata.name)
+                self._pods.pop(key, None)
+                for pods in self._missions.values():
+                    pods.pop(key, None)
+            else:
+                self._index(pod)
+            self.revision += 1
+            self._condition.notify_all()
+
+    def _index(self, pod: V1Pod) -> None:
+        if pod.metadata.namespace in KUBE_INTERNAL_NAMESPACES:
             return
-        tar_command = ["tar", "-czf", "/tmp/bitcoin_data.tar.gz", "-C", f"/root/.bitcoin/{chain}"]
-        tar_command.extend(
-            [os.path.relpath(f, f"/root/.bitcoin/{chain}") for f in file_list if f.strip()]
-        )
-        resp = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=tar_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
-        while resp.is_open():
-            resp.update(timeout=1)
-            if resp.peek_stdout():
-                print(f"Tar output: {resp.read_stdout()}")
-            if resp.peek_stderr():
-                print(f"Error: {resp.read_stderr()}")
-        resp.close()
-        local_file_path = Path(local_path) / f"{pod_name}_bitcoin_data.tar.gz"
-        copy_command = (
-            f"kubectl cp {namespace}/{pod_name}:/tmp/bitcoin_data.tar.gz {local_file_path}"
-        )
-        if not stream_command(copy_command):
-            raise Exception("Failed to copy tar file from pod to local machine")
+        key = (pod.metadata.namespace, pod.metadata.name)
+        mission = (pod.metadata.labels or {}).get("mission")
+        previous = self._pods.get(key)
+        if previous:
+            previous_mission = (previous.metadata.labels or {}).get("mission")
+            if previous_mission != mission:
+                self._missions.get(previous_mission, {}).pop(key, None)
+        self._pods[key] = pod
+        if mission:
+            self._missions.setdefault(mission, {})[key] = pod
+
+
+_pod_informers: dict[tuple[str, Optional[str]], PodInformer] = {}
+_pod_informers_lock = threading.Lock()
+
+
+def get_pod_informer(
+    label_selector: str = "mission", namespace: Optional[str] = None
+) -> PodInformer:
+    """Return the shared, started PodInformer for `label_selector` and `namespace`"""
+    key = (label_selector, namespace)
+    with _pod_informers_lock:
+        informer = _pod_informers.get(key)
+        if informer is None:
+            informer = PodInformer(label_selector, namespace).start()
+            _pod_informers[key] = informer
+        return informer
+
+
+def wait_for_pods(
+    pod_names: list[str],
+    predicate: Callable[[V1Pod], bool],
+    namespace: Optional[str] = None,
+    timeout: float = 300,
+    label_selector: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Yield each of `pod_names` as soon as `predicate` holds for it, with one watch for all of
+    them. A single pod is watched by name with a field selector; several pods share a watch
+    on `label_selector`, or on the namespace without one. The pods are listed first and
+    watched from that list's resourceVersion, so a pod already matching is yielded without
+    waiting and no change in between is missed. Stops once every pod has been yielded or
+    after `timeout` seconds.
+    """
+    namespace = get_default_namespace_or(namespace)
+    pending = set(pod_names)
+    if not pending:
+        return
+    selectors = {"label_selector": label_selector} if label_selector else {}
+    if len(pending) == 1:
+        selectors["field_selector"] = f"metadata.name={next(iter(pending))}"
+    sclient = get_static_client()
+    deadline = monotonic() + timeout
 
-        print(f"Bitcoin data exported successfully to {local_file_path}")
-        cleanup_command = ["rm", "/tmp/bitcoin_data.tar.gz"]
-        stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=cleanup_command,
-            stderr=True,
-            stdin=False,
-            stdout=True,
-            tty=False,
-        )
+    def check(pod: V1Pod) -> bool:
+        if pod.metadata.name in pending and predicate(pod):
+            pending.discard(pod.metadata.name)
+            return True
+        return False
+
+    resource_version = None
+    while pending and monotonic() < deadline:
+        if resource_version is None:
+            pods = sclient.list_namespaced_pod(namespace=namespace, **selectors)
+            resource_version = pods.metadata.resource_version
+            for pod in pods.items:
+                if check(pod):
+                    yield pod.metadata.name
+            if not pending:
+                return
+        w = watch.Watch()
+        try:
+            for event in w.stream(
+                sclient.list_namespaced_pod,
+                namespace=namespace,
+                resource_version=resource_version,
+                timeout_seconds=max(1, int(deadline - monotonic())),
+                **selectors,
+            ):
+                pod = event["object"]
+                resource_version = pod.metadata.resource_version
+                if event["type"] != "DELETED" and check(pod):
+                    yield pod.metadata.name
+                    if not pending:
+                        w.stop()
+                        return
+        except ApiException as e:
+            # The resourceVersion is too old to watch from, so list again
+            if e.status != 410:
+                raise
+            resource_version = None
+
+
+def pod_is_ready(pod: V1Pod) -> bool:
+    conditions = pod.status.conditions or []
+    ready_condition = next((c for c in conditions if c.type == "Ready"), None)
+    return (
+        pod.status.phase == "Running"
+        and ready_condition is not None
+        and ready_condition.status == "True"
+    )
 
-        print("To untar and repopulate the directory, use the following command:")
-        print(f"tar -xzf {local_file_path} -C /path/to/destination/.bitcoin/{chain}")
 
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+def init_is_running(pod: V1Pod) -> bool:
+    statuses = pod.status.init_container_statuses or []
+    return any(status.state.running for status in statuses)
 
 
 def wait_for_pod_ready(name, namespace, timeout=300):
-    sclient = get_static_client()
-    w = watch.Watch()
-    for event in w.stream(
-        sclient.list_namespaced_pod, namespace=namespace, timeout_seconds=timeout
-    ):
-        pod = event["object"]
-        if pod.metadata.name == name and pod.status.phase == "Running":
-            conditions = pod.status.conditions or []
-            ready_condition = next((c for c in conditions if c.type == "Ready"), None)
-            if ready_condition and ready_condition.status == "True":
-                w.stop()
-                return True
+    if any(wait_for_pods([name], pod_is_ready, namespace, timeout)):
+        return True
     print(f"Timeout waiting for pod {name} to be ready.")
     return False
 
 
 def wait_for_init(pod_name, timeout=300, namespace: Optional[str] = None):
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    w = watch.Watch()
-    for event in w.stream(
-        sclient.list_namespaced_pod, namespace=namespace, timeout_seconds=timeout
-    ):
-        pod = event["object"]
-        if pod.metadata.name == pod_name:
-            if not pod.status.init_container_statuses:
-                continue
-            for init_container_status in pod.status.init_container_statuses:
-                if init_container_status.state.running:
-                    print(f"initContainer in pod {pod_name} ({namespace}) is ready")
-                    w.stop()
-                    return True
-    print(f"Timeout waiting for initContainer in {pod_name} ({namespace})to be ready.")
+    if any(wait_for_pods([pod_name], init_is_running, namespace, timeout)):
+        print(f"initContainer in pod {pod_name} ({namespace}) is ready")
+        return True
+    print(f"Timeout waiting for initContainer in {pod_name} ({namespace}) to be ready.")
     return False
 
 
+def wait_for_inits(
+    pod_names: list[str],
+    namespace: Optional[str] = None,
+    timeout: int = 300,
+    label_selector: Optional[str] = None,
+) -> Iterator[str]:
+    """Yield each of `pod_names` as soon as one of its init containers is running"""
+    namespace = get_default_namespace_or(namespace)
+    pending = set(pod_names)
+    for name in wait_for_pods(pod_names, init_is_running, namespace, timeout, label_selector):
+        pending.discard(name)
+        yield name
+    for pod_name in sorted(pending):
+        print(f"Timeout waiting for initContainer in {pod_name} ({namespace}) to be ready.")
+
+
 def wait_for_ingress_controller(timeout=300):
     # get name of ingress controller pod
     sclient = get_static_client()
@@ -324,8 +957,7 @@ def wait_for_ingress_controller(timeout=300):
 
 
 def get_ingress_ip_or_host():
-    config.load_kube_config()
-    networking_v1 = client.NetworkingV1Api()
+    networking_v1 = client.NetworkingV1Api(get_api_client())
     try:
         ingress = networking_v1.read_namespaced_ingress(CADDY_INGRESS_NAME, LOGGING_NAMESPACE)
         if ingress.status.load_balancer.ingress[0].hostname:
@@ -336,7 +968,20 @@ def get_ingress_ip_or_host():
         return None
 
 
-def pod_log(pod_name, container_name=None, follow=False, namespace: Optional[str] = None):
+def pod_log(
+    pod_name,
+    container_name=None,
+    follow=False,
+    namespace: Optional[str] = None,
+    since_seconds: Optional[int] = None,
+    tail_lines: Optional[int] = None,
+    timestamps: bool = False,
+    limit_bytes: Optional[int] = None,
+):
+    """
+    Open a pod's log as a streaming response. since_seconds, tail_lines and limit_bytes
+    are applied by the API server, before anything is sent.
+    """
     namespace = get_default_namespace_or(namespace)
     sclient = get_static_client()
 
@@ -346,6 +991,10 @@ def pod_log(pod_name, container_name=None, follow=False, namespace: Optional[str
             namespace=namespace,
             container=container_name,
             follow=follow,
+            since_seconds=since_seconds,
+            tail_lines=tail_lines,
+            timestamps=timestamps,
+            limit_bytes=limit_bytes,
             _preload_content=False,
         )
     except ApiException as e:
@@ -353,48 +1002,37 @@ def pod_log(pod_name, container_name=None, follow=False, namespace: Optional[str
 
 
 def wait_for_pod(pod_name, timeout_seconds=10, namespace: Optional[str] = None):
-    namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    while timeout_seconds > 0:
-        pod = sclient.read_namespaced_pod_status(name=pod_name, namespace=namespace)
-        if pod.status.phase != "Pending":
-            return
-        sleep(1)
-        timeout_seconds -= 1
+    """Wait until the pod has left the Pending phase, for at most `timeout_seconds`"""
+    any(
+        wait_for_pods(
+            [pod_name], lambda pod: pod.status.phase != "Pending", namespace, timeout_seconds
+        )
+    )
 
 
 def write_file_to_container(
     pod_name, container_name, dst_path, data, namespace: Optional[str] = None
 ):
+    """
+    Write `data` to `dst_path` in a container. The data is streamed over one exec in
+    EXEC_STDIN_CHUNK_SIZE frames and only renamed into place once its sha256 matches, so
+    the container never sees a partial or corrupt file.
+    """
     namespace = get_default_namespace_or(namespace)
-    sclient = get_static_client()
-    exec_command = ["sh", "-c", f"cat > {dst_path}.tmp && sync"]
+    digest = hashlib.sha256(data).hexdigest()
+    tmp_path = f"{dst_path}.tmp"
+    command = (
+        f"head -c {len(data)} > {tmp_path} && "
+        f'echo "{digest}  {tmp_path}" | sha256sum -c > /dev/null && mv {tmp_path} {dst_path}'
+    )
     try:
-        res = stream(
-            sclient.connect_get_namespaced_pod_exec,
-            pod_name,
-            namespace,
-            command=exec_command,
-            container=container_name,
-            stdin=True,
-            stderr=True,
-            stdout=True,
-            tty=False,
-            _preload_content=False,
-        )
-        res.write_stdin(data)
-        res.close()
-        rename_command = ["sh", "-c", f"mv {dst_path}.tmp {dst_path}"]
-        stream(
-            sclient.connect_get_namespaced_pod_exec,
+        exec_in_pod(
             pod_name,
             namespace,
-            command=rename_command,
+            ["sh", "-c", command],
+            lambda _: None,
+            stdin=io.BytesIO(data),
             container=container_name,
-            stdin=False,
-            stderr=True,
-            stdout=True,
-            tty=False,
         )
         print(f"Successfully copied data to {pod_name}({container_name}):{dst_path}")
         return True
@@ -402,9 +1040,100 @@ def write_file_to_container(
         print(f"Failed to copy data to {pod_name}({container_name}):{dst_path}:\n{e}")
 
 
+def ensure_config_map(
+    name: str,
+    binary_data: dict[str, bytes],
+    namespace: Optional[str] = None,
+    labels: Optional[dict[str, str]] = None,
+) -> bool:
+    """
+    Create a ConfigMap holding `binary_data` unless one named `name` already exists.
+    Returns True if it was created. Callers name content-addressed ConfigMaps by hash,
+    so an existing one never needs updating.
+    """
+    namespace = get_default_namespace_or(namespace)
+    sclient = get_static_client()
+    try:
+        sclient.read_namespaced_config_map(name=name, namespace=namespace)
+        return False
+    except ApiException as e:
+        if e.status != 404:
+            raise
+    body = client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(name=name, labels=labels),
+        binary_data={k: base64.b64encode(v).decode() for k, v in binary_data.items()},
+    )
+    try:
+        sclient.create_namespaced_config_map(namespace=namespace, body=body)
+    except ApiException as e:
+        # Created by a concurrent run in the meantime
+        if e.status != 409:
+            raise
+        return False
+    return True
+
+
+def port_forward(pod_name: str, port: int, namespace: Optional[str] = None) -> PortForward:
+    """
+    Open a port-forward through the API server to `port` on a pod. The returned
+    PortForward's `socket(port)` is connected to the pod's port until `close()`.
+    """
+    namespace = get_default_namespace_or(namespace)
+    return portforward(
+        get_stream_client().connect_get_namespaced_pod_portforward,
+        pod_name,
+        namespace,
+        ports=str(port),
+    )
+
+
 def get_kubeconfig_value(jsonpath):
-    command = f"kubectl config view --minify --raw -o jsonpath={jsonpath}"
-    return run_command(command)
+    """
+    Evaluate a kubectl JSONPath such as "{.current-context}" or "{..namespace}" against the
+    minified kubeconfig, as `kubectl config view --minify --raw -o jsonpath=...` would
+    """
+    return " ".join(
+        _format_jsonpath_value(v) for v in _jsonpath(get_kubeconfig().minify(), jsonpath)
+    )
+
+
+def _jsonpath(data, jsonpath: str) -> list:
+    """The values a (dotted keys, [index] and ..recursive) kubectl JSONPath selects"""
+    path = jsonpath.strip().strip("'\"")
+    if path.startswith("{") and path.endswith("}"):
+        path = path[1:-1]
+    values = [data]
+    for recursive, key, index in re.findall(r"(\.\.?)([^.\[]*)(?:\[(\d+)\])?", path):
+        selected = []
+        for value in values:
+            candidates = _descendants(value) if recursive == ".." else [value]
+            for candidate in candidates:
+                if not key:
+                    selected.append(candidate)
+                elif isinstance(candidate, dict) and key in candidate:
+                    selected.append(candidate[key])
+        if index:
+            selected = [
+                v[int(index)] for v in selected if isinstance(v, list) and len(v) > int(index)
+            ]
+        values = selected
+    return values
+
+
+def _descendants(value) -> list:
+    found = [value]
+    children = (
+        value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    )
+    for child in children:
+        found.extend(_descendants(child))
+    return found
+
+
+def _format_jsonpath_value(value) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return str(value)
 
 
 def get_cluster_of_current_context(kubeconfig_data: dict) -> dict:
@@ -487,8 +1216,7 @@ def get_service_accounts_in_namespace(namespace):
 def can_delete_pods(namespace: Optional[str] = None) -> bool:
     namespace = get_default_namespace_or(namespace)
 
-    get_static_client()
-    auth_api = client.AuthorizationV1Api()
+    auth_api = client.AuthorizationV1Api(get_api_client())
 
     # Define the SelfSubjectAccessReview request for deleting pods
     access_review = client.V1SelfSubjectAccessReview(
@@ -534,6 +1262,10 @@ def write_kubeconfig(kube_config: dict, kubeconfig_path: str) -> None:
         with tempfile.NamedTemporaryFile("w", dir=dir_name, delete=False) as temp_file:
             yaml.safe_dump(kube_config, temp_file)
         os.replace(temp_file.name, kubeconfig_path)
+        invalidate_api_clients()
+        # The rewrite may land within the mtime tick of the version cached before it
+        with _kubeconfigs_lock:
+            _kubeconfigs.clear()
     except Exception as e:
         os.remove(temp_file.name)
         raise K8sError(f"Error writing kubeconfig: {kubeconfig_path}") from e
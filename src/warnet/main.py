@@ -1,39 +1,122 @@
+import importlib
+from typing import NamedTuple, Optional
+
 import click
+from click.shell_completion import CompletionItem
+from click.utils import make_default_short_help
 
-from .admin import admin
-from .bitcoin import bitcoin
-from .control import down, logs, run, snapshot, stop
-from .dashboard import dashboard
-from .deploy import deploy
-from .graph import create, graph
-from .image import image
-from .project import init, new, setup
-from .status import status
-from .users import auth
 
+class LazyCommand(NamedTuple):
+    # "module:attribute" of the click command
+    import_path: str
+    # The first paragraph of the command's help, which `warnet --help` lists it with
+    summary: str
+    hidden: bool = False
 
-@click.group()
-def cli():
-    pass
 
+# Subcommands are only imported once they run, so `warnet --help`, shell completion and
+# commands that never talk to the cluster don't pay for importing the kubernetes client,
+# rich, inquirer and test_framework. cli_startup_test checks these against the commands.
+LAZY_COMMANDS = {
+    "admin": LazyCommand(
+        "warnet.admin:admin", "Admin commands for warnet project management", hidden=True
+    ),
+    "auth": LazyCommand(
+        "warnet.users:auth", "Authenticate with a Warnet cluster using a kubernetes config file"
+    ),
+    "bitcoin": LazyCommand("warnet.bitcoin:bitcoin", "Control running bitcoin nodes"),
+    "create": LazyCommand("warnet.graph:create", "Create a new warnet network"),
+    "dashboard": LazyCommand(
+        "warnet.dashboard:dashboard", "Open the Warnet dashboard in default browser"
+    ),
+    "deploy": LazyCommand(
+        "warnet.deploy:deploy", "Deploy a warnet with topology loaded from <directory>"
+    ),
+    "down": LazyCommand("warnet.control:down", "Bring down a running warnet quickly"),
+    "graph": LazyCommand("warnet.graph:graph", "Create and validate network graphs", hidden=True),
+    "image": LazyCommand("warnet.image:image", "Build a custom Warnet Bitcoin Core image"),
+    "init": LazyCommand(
+        "warnet.project:init", "Initialize a warnet project in the current directory"
+    ),
+    "logs": LazyCommand("warnet.control:logs", "Show the logs of a pod"),
+    "new": LazyCommand(
+        "warnet.project:new", "Create a new warnet project in the specified directory"
+    ),
+    "restore-snapshot": LazyCommand(
+        "warnet.control:restore_snapshot",
+        "Rebuild <tank_name>'s datadir from a snapshot store (see snapshot --store)",
+    ),
+    "run": LazyCommand(
+        "warnet.control:run",
+        "Run a scenario from a file.\nPass `-- --help` to get individual scenario help",
+    ),
+    "run-batch": LazyCommand(
+        "warnet.control:run_batch", "Run many scenarios at once, as listed in a YAML <batch_file>"
+    ),
+    "setup": LazyCommand("warnet.project:setup", "Setup warnet"),
+    "snapshot": LazyCommand(
+        "warnet.control:snapshot",
+        "Create a snapshot of a tank's Bitcoin data or snapshot all tanks",
+    ),
+    "status": LazyCommand(
+        "warnet.status:status",
+        "Display the unified status of the Warnet network and active scenarios",
+    ),
+    "stop": LazyCommand("warnet.control:stop", "Stop a running scenario or all scenarios"),
+}
+
+
+class LazyGroup(click.Group):
+    """A click group importing each of its `lazy_commands` on first use"""
+
+    def __init__(self, *args, lazy_commands: dict[str, LazyCommand], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted({*super().list_commands(ctx), *self.lazy_commands})
 
-cli.add_command(admin)
-cli.add_command(auth)
-cli.add_command(bitcoin)
-cli.add_command(deploy)
-cli.add_command(down)
-cli.add_command(dashboard)
-cli.add_command(graph)
-cli.add_command(image)
-cli.add_command(init)
-cli.add_command(logs)
-cli.add_command(new)
-cli.add_command(run)
-cli.add_command(setup)
-cli.add_command(snapshot)
-cli.add_command(status)
-cli.add_command(stop)
-cli.add_command(create)
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module, attribute = self.lazy_commands[cmd_name].import_path.split(":")
+            self.add_command(getattr(importlib.import_module(module), attribute), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def short_helps(self, ctx: click.Context, limit: int = 45) -> list[tuple[str, str]]:
+        """The name and short help of each visible command, without importing any"""
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                command = self.commands[name]
+                if not command.hidden:
+                    rows.append((name, command.get_short_help_str(limit)))
+            elif not self.lazy_commands[name].hidden:
+                summary = self.lazy_commands[name].summary
+                rows.append((name, make_default_short_help(summary, limit).strip()))
+        return rows
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        names = [name for name, _ in self.short_helps(ctx)]
+        if not names:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        with formatter.section("Commands"):
+            formatter.write_dl(self.short_helps(ctx, limit))
+
+    def shell_complete(self, ctx: click.Context, incomplete: str) -> list[CompletionItem]:
+        results = [
+            CompletionItem(name, help=short_help)
+            for name, short_help in self.short_helps(ctx)
+            if name.startswith(incomplete)
+        ]
+        # Complete the group's own options
+        results.extend(click.Command.shell_complete(self, ctx, incomplete))
+        return results
+
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
+def cli():
+    pass
 
 
 if __name__ == "__main__":
@@ -1,15 +1,19 @@
 import json
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 from rich import print
 
-from .bitcoin import _rpc
 from .constants import (
     NETWORK_DIR,
     SCENARIOS_DIR,
 )
-from .k8s import get_mission
+
+if TYPE_CHECKING:
+    # Only the commands querying tanks need the kubernetes client, not `warnet new`
+    from kubernetes.client.models import V1Pod
 
 
 def copy_defaults(directory: Path, target_subdir: str, source_path: Path, exclude_list: list[str]):
@@ -53,28 +57,54 @@ def is_connection_manual(peer):
     return bool(peer.get("connection_type") == "manual" or peer.get("addnode") is True)
 
 
-def _connected(end="\n"):
-    tanks = get_mission("tank")
-    for tank in tanks:
-        # Get actual
+def get_connectivity(tanks: Optional[list["V1Pod"]] = None, jobs: int = 32) -> list[dict]:
+    """
+    Run getpeerinfo on every tank, up to `jobs` at a time, and report for each one its
+    expected (init_peers) and actual number of manual peers. A tank whose query failed
+    has its exception message in "error" and is not connected.
+    """
+    from .bitcoin import _rpc
+    from .k8s import get_mission
+
+    if tanks is None:
+        tanks = get_mission("tank")
+
+    def check(tank: "V1Pod") -> dict:
+        report = {
+            "tank": tank.metadata.name,
+            "namespace": tank.metadata.namespace,
+            "expected": int((tank.metadata.annotations or {}).get("init_peers", 0)),
+            "actual": None,
+            "connected": False,
+            "error": None,
+        }
         try:
             peerinfo = json.loads(
                 _rpc(tank.metadata.name, "getpeerinfo", "", namespace=tank.metadata.namespace)
             )
-            actual = 0
-            for peer in peerinfo:
-                if is_connection_manual(peer):
-                    actual += 1
-            expected = int(tank.metadata.annotations["init_peers"])
-            print(
-                f"Tank {tank.metadata.name} peers expected: {expected}, actual: {actual}", end=end
-            )
+            report["actual"] = sum(1 for peer in peerinfo if is_connection_manual(peer))
             # Even if more edges are specified, bitcoind only allows
             # 8 manual outbound connections
-            if min(8, expected) > actual:
-                print("\nNetwork not connected")
-                return False
-        except Exception:
+            report["connected"] = report["actual"] >= min(8, report["expected"])
+        except Exception as e:
+            report["error"] = str(e)
+        return report
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(check, tanks))
+
+
+def _connected(end="\n", tanks: Optional[list["V1Pod"]] = None, jobs: int = 32):
+    for report in get_connectivity(tanks, jobs):
+        if report["error"]:
+            print(f"\nTank {report['tank']} could not be queried: {report['error']}")
+            return False
+        print(
+            f"Tank {report['tank']} peers expected: {report['expected']}, actual: {report['actual']}",
+            end=end,
+        )
+        if not report["connected"]:
+            print("\nNetwork not connected")
             return False
     print("Network connected                                                           ")
     return True
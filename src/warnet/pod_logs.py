@@ -0,0 +1,247 @@
+import heapq
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from queue import Empty, Queue
+from typing import Iterator, NamedTuple, Optional, Union
+
+from kubernetes.client.models import V1Pod
+
+from .constants import BITCOINCORE_CONTAINER, COMMANDER_CONTAINER
+from .k8s import pod_log
+from .util import normalize_k8s_timestamp
+
+# Bytes read from a log stream at a time
+LOG_CHUNK_SIZE = 1 << 16
+# Sentinel a follower queues after the last line of its log
+LOG_END = object()
+
+
+class LogSource(NamedTuple):
+    pod: str
+    namespace: str
+    container: str
+
+
+class LogLine(NamedTuple):
+    timestamp: str
+    source: int
+    text: str
+
+
+def primary_container(pod: V1Pod) -> Optional[str]:
+    """The container `warnet logs` shows: bitcoind in a tank, the scenario in a commander"""
+    names = [container.name for container in pod.spec.containers]
+    return next(
+        (name for name in names if name in (BITCOINCORE_CONTAINER, COMMANDER_CONTAINER)), None
+    )
+
+
+def iter_log_chunks(
+    source: LogSource, follow: bool, partial_lines: bool = True, **options
+) -> Iterator[list[tuple[str, str]]]:
+    """
+    Read a pod's log with Kubernetes timestamps, yielding the (timestamp, text) of the
+    complete lines of each chunk as it arrives. Each chunk is decoded in one go. Without
+    `partial_lines`, an unterminated last line (e.g. cut off by limit_bytes) is dropped.
+    `options` are passed on to pod_log.
+    """
+    response = pod_log(
+        source.pod,
+        source.container,
+        follow=follow,
+        namespace=source.namespace,
+        timestamps=True,
+        **options,
+    )
+    finished = False
+    try:
+        partial = b""
+        for chunk in response.stream(LOG_CHUNK_SIZE):
+            data = partial + chunk
+            end = data.rfind(b"\n") + 1
+            partial = data[end:]
+            if end:
+                yield _parse_lines(data[:end])
+        finished = True
+        if partial and partial_lines:
+            yield _parse_lines(partial)
+    finally:
+        if not finished:
+            # The rest of the log is still on the wire, so the connection can't be reused
+            response.close()
+        response.release_conn()
+
+
+def _parse_lines(data: bytes) -> list[tuple[str, str]]:
+    lines = []
+    # Only "\n" ends a line: splitlines() would also split on "\r", "\x0b", "\u2028" etc.
+    raw_lines = data.decode("utf-8", errors="replace").split("\n")
+    if not raw_lines[-1]:
+        raw_lines.pop()
+    for line in raw_lines:
+        timestamp, _, text = line.partition(" ")
+        lines.append((normalize_k8s_timestamp(timestamp), text))
+    return lines
+
+
+def merged_pod_logs(
+    sources: list[LogSource],
+    follow: bool = False,
+    max_streams: int = 32,
+    buffer_lines: int = 10_000,
+    merge_window: float = 0.5,
+) -> Iterator[Union[list[LogLine], tuple[int, Exception]]]:
+    """
+    Read the logs of `sources` with at most `max_streams` log streams open at a time, and
+    yield batches of their lines merged in timestamp order. A log that can't be read
+    yields (source index, exception) instead.
+
+    Without `follow`, logs that fit in `max_streams` are merged straight from their
+    streams, so lines come out as soon as every log has been read up to them. Past that,
+    each log is spooled to a temporary file first, and only one line per log is in memory
+    while merging. Following needs a stream per log, so `sources` must fit in
+    `max_streams`; see follow_pod_logs for how those are merged.
+    """
+    if len(sources) == 1:
+        # Nothing to merge, so lines are passed on as they arrive
+        try:
+            for lines in iter_log_chunks(sources[0], follow=follow):
+                yield [LogLine(timestamp, 0, text) for timestamp, text in lines]
+        except Exception as e:
+            yield 0, e
+        return
+    if follow:
+        if len(sources) > max_streams:
+            raise ValueError(f"Can't follow {len(sources)} logs with {max_streams} streams")
+        yield from follow_pod_logs(sources, buffer_lines, merge_window)
+        return
+    if len(sources) <= max_streams:
+        errors: list[tuple[int, Exception]] = []
+
+        def stream(i: int) -> Iterator[LogLine]:
+            try:
+                for lines in iter_log_chunks(sources[i], follow=False):
+                    for timestamp, text in lines:
+                        yield LogLine(timestamp, i, text)
+            except Exception as e:
+                errors.append((i, e))
+
+        yield from _merge([stream(i) for i in range(len(sources))], buffer_lines, errors)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="warnet-logs-") as tmpdir, ExitStack() as stack:
+
+        def spool(i: int) -> str:
+            path = os.path.join(tmpdir, str(i))
+            with open(path, "w") as f:
+                for lines in iter_log_chunks(sources[i], follow=False):
+                    f.writelines(f"{timestamp} {text}\n" for timestamp, text in lines)
+            return path
+
+        with ThreadPoolExecutor(max_workers=max_streams) as executor:
+            futures = [executor.submit(spool, i) for i in range(len(sources))]
+
+        def read(i: int, path: str) -> Iterator[LogLine]:
+            for line in stack.enter_context(open(path)):
+                timestamp, _, text = line.rstrip("\n").partition(" ")
+                yield LogLine(timestamp, i, text)
+
+        streams = []
+        for i, future in enumerate(futures):
+            if future.exception():
+                yield i, future.exception()
+            else:
+                streams.append(read(i, future.result()))
+        yield from _merge(streams, buffer_lines)
+
+
+def _merge(
+    streams: list[Iterator[LogLine]],
+    buffer_lines: int,
+    errors: Optional[list[tuple[int, Exception]]] = None,
+) -> Iterator[Union[list[LogLine], tuple[int, Exception]]]:
+    """
+    Merge `streams`, each in time order already, into batches of up to `buffer_lines`.
+    Errors the streams add to `errors` as they are read are passed on as they show up.
+    """
+    errors = [] if errors is None else errors
+    batch = []
+    for line in heapq.merge(*streams):
+        while errors:
+            yield errors.pop(0)
+        batch.append(line)
+        if len(batch) >= buffer_lines:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    yield from errors
+
+
+def follow_pod_logs(
+    sources: list[LogSource], buffer_lines: int = 10_000, merge_window: float = 0.5
+) -> Iterator[Union[list[LogLine], tuple[int, Exception]]]:
+    """
+    Follow every log in `sources` at once, yielding batches of lines in timestamp order.
+
+    A line is released once every log that has had output in the last `merge_window`
+    seconds has reached its timestamp, so a quiet pod doesn't hold the others back. Lines
+    a quiet pod prints later may come out behind newer lines of busier pods. At most
+    `buffer_lines` lines are held back; past that, the oldest are released anyway.
+    """
+    queue: Queue = Queue(maxsize=max(1, buffer_lines // 100))
+
+    def follow(i: int):
+        try:
+            for lines in iter_log_chunks(sources[i], follow=True):
+                queue.put((i, lines))
+        except Exception as e:
+            queue.put((i, e))
+        else:
+            queue.put((i, LOG_END))
+
+    for i in range(len(sources)):
+        threading.Thread(target=follow, args=(i,), daemon=True).start()
+
+    heap: list[LogLine] = []
+    # The newest timestamp read from each log, and when it last had output. Logs start as
+    # active, so the first lines wait a moment for the other logs to start too.
+    started = time.monotonic()
+    latest = {i: "" for i in range(len(sources))}
+    last_output = {i: started for i in range(len(sources))}
+    running = set(range(len(sources)))
+    while running or heap:
+        items = []
+        try:
+            if running:
+                items.append(queue.get(timeout=merge_window if heap else None))
+            while True:
+                items.append(queue.get_nowait())
+        except Empty:
+            pass
+        now = time.monotonic()
+        for i, lines in items:
+            if lines is LOG_END or isinstance(lines, Exception):
+                running.discard(i)
+                if lines is not LOG_END:
+                    yield i, lines
+            elif lines:
+                for timestamp, text in lines:
+                    heapq.heappush(heap, LogLine(timestamp, i, text))
+                latest[i] = lines[-1][0]
+                last_output[i] = now
+
+        # No active log can still print a line older than the watermark
+        active = [latest[i] for i in running if now - last_output[i] < merge_window]
+        watermark = min(active, default=None)
+        batch = []
+        while heap and (
+            watermark is None or heap[0].timestamp <= watermark or len(heap) > buffer_lines
+        ):
+            batch.append(heapq.heappop(heap))
+        if batch:
+            yield batch
@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+# ConfigMaps are limited to 1 MiB, including the base64 overhead of binary data
+CONFIG_MAP_LIMIT = 700_000
+# Fixed timestamp for archive members, so the same sources always give the same bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+SKIPPED_SUFFIXES = (".pyc", ".csv", ".DS_Store")
+
+
+def scenario_sources(scenario_path: Path, scenario_dir: Path) -> list[Path]:
+    """Files of `scenario_dir` a scenario archive includes, without test_framework"""
+    sources = []
+    for path in sorted(scenario_dir.rglob("*")):
+        relative = path.relative_to(scenario_dir)
+        if not path.is_file() or path.name.endswith(SKIPPED_SUFFIXES):
+            continue
+        if relative.parts[0] == "test_framework":
+            continue
+        if path.name in ("__init__.py", "commander.py") or path == scenario_path:
+            sources.append(path)
+    return sources
+
+
+def test_framework_sources(scenario_dir: Path) -> list[Path]:
+    return sorted(
+        path
+        for path in (scenario_dir / "test_framework").rglob("*")
+        if path.is_file() and not path.name.endswith(SKIPPED_SUFFIXES)
+    )
+
+
+def sources_digest(sources: list[Path], root: Path, main: Optional[str] = None) -> str:
+    digest = hashlib.sha256(f"{main}\n".encode())
+    for path in sources:
+        data = path.read_bytes()
+        digest.update(f"{path.relative_to(root).as_posix()}\n{len(data)}\n".encode())
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def build_archive(sources: list[Path], root: Path, main: Optional[str] = None) -> bytes:
+    """
+    A zip of `sources` relative to `root`. With `main` ("module:function") it is a zipapp
+    calling that function, as `zipapp.create_archive` would build.
+    """
+    buffer = io.BytesIO()
+    if main:
+        buffer.write(b"#!/usr/bin/env python3\n")
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path in sources:
+            info = zipfile.ZipInfo(path.relative_to(root).as_posix(), ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, path.read_bytes())
+        if main:
+            module, function = main.split(":")
+            info = zipfile.ZipInfo("__main__.py", ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, f"import {module}\n{module}.{function}()\n")
+    return buffer.getvalue()
+
+
+def cached_archive(
+    sources: list[Path], root: Path, cache_dir: Path, main: Optional[str] = None
+) -> tuple[str, bytes]:
+    """
+    The sha256 of `sources` and their archive, built once per content and kept in
+    `cache_dir`. Hashing the sources is much cheaper than compressing them again.
+    """
+    digest = sources_digest(sources, root, main)
+    path = cache_dir / f"{digest}.zip"
+    try:
+        return digest, path.read_bytes()
+    except FileNotFoundError:
+        pass
+    data = build_archive(sources, root, main)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        # The cache only saves time; a read-only cache dir is fine
+        pass
+    return digest, data
+
+
+def scenario_module(scenario_path: Path, scenario_dir: Path) -> str:
+    """
+    The module name of a scenario file in its archive. In case the scenario file is not in
+    the root of the archive directory it is a submodule, and the user must have included
+    an __init__.py.
+    """
+    relative_name = scenario_path.relative_to(scenario_dir).with_suffix("")
+    return ".".join(relative_name.parts)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+# Files are split into fixed-size chunks. Block files only ever grow and leveldb files
+# never change once written, so fixed offsets dedupe them as well as content-defined
+# chunking would.
+CHUNK_SIZE = 1 << 20
+STORE_VERSION = 1
+
+
+class SnapshotStore:
+    """
+    A content-addressed store of tank datadir snapshots. Files are split into chunks kept
+    once under chunks/ by their sha256, whatever tank or snapshot they came from, and each
+    whole file's chunk list is indexed under files/ by the file's sha256. A snapshot is a
+    manifest per tank under manifests/<snapshot name>/<tank>.json mapping datadir paths to
+    file hashes.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.new_chunks = 0
+        self.new_bytes = 0
+        self._written: set[str] = set()
+        self._lock = threading.Lock()
+        for subdir in ["chunks", "files", "manifests"]:
+            (self.directory / subdir).mkdir(parents=True, exist_ok=True)
+
+    def _path(self, kind: str, digest: str, suffix: str = "") -> Path:
+        return self.directory / kind / digest[:2] / f"{digest}{suffix}"
+
+    def _write(self, path: Path, data: bytes) -> None:
+        # Write then rename, so readers and concurrent writers of the same object never
+        # see a partial file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get_file(self, digest: str) -> Optional[dict]:
+        """The {"size", "chunks"} index of a file by its sha256, if the store has it"""
+        try:
+            with open(self._path("files", digest, ".json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def add_file(self, stream: BinaryIO) -> str:
+        """Store the contents of `stream` and return its sha256"""
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        while chunk := stream.read(CHUNK_SIZE):
+            file_hash.update(chunk)
+            size += len(chunk)
+            digest = hashlib.sha256(chunk).hexdigest()
+            path = self._path("chunks", digest)
+            if not path.exists():
+                self._write(path, zlib.compress(chunk))
+                # Tanks snapshotted concurrently may both write the same new chunk
+                with self._lock:
+                    if digest not in self._written:
+                        self._written.add(digest)
+                        self.new_chunks += 1
+                        self.new_bytes += len(chunk)
+            chunks.append(digest)
+        digest = file_hash.hexdigest()
+        # The index is written last, so a file in the index always has all its chunks
+        index = self._path("files", digest, ".json")
+        if not index.exists():
+            self._write(index, json.dumps({"size": size, "chunks": chunks}).encode())
+        return digest
+
+    def read_file(self, digest: str) -> Iterator[bytes]:
+        """Yield the contents of a stored file chunk by chunk, verifying its hash"""
+        index = self.get_file(digest)
+        if index is None:
+            raise FileNotFoundError(f"File {digest} is not in the snapshot store")
+        file_hash = hashlib.sha256()
+        for chunk_digest in index["chunks"]:
+            with open(self._path("chunks", chunk_digest), "rb") as f:
+                chunk = zlib.decompress(f.read())
+            file_hash.update(chunk)
+            yield chunk
+        if file_hash.hexdigest() != digest:
+            raise ValueError(f"File {digest} is corrupt in the snapshot store")
+
+    def write_manifest(
+        self, name: str, tank: str, namespace: str, chain: str, files: dict[str, str]
+    ) -> dict:
+        manifest = {
+            "version": STORE_VERSION,
+            "name": name,
+            "tank": tank,
+            "namespace": namespace,
+            "chain": chain,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "files": dict(sorted(files.items())),
+        }
+        self._write(self.manifest_path(name, tank), json.dumps(manifest, indent=2).encode())
+        return manifest
+
+    def manifest_path(self, name: str, tank: str) -> Path:
+        return self.directory / "manifests" / name / f"{tank}.json"
+
+    def snapshots(self) -> list[str]:
+        """Snapshot names, oldest first"""
+        manifests = self.directory / "manifests"
+        return sorted(
+            (p.name for p in manifests.iterdir() if p.is_dir()),
+            key=lambda name: (manifests / name).stat().st_mtime,
+        )
+
+    def read_manifest(self, tank: str, name: Optional[str] = None) -> dict:
+        """The manifest of `tank` in snapshot `name`, or in the latest snapshot holding it"""
+        names = [name] if name else reversed(self.snapshots())
+        for snapshot in names:
+            path = self.manifest_path(snapshot, tank)
+            if path.exists():
+                with open(path) as f:
+                    return json.load(f)
+        raise FileNotFoundError(f"No snapshot of {tank} in {self.directory}")
+
+    def restore(self, manifest: dict, destination: Path) -> None:
+        """
+        Rebuild a tank's datadir from its manifest into `destination`. Nothing is written if
+        any of its paths would land outside `destination`.
+        """
+        destination = Path(destination).resolve()
+        targets = {}
+        for path, digest in manifest["files"].items():
+            target = (destination / path).resolve()
+            if target == destination or not target.is_relative_to(destination):
+                raise ValueError(f"Snapshot path {path} is outside {destination}")
+            targets[target] = digest
+        for target, digest in targets.items():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as f:
+                for chunk in self.read_file(digest):
+                    f.write(chunk)
+
+    def write_tar(self, manifest: dict, fileobj: BinaryIO, compression: str = "gz") -> None:
+        """
+        Write a tank's datadir from its manifest as a tarball, in the layout the loadSnapshot
+        init container extracts into the datadir for its chain
+        """
+        with tarfile.open(fileobj=fileobj, mode=f"w|{compression}") as tar:
+            for path, digest in manifest["files"].items():
+                info = tarfile.TarInfo(f"./{path}")
+                info.size = self.get_file(digest)["size"]
+                info.mtime = int(datetime.fromisoformat(manifest["created"]).timestamp())
+                info.mode = 0o644
+                tar.addfile(info, _ChunkReader(self.read_file(digest)))
+
+
+class _ChunkReader:
+    """A minimal readable file over an iterator of byte chunks, for tarfile.addfile()"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._chunk = b""
+        self._offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        parts = []
+        while size != 0:
+            if self._offset == len(self._chunk):
+                self._chunk = next(self._chunks, b"")
+                self._offset = 0
+                if not self._chunk:
+                    break
+            end = len(self._chunk) if size < 0 else min(len(self._chunk), self._offset + size)
+            parts.append(self._chunk[self._offset : end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+        return b"".join(parts)
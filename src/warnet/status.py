@@ -1,25 +1,62 @@
+import json
 import sys
+import threading
+from collections import Counter
+from contextlib import nullcontext, suppress
+from typing import Optional
 
 import click
+from kubernetes.client.models import V1Pod
 from kubernetes.config.config_exception import ConfigException
-from rich.console import Console
+from rich.console import Console, Group
+from rich.live import Live
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 from urllib3.exceptions import MaxRetryError
 
-from .k8s import get_mission
-from .network import _connected
+from .constants import BITCOINCORE_CONTAINER, COMMANDER_MISSION, TANK_MISSION
+from .k8s import get_mission, get_pod_informer, get_pods
+from .network import _connected, get_connectivity
+
+STATUS_SELECTOR = f"mission in ({TANK_MISSION},{COMMANDER_MISSION})"
+ACTIVE_PHASES = ("running", "pending")
 
 
 @click.command()
-def status():
+@click.option(
+    "--output",
+    "-o",
+    type=click.Choice(["table", "summary", "json"]),
+    default="table",
+    show_default=True,
+    help="A table of every pod, counts by phase, namespace and version, or JSON",
+)
+@click.option("--watch", "-w", is_flag=True, help="Keep the status current as pods change")
+@click.option(
+    "--connectivity/--no-connectivity",
+    default=None,
+    help="Check every tank's peers over RPC (default: only for table output)",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=32,
+    show_default=True,
+    help="Number of tanks to check connectivity of at a time",
+)
+def status(output: str, watch: bool, connectivity: Optional[bool], jobs: int):
     """Display the unified status of the Warnet network and active scenarios"""
-    console = Console()
+    if watch:
+        if connectivity:
+            raise click.UsageError("--connectivity can't be combined with --watch")
+        with suppress(KeyboardInterrupt):
+            _watch_status(output)
+        return
 
     try:
-        tanks = _get_tank_status()
-        scenarios = _get_deployed_scenarios()
+        tank_pods, commander_pods = _get_status_pods()
     except ConfigException as e:
         print(e)
         print(
@@ -40,6 +77,130 @@ def status():
         )
         sys.exit(1)
 
+    tanks = [_pod_status(tank) for tank in tank_pods]
+    scenarios = [_pod_status(commander) for commander in commander_pods]
+    if connectivity is None:
+        connectivity = output == "table"
+
+    if output == "json":
+        document = {
+            "tanks": tanks,
+            "scenarios": scenarios,
+            "summary": _summarize(tanks, scenarios),
+        }
+        if connectivity:
+            document["connectivity"] = get_connectivity(tank_pods, jobs)
+        print(json.dumps(document, indent=2))
+        return
+
+    console = Console()
+    if output == "summary":
+        console.print(_render_summary(_summarize(tanks, scenarios)))
+        if connectivity:
+            reports = get_connectivity(tank_pods, jobs)
+            connected = sum(1 for report in reports if report["connected"])
+            console.print(f"Connected tanks: {connected}/{len(reports)}")
+        return
+
+    console.print(_render_table(tanks, scenarios))
+    if connectivity:
+        _connected(end="\r", tanks=tank_pods, jobs=jobs)
+
+
+def _watch_status(output: str, stop: Optional[threading.Event] = None) -> None:
+    """
+    Follow the status from one pod LIST and WATCH, redrawing (or for JSON, printing a line
+    with the new summary) only when what is shown changes, until `stop` is set
+    """
+    informer = get_pod_informer()
+    console = Console()
+    revision = None
+    shown = None
+    live = nullcontext() if output == "json" else Live(console=console, auto_refresh=False)
+    with live:
+        while not (stop and stop.is_set()):
+            if not informer.wait_for(lambda i, seen=revision: i.revision != seen, 0.5):
+                if not informer.synced and informer.last_error:
+                    raise click.ClickException(f"Could not list pods: {informer.last_error}")
+                continue
+            revision = informer.revision
+            tanks = [_pod_status(tank) for tank in informer.pods(TANK_MISSION)]
+            scenarios = [_pod_status(c) for c in informer.pods(COMMANDER_MISSION)]
+            tanks.sort(key=lambda tank: (tank["namespace"], tank["name"]))
+            scenarios.sort(key=lambda scenario: (scenario["namespace"], scenario["name"]))
+            view = (tanks, scenarios) if output == "table" else _summarize(tanks, scenarios)
+            if view == shown:
+                # e.g. a pod's resourceVersion moved on but nothing we show changed
+                continue
+            shown = view
+            if output == "json":
+                print(json.dumps({"summary": view}), flush=True)
+            elif output == "table":
+                live.update(_render_table(tanks, scenarios), refresh=True)
+            else:
+                live.update(_render_summary(view), refresh=True)
+
+
+def _get_status_pods() -> tuple[list[V1Pod], list[V1Pod]]:
+    """Tanks and commanders, from a single pod listing"""
+    pods = get_pods(label_selector=STATUS_SELECTOR)
+    missions = [(pod.metadata.labels or {}).get("mission") for pod in pods]
+    return (
+        [pod for pod, mission in zip(pods, missions) if mission == TANK_MISSION],
+        [pod for pod, mission in zip(pods, missions) if mission == COMMANDER_MISSION],
+    )
+
+
+def _pod_status(pod: V1Pod) -> dict:
+    status = {
+        "name": pod.metadata.name,
+        "status": pod.status.phase.lower(),
+        "namespace": pod.metadata.namespace,
+    }
+    if (pod.metadata.labels or {}).get("mission") == TANK_MISSION:
+        status["version"] = _image_version(pod)
+    return status
+
+
+def _image_version(pod: V1Pod) -> str:
+    """The tag of the tank's bitcoin image, e.g. "27.0" for bitcoindevproject/bitcoin:27.0"""
+    image = next(
+        (c.image for c in pod.spec.containers if c.name == BITCOINCORE_CONTAINER),
+        pod.spec.containers[0].image if pod.spec.containers else "",
+    )
+    name, _, tag = image.split("@")[0].rpartition(":")
+    # A colon before the last slash belongs to the registry's port
+    return tag if name and "/" not in tag else "latest"
+
+
+def _summarize(tanks: list[dict], scenarios: list[dict]) -> dict:
+    def counts(items: list[dict], key: str) -> dict[str, int]:
+        return dict(sorted(Counter(item[key] for item in items).items()))
+
+    return {
+        "tanks": {
+            "total": len(tanks),
+            "status": counts(tanks, "status"),
+            "namespace": counts(tanks, "namespace"),
+            "version": counts(tanks, "version"),
+        },
+        "scenarios": {
+            "total": len(scenarios),
+            "active": sum(1 for s in scenarios if s["status"] in ACTIVE_PHASES),
+            "status": counts(scenarios, "status"),
+            "namespace": counts(scenarios, "namespace"),
+        },
+    }
+
+
+def _totals(tanks: int, active: int) -> Text:
+    totals = Text()
+    totals.append(f"\nTotal Tanks: {tanks}", style="bold cyan")
+    totals.append(f" | Active Scenarios: {active}", style="bold green")
+    return totals
+
+
+def _render_table(tanks: list[dict], scenarios: list[dict]) -> Group:
     # Create a unified table
     table = Table(title="Warnet Status", show_header=True, header_style="bold magenta")
     table.add_column("Component", style="cyan")
@@ -60,7 +221,7 @@ def status():
     if scenarios:
         for scenario in scenarios:
             table.add_row("Scenario", scenario["name"], scenario["status"], scenario["namespace"])
-            if scenario["status"] == "running" or scenario["status"] == "pending":
+            if scenario["status"] in ACTIVE_PHASES:
                 active += 1
     else:
         table.add_row("Scenario", "No active scenarios", "")
@@ -73,37 +234,27 @@ def status():
         border_style="blue",
         padding=(1, 1),
     )
-
-    # Print the panel
-    console.print(panel)
-
-    # Print summary
-    summary = Text()
-    summary.append(f"\nTotal Tanks: {len(tanks)}", style="bold cyan")
-    summary.append(f" | Active Scenarios: {active}", style="bold green")
-    console.print(summary)
-    _connected(end="\r")
+    return Group(panel, _totals(len(tanks), active))
 
 
-def _get_tank_status():
-    tanks = get_mission("tank")
-    return [
-        {
-            "name": tank.metadata.name,
-            "status": tank.status.phase.lower(),
-            "namespace": tank.metadata.namespace,
-        }
-        for tank in tanks
-    ]
+def _render_summary(summary: dict) -> Group:
+    table = Table(title="Warnet Summary", show_header=True, header_style="bold magenta")
+    table.add_column("Component", style="cyan")
+    table.add_column("By", style="green")
+    table.add_column("Value", style="yellow")
+    table.add_column("Count", justify="right")
+    for component, key in [
+        ("Tanks", "status"),
+        ("Tanks", "namespace"),
+        ("Tanks", "version"),
+        ("Scenarios", "status"),
+        ("Scenarios", "namespace"),
+    ]:
+        for value, count in summary[component.lower()][key].items():
+            table.add_row(component, key, value, str(count))
+    panel = Panel(table, title="Warnet Overview", expand=False, border_style="blue")
+    return Group(panel, _totals(summary["tanks"]["total"], summary["scenarios"]["active"]))
 
 
 def _get_deployed_scenarios():
-    commanders = get_mission("commander")
-    return [
-        {
-            "name": c.metadata.name,
-            "status": c.status.phase.lower(),
-            "namespace": c.metadata.namespace,
-        }
-        for c in commanders
-    ]
+    return [_pod_status(commander) for commander in get_mission(COMMANDER_MISSION)]
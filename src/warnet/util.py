@@ -1,7 +1,46 @@
+from datetime import datetime, timezone
+
+
 def create_cycle_graph(n: int, version: str, bitcoin_conf: str | None, random_version: bool):
     raise NotImplementedError("create_cycle_graph function is not implemented")
 
 
+DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_duration(value: str) -> int:
+    """
+    Parse a duration like "90", "30s", "10m", "2h" or "1d" into whole seconds.
+    Raises ValueError if the string is not a duration.
+    """
+    value = value.strip().lower()
+    if value[-1:] in DURATION_UNITS:
+        return int(value[:-1]) * DURATION_UNITS[value[-1]]
+    return int(value)
+
+
+def normalize_k8s_timestamp(timestamp: str) -> str:
+    """
+    Pad the fractional seconds of an RFC3339 timestamp from the Kubernetes log API to
+    nanoseconds, so timestamps compare correctly as strings.
+    """
+    head, _, fraction = timestamp.rstrip("Z").partition(".")
+    return f"{head}.{fraction:0<9}Z"
+
+
+def k8s_timestamp(moment: datetime) -> str:
+    """`moment` as a normalized Kubernetes log timestamp, see normalize_k8s_timestamp"""
+    moment = moment.astimezone(timezone.utc)
+    return normalize_k8s_timestamp(f"{moment:%Y-%m-%dT%H:%M:%S.%f}Z")
+
+
+def parse_k8s_timestamp(timestamp: str) -> datetime:
+    """The time of a Kubernetes log timestamp, to the microsecond"""
+    head, _, fraction = timestamp.rstrip("Z").partition(".")
+    moment = datetime.strptime(head, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return moment.replace(microsecond=int(f"{fraction:0<6}"[:6]))
+
+
 def parse_bitcoin_conf(file_content):
     """
     Custom parser for INI-style bitcoin.conf
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import io
+import random
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from test_base import TestBase
+from test_framework.messages import (
+    CBlock,
+    CBlockHeader,
+    CInv,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxInWitness,
+    CTxOut,
+    P2PHeaderAndShortIDs,
+    PrefilledTransaction,
+    msg_block,
+    msg_cmpctblock,
+    msg_headers,
+    msg_inv,
+    msg_ping,
+    msg_verack,
+)
+
+from warnet.bitcoin import query_messages
+from warnet.capture import (
+    CAPTURE_HEADER,
+    CaptureStore,
+    build_capture_store,
+    iter_raw_messages,
+)
+
+# 2024-01-01T00:00:00Z in microseconds
+START = 1704067200 * 1_000_000
+
+
+class CaptureStoreTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.capture_dir = self.tmpdir / "raw"
+        self.store_dir = self.tmpdir / "store"
+        self.peer_names = {"10.0.0.1": "tank-0000.default", "10.96.0.2": "tank-0001.default"}
+
+    def run_test(self):
+        self.write_captures()
+        self.check_build()
+        self.check_queries()
+        self.check_payloads()
+        self.check_command()
+        self.check_decode_levels()
+
+    def write_capture(self, path, seed: int, count: int):
+        rand = random.Random(seed)
+        payloads = [
+            (b"ping", msg_ping(1).serialize()),
+            (b"inv", msg_inv([CInv(1, rand.getrandbits(256))]).serialize()),
+            (b"verack", msg_verack().serialize()),
+        ]
+        time = START + seed
+        with path.open("wb") as f:
+            for _ in range(count):
+                time += rand.randint(1, 1_000_000)
+                msgtype, payload = rand.choice(payloads)
+                f.write(CAPTURE_HEADER.pack(time, msgtype, len(payload)) + payload)
+
+    def write_captures(self):
+        self.log.info("Writing captures for two tanks")
+        layout = {
+            "tank-0000.default": ["10.96.0.2_18444", "10.0.0.9_40000"],
+            "tank-0001.default": ["10.0.0.1_39000"],
+        }
+        seed = 0
+        for tank, peers in layout.items():
+            for peer in peers:
+                peer_dir = self.capture_dir / tank / peer
+                peer_dir.mkdir(parents=True)
+                for file in ["msgs_recv.dat", "msgs_sent.dat"]:
+                    seed += 1
+                    self.write_capture(peer_dir / file, seed, 500)
+
+    def expected(self) -> list[dict]:
+        records = []
+        for path in sorted(self.capture_dir.glob("*/*/*.dat")):
+            tank = path.parent.parent.name
+            address = path.parent.name.rsplit("_", 1)[0]
+            peer = self.peer_names.get(address, path.parent.name)
+            outbound = path.name == "msgs_sent.dat"
+            for record in iter_raw_messages(path.read_bytes(), outbound, decode=(), offsets=True):
+                record.update(tank=tank, peer=peer, file=str(path.relative_to(self.capture_dir)))
+                records.append(record)
+        return records
+
+    def check_build(self):
+        self.log.info("Building the store")
+        rows = build_capture_store(self.capture_dir, self.store_dir, self.peer_names)
+        assert rows == 3000
+        with CaptureStore(self.store_dir) as store:
+            assert len(store) == 3000
+            assert store.tanks == ["tank-0000.default", "tank-0001.default"]
+            assert set(store.peers) == {"tank-0001.default", "10.0.0.9_40000", "tank-0000.default"}
+
+    def check_queries(self):
+        self.log.info("Checking queries against a scan of the raw files")
+        expected = self.expected()
+        cases = [
+            {},
+            {"msgtypes": {"inv"}},
+            {"tanks": {"tank-0001.default"}},
+            {"peers": {"tank-0001.default"}, "outbound": True},
+            {"start": START + 200_000_000, "end": START + 400_000_000, "msgtypes": {"ping"}},
+        ]
+        with CaptureStore(self.store_dir) as store:
+            for filters in cases:
+                matches = [
+                    r
+                    for r in expected
+                    if ("msgtypes" not in filters or r["msgtype"] in filters["msgtypes"])
+                    and ("tanks" not in filters or r["tank"] in filters["tanks"])
+                    and ("peers" not in filters or r["peer"] in filters["peers"])
+                    and ("outbound" not in filters or r["outbound"] == filters["outbound"])
+                    and ("start" not in filters or r["time"] >= filters["start"])
+                    and ("end" not in filters or r["time"] < filters["end"])
+                ]
+                results = list(store.query(**filters))
+                times = [r["time"] for r in results]
+                assert times == sorted(times), f"{filters} not in time order"
+                key = lambda r: (r["time"], r["tank"], r["file"], r["offset"])  # noqa: E731
+                assert sorted(results, key=key) == sorted(matches, key=key), filters
+                self.log.info(f"{filters}: {len(results)} records")
+
+    def check_payloads(self):
+        self.log.info("Checking payload offsets point at the raw messages")
+        with CaptureStore(self.store_dir) as store:
+            for record in store.query(msgtypes={"ping"}):
+                assert store.payload(record, self.capture_dir) == msg_ping(1).serialize()
+
+    def check_command(self):
+        self.log.info("Checking query-messages")
+        output = io.StringIO()
+        with redirect_stdout(output):
+            query_messages.main(
+                [str(self.store_dir), "--tank", "tank-0000", "--msgtype", "verack", "--count"],
+                standalone_mode=False,
+            )
+        expected = [
+            r
+            for r in self.expected()
+            if r["tank"] == "tank-0000.default" and r["msgtype"] == "verack"
+        ]
+        assert int(output.getvalue()) == len(expected)
+
+        output = io.StringIO()
+        until = datetime.fromtimestamp((START + 50_000_000) / 1e6, timezone.utc).isoformat()
+        with redirect_stdout(output):
+            query_messages.main(
+                [str(self.store_dir), "--until", until, "--direction", "sent"],
+                standalone_mode=False,
+            )
+        lines = output.getvalue().splitlines()
+        assert lines and all(" >>> " in line for line in lines)
+        assert lines[0].startswith("2024-01-01 00:00:")
+
+    def check_decode_levels(self):
+        self.log.info("Checking header and summary decode levels")
+        rand = random.Random(1)
+        txs = []
+        for i in range(3):
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(rand.getrandbits(256), i), b"\x51")]
+            tx.vout = [CTxOut(1000 * i, b"\x00\x14" + rand.randbytes(20))]
+            if i:
+                tx.wit.vtxinwit = [CTxInWitness()]
+                tx.wit.vtxinwit[0].scriptWitness.stack = [rand.randbytes(72)]
+            txs.append(tx)
+        block = CBlock()
+        block.hashPrevBlock = rand.getrandbits(256)
+        block.vtx = txs
+        headers = [CBlockHeader() for _ in range(5)]
+        for i, header in enumerate(headers):
+            header.nNonce = i
+        compact = P2PHeaderAndShortIDs()
+        compact.header = CBlockHeader(block)
+        compact.shortids = [rand.getrandbits(48) for _ in range(7)]
+        compact.shortids_length = 7
+        compact.prefilled_txn = [PrefilledTransaction(0, txs[0])]
+        compact.prefilled_txn_length = 1
+        hashes = [rand.getrandbits(256) for _ in range(4)]
+        messages = [
+            (b"block", msg_block(block)),
+            (b"headers", msg_headers(headers)),
+            (b"cmpctblock", msg_cmpctblock(compact)),
+            (b"inv", msg_inv([CInv(1, h) for h in hashes])),
+            (b"ping", msg_ping(7)),
+        ]
+        data = b"".join(
+            CAPTURE_HEADER.pack(START + i, msgtype, len(payload)) + payload
+            for i, (msgtype, payload) in enumerate(
+                (msgtype, msg.serialize()) for msgtype, msg in messages
+            )
+        )
+
+        header_only = list(iter_raw_messages(data, False, level="header"))
+        assert [m["msgtype"] for m in header_only] == [
+            "block",
+            "headers",
+            "cmpctblock",
+            "inv",
+            "ping",
+        ]
+        assert all("body" not in m for m in header_only)
+
+        block.rehash()
+        summaries = {
+            m["msgtype"]: m["body"] for m in iter_raw_messages(data, False, level="summary")
+        }
+        assert summaries["block"] == {
+            "hash": block.hash,
+            "prev": f"{block.hashPrevBlock:064x}",
+            "tx_count": 3,
+            "txids": [tx.rehash() for tx in txs],
+        }, summaries["block"]
+        for header in headers:
+            header.rehash()
+        assert summaries["headers"] == {
+            "count": 5,
+            "first": headers[0].hash,
+            "last": headers[-1].hash,
+        }
+        assert summaries["cmpctblock"] == {"hash": block.hash, "shortids": 7, "prefilled": 1}
+        assert summaries["inv"] == {
+            "count": 4,
+            "first": f"{hashes[0]:064x}",
+            "last": f"{hashes[-1]:064x}",
+        }
+        # Messages without a summarizer are decoded in full
+        full = {m["msgtype"]: m["body"] for m in iter_raw_messages(data, False)}
+        assert summaries["ping"] == full["ping"] == {"nonce": 7}
+        assert len(full["block"]["block"]["vtx"]) == 3
+
+
+if __name__ == "__main__":
+    test = CaptureStoreTest()
+    test.run_test()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import subprocess
+import sys
+
+from click.utils import make_default_short_help
+from test_base import TestBase
+
+from warnet.main import LAZY_COMMANDS, cli
+
+# Runs `warnet <args>` and reports how long importing and running it took, and which
+# modules it imported
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from warnet.main import cli
+try:
+    cli(sys.argv[1:], prog_name="warnet")
+except SystemExit:
+    pass
+json.dump({"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}, sys.stderr)
+"""
+
+HEAVY = ("kubernetes", "rich", "inquirer", "yaml", "test_framework")
+
+# Startup budget of each command in milliseconds, and the heavy modules it must not import.
+# Budgets leave room for slow CI machines; importing everything takes about a second.
+STARTUP_BUDGETS = {
+    ("--help",): (300, HEAVY),
+    ("image", "--help"): (300, ("kubernetes", "rich", "inquirer", "test_framework")),
+    ("new", "--help"): (800, ("kubernetes", "test_framework")),
+    ("create", "--help"): (800, ("kubernetes", "rich", "test_framework")),
+    ("status", "--help"): (2500, ("inquirer", "test_framework")),
+    ("logs", "--help"): (2500, ("inquirer", "test_framework")),
+    ("bitcoin", "--help"): (2500, ("inquirer", "test_framework")),
+}
+
+
+class CliStartupTest(TestBase):
+    def run_test(self):
+        self.check_lazy_commands()
+        self.check_budgets()
+        self.check_completion()
+
+    def warnet(self, *args: str, env: dict = None) -> tuple[str, dict]:
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD, *args],
+            env={**os.environ, **(env or {})},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout, json.loads(result.stderr)
+
+    def check_lazy_commands(self):
+        self.log.info("Checking each lazy command against the command it imports")
+        with cli.make_context("warnet", ["--help"], resilient_parsing=True) as ctx:
+            for name, lazy in LAZY_COMMANDS.items():
+                command = cli.get_command(ctx, name)
+                assert command.name == name, (name, command.name)
+                assert command.hidden == lazy.hidden, name
+                # Up to a limit no summary reaches, so the whole text is compared
+                for limit in (45, 80, 1000):
+                    expected = command.get_short_help_str(limit)
+                    assert make_default_short_help(lazy.summary, limit) == expected, name
+                # A summary is a line of its own in `warnet --help`
+                assert not lazy.summary.endswith((":", ".")), name
+
+    def check_budgets(self):
+        for args, (budget, forbidden) in STARTUP_BUDGETS.items():
+            # The first run warms up the filesystem cache
+            self.warnet(*args)
+            stdout, report = min(
+                (self.warnet(*args) for _ in range(3)), key=lambda r: r[1]["seconds"]
+            )
+            milliseconds = report["seconds"] * 1000
+            self.log.info(f"warnet {' '.join(args)}: {milliseconds:.0f}ms (budget {budget}ms)")
+            assert stdout.startswith("Usage: warnet"), stdout
+            imported = {module.split(".")[0] for module in report["modules"]}
+            assert not imported & set(forbidden), (args, imported & set(forbidden))
+            assert milliseconds < budget, (args, milliseconds)
+
+    def check_completion(self):
+        self.log.info("Completing command names without importing any command")
+        stdout, report = self.warnet(
+            env={"_WARNET_COMPLETE": "bash_complete", "COMP_WORDS": "warnet st", "COMP_CWORD": "1"}
+        )
+        assert stdout.split() == ["plain,status", "plain,stop"], stdout
+        imported = {module.split(".")[0] for module in report["modules"]}
+        assert not imported & set(HEAVY), imported & set(HEAVY)
+
+
+if __name__ == "__main__":
+    test = CliStartupTest()
+    test.run_test()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import threading
+import time
+from contextlib import redirect_stdout
+
+from kubernetes.client.models import V1ObjectMeta, V1Pod
+from test_base import TestBase
+
+from warnet import bitcoin
+from warnet.bitcoin import RPCError
+from warnet.network import _connected, get_connectivity
+
+MANUAL_PEER = {"connection_type": "manual"}
+INBOUND_PEER = {"connection_type": "inbound"}
+
+
+def tank(name: str, init_peers: int) -> V1Pod:
+    return V1Pod(
+        metadata=V1ObjectMeta(
+            name=name, namespace="default", annotations={"init_peers": str(init_peers)}
+        )
+    )
+
+
+class ConnectivityTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.peers: dict[str, list[dict]] = {}
+        self.failing: set[str] = set()
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def run_test(self):
+        rpc = bitcoin._rpc
+        bitcoin._rpc = self.fake_rpc
+        try:
+            self.check_report()
+            self.check_errors()
+        finally:
+            bitcoin._rpc = rpc
+
+    def fake_rpc(self, tank: str, method: str, params, namespace=None) -> str:
+        """Stands in for bitcoin._rpc, answering getpeerinfo after a moment"""
+        assert method == "getpeerinfo", method
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.05)
+            if tank in self.failing:
+                raise RPCError(-28, "Loading block index…")
+            return json.dumps(self.peers[tank])
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def check_report(self):
+        self.log.info("Reporting expected and actual manual peers of each tank concurrently")
+        tanks = [tank(f"tank-{i:04d}", 2) for i in range(12)]
+        for pod in tanks:
+            self.peers[pod.metadata.name] = [MANUAL_PEER, MANUAL_PEER, INBOUND_PEER]
+        # More edges than bitcoind makes manual connections
+        tanks.append(tank("tank-hub", 10))
+        self.peers["tank-hub"] = [MANUAL_PEER] * 8
+        self.peers["tank-0005"] = [MANUAL_PEER, INBOUND_PEER]
+
+        report = get_connectivity(tanks, jobs=4)
+        assert [r["tank"] for r in report] == [pod.metadata.name for pod in tanks]
+        assert self.max_running == 4, self.max_running
+        by_tank = {r["tank"]: r for r in report}
+        assert by_tank["tank-0000"] == {
+            "tank": "tank-0000",
+            "namespace": "default",
+            "expected": 2,
+            "actual": 2,
+            "connected": True,
+            "error": None,
+        }
+        assert by_tank["tank-hub"]["connected"] and by_tank["tank-hub"]["actual"] == 8
+        assert not by_tank["tank-0005"]["connected"] and by_tank["tank-0005"]["actual"] == 1
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            assert not _connected(tanks=tanks)
+        assert "Network not connected" in output.getvalue()
+
+    def check_errors(self):
+        self.log.info("Reporting tanks that can't be queried")
+        tanks = [tank("tank-0000", 2), tank("tank-0001", 2)]
+        self.failing = {"tank-0001"}
+        report = get_connectivity(tanks)
+        assert report[0]["error"] is None and report[0]["connected"]
+        assert not report[1]["connected"] and report[1]["actual"] is None
+        assert "Loading block index" in report[1]["error"], report[1]
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            assert not _connected(tanks=tanks)
+        assert "Tank tank-0001 could not be queried" in output.getvalue(), output.getvalue()
+        assert "Loading block index" in output.getvalue()
+
+
+if __name__ == "__main__":
+    test = ConnectivityTest()
+    test.run_test()
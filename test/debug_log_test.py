@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timedelta, timezone
+
+from click.testing import CliRunner
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.bitcoin import debug_log
+
+LINES = 600
+TANK = "tank-0000"
+
+
+class DebugLogTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        # The last lines were logged a few seconds ago
+        self.start = datetime.now(timezone.utc) - timedelta(seconds=LINES // 2 * 10)
+
+    def run_test(self):
+        try:
+            self.setup_log()
+            self.check_stdout()
+            self.check_ranges()
+            self.check_download()
+            self.check_resume()
+            self.check_dense_resume()
+            self.check_refusals()
+        finally:
+            self.server.stop()
+
+    def timestamp(self, seconds: float) -> str:
+        moment = self.start + timedelta(seconds=seconds)
+        fraction = f"{moment.microsecond:06d}".rstrip("0") or "0"
+        return f"{moment:%Y-%m-%dT%H:%M:%S}.{fraction}Z"
+
+    def line(self, n: int) -> tuple[str, str]:
+        # Two lines at a time share a timestamp, as they often do in debug.log
+        return self.timestamp(n // 2 * 10 + 0.25), f"{n} [validation] UpdateTip: height={n} ✓"
+
+    def text(self, lines: range) -> str:
+        return "".join(f"{self.line(n)[1]}\n" for n in lines)
+
+    def setup_log(self):
+        self.log.info(f"Creating a tank with {LINES} lines of log")
+        self.server.add_pod(TANK, labels={"mission": "tank"})
+        self.server.set_pod_log(TANK, [self.line(n) for n in range(LINES)])
+
+    def debug_log(self, *args: str, tank: str = TANK) -> str:
+        result = CliRunner().invoke(debug_log, [tank, *args], catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    def last_log_request(self) -> str:
+        return [path for _, path in self.server.requests if path.split("?")[0].endswith("/log")][-1]
+
+    def check_stdout(self):
+        self.log.info("Streaming the whole log to stdout")
+        assert self.debug_log() == self.text(range(LINES))
+        assert "timestamps=true" not in self.last_log_request()
+
+    def check_ranges(self):
+        self.log.info("Passing --tail, --since and --limit-bytes to the API server")
+        assert self.debug_log("--tail", "10") == self.text(range(LINES - 10, LINES))
+        assert "tailLines=10" in self.last_log_request()
+
+        output = self.debug_log("--since", "5m")
+        assert "sinceSeconds=300" in self.last_log_request()
+        # Lines are 10 seconds apart, give or take the one at the cutoff
+        assert 58 <= output.count("\n") <= 62, output
+        assert self.text(range(LINES)).endswith(output)
+
+        full = self.text(range(LINES)).encode()
+        output = self.debug_log("--limit-bytes", "1000")
+        assert output.encode() == full[:1000]
+        assert "limitBytes=1000" in self.last_log_request()
+
+        self.log.info("Starting at an exact --since-time")
+        since_time = self.line(201)[0]
+        # Lines 200 and 201 share that time, so both are included
+        assert self.debug_log("--since-time", since_time) == self.text(range(200, LINES))
+        assert "sinceSeconds=" in self.last_log_request()
+        assert self.debug_log("--since-time", since_time.rstrip("Z")) == self.text(
+            range(200, LINES)
+        )
+        # An hour earlier in UTC, before the log started
+        output = self.debug_log("--since-time", since_time.replace("Z", "+01:00"))
+        assert output == self.text(range(LINES)), output
+
+    def check_download(self):
+        self.log.info("Downloading to a file in ranges of --limit-bytes")
+        path = self.tmpdir / "debug.log"
+        parts, size = 0, None
+        while True:
+            assert self.debug_log("--output", str(path), "--limit-bytes", "2000") == ""
+            # Resumes filter out the lines they already have before applying the limit
+            limited = "limitBytes=2000" in self.last_log_request()
+            assert limited == (size is None), self.last_log_request()
+            if path.stat().st_size == size:
+                break
+            parts, size = parts + 1, path.stat().st_size
+        self.log.info(f"Downloaded the log in {parts} parts")
+        assert parts > 10, parts
+        assert path.read_text() == self.text(range(LINES))
+        self.path = path
+
+    def check_resume(self):
+        self.log.info("Resuming appends only what was logged since")
+        self.server.append_pod_log(TANK, [self.line(n) for n in range(LINES, LINES + 20)])
+        self.debug_log("-o", str(self.path))
+        assert self.path.read_text() == self.text(range(LINES + 20))
+
+        self.log.info("Cutting back lines written after the last resume point")
+        with open(self.path, "a") as f:
+            f.write("half a li")
+        self.server.append_pod_log(TANK, [self.line(LINES + 20)])
+        self.debug_log("-o", str(self.path))
+        assert self.path.read_text() == self.text(range(LINES + 21))
+
+        self.log.info("Starting a download with --since-time and --tail")
+        path = self.tmpdir / "since.log"
+        self.debug_log("-o", str(path), "--since-time", self.line(300)[0], "--tail", "100")
+        assert path.read_text() == self.text(range(LINES - 79, LINES + 21))
+        self.debug_log("-o", str(path), "--since-time", self.line(300)[0])
+        assert path.read_text() == self.text(range(LINES - 79, LINES + 21))
+
+    def check_dense_resume(self):
+        self.log.info("Resuming with a --limit-bytes smaller than the re-read overlap")
+        tank = "tank-0002"
+        moment = datetime.now(timezone.utc) - timedelta(seconds=5)
+        lines = [
+            (f"{moment + timedelta(seconds=n // 100 / 4):%Y-%m-%dT%H:%M:%S.%fZ}", f"{n} busy")
+            for n in range(300)
+        ]
+        self.server.add_pod(tank, labels={"mission": "tank"})
+        self.server.set_pod_log(tank, lines)
+        path = self.tmpdir / "busy.log"
+        parts, size = 0, None
+        while True:
+            self.debug_log("-o", str(path), "--limit-bytes", "1000", tank=tank)
+            if path.stat().st_size == size:
+                break
+            parts, size = parts + 1, path.stat().st_size
+        self.log.info(f"Downloaded the log in {parts} parts")
+        assert path.read_text() == "".join(f"{text}\n" for _, text in lines)
+
+    def check_refusals(self):
+        self.log.info("Refusing files debug-log can't resume")
+        other = self.tmpdir / "other.log"
+        other.write_text("not a debug log\n")
+        result = CliRunner().invoke(debug_log, [TANK, "-o", str(other)])
+        assert result.exit_code == 1 and "can't be resumed" in result.output, result.output
+        assert other.read_text() == "not a debug log\n"
+
+        self.server.add_pod("tank-0001", labels={"mission": "tank"})
+        self.server.set_pod_log("tank-0001", [])
+        result = CliRunner().invoke(debug_log, ["tank-0001", "-o", str(self.path)])
+        assert result.exit_code == 1 and f"log of {TANK}" in result.output, result.output
+
+        result = CliRunner().invoke(
+            debug_log, [TANK, "--since", "1m", "--since-time", "2024-06-01"]
+        )
+        assert result.exit_code == 2, result.output
+
+
+if __name__ == "__main__":
+    test = DebugLogTest()
+    test.run_test()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import shutil
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import yaml
+from click.testing import CliRunner
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import TANK_MISSION, VALUES_HASH_ANNOTATION
+from warnet.deploy import deploy, deploy_network
+
+# Prints two lines per release so interleaving would be visible, and fails the releases
+# in STUB_HELM_FAIL
+STUB_HELM_BEHAVIOUR = """
+release = args[2]
+print(f"Release {release} has been upgraded.")
+time.sleep(float(os.environ.get("STUB_HELM_DELAY", "0.2")))
+print(f"STATUS: deployed {release}")
+exit_code = 1 if release in os.environ.get("STUB_HELM_FAIL", "").split(",") else 0
+"""
+
+
+class DeployJobsTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        # Copied so the test can edit network.yaml without touching the source tree
+        self.network_dir = self.tmpdir / "12_node_ring"
+        shutil.copytree(Path(os.path.dirname(__file__)) / "data" / "12_node_ring", self.network_dir)
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.helm_log = self.install_stub_helm(STUB_HELM_BEHAVIOUR)
+            self.check_sequential()
+            self.check_parallel()
+            self.check_fail_fast()
+            self.check_skip_unchanged()
+            self.check_bulk_options()
+        finally:
+            self.server.stop()
+
+    def deploy(self, jobs: int, force: bool = False) -> tuple[bool, list[dict], str, float]:
+        self.helm_log.unlink(missing_ok=True)
+        output = io.StringIO()
+        start = time.monotonic()
+        with redirect_stdout(output):
+            result = deploy_network(
+                self.network_dir, namespace="warnet-test", jobs=jobs, force=force
+            )
+        elapsed = time.monotonic() - start
+        calls = []
+        if self.helm_log.exists():
+            with open(self.helm_log) as f:
+                calls = [json.loads(line) for line in f]
+        return result, calls, output.getvalue(), elapsed
+
+    def max_concurrency(self, calls: list[dict]) -> int:
+        edges = sorted([(c["start"], 1) for c in calls] + [(c["end"], -1) for c in calls])
+        running = peak = 0
+        for _, delta in edges:
+            running += delta
+            peak = max(peak, running)
+        return peak
+
+    def check_sequential(self):
+        self.log.info("Deploying 12 nodes with one job")
+        result, calls, _, self.sequential_time = self.deploy(jobs=1)
+        assert result
+        assert len(calls) == 12
+        assert self.max_concurrency(calls) == 1
+
+    def check_parallel(self):
+        self.log.info("Deploying 12 nodes with four jobs")
+        result, calls, output, elapsed = self.deploy(jobs=4)
+        self.log.info(f"1 job: {self.sequential_time:.2f}s, 4 jobs: {elapsed:.2f}s")
+        assert result
+        assert sorted(c["args"][2] for c in calls) == [f"tank-{i:04d}" for i in range(12)]
+        assert 1 < self.max_concurrency(calls) <= 4
+        assert elapsed < self.sequential_time
+        # Every override was rendered before helm ran and still exists while it runs
+        tank_0 = next(c for c in calls if c["args"][2] == "tank-0000")
+        assert "tank-0001" in tank_0["overrides"][1]
+
+        # Each release's output is one contiguous, prefixed block
+        lines = output.splitlines()
+        for i in range(12):
+            prefix = f"[tank-{i:04d}]"
+            idx = [n for n, line in enumerate(lines) if line.startswith(prefix)]
+            assert len(idx) == 2 and idx[1] == idx[0] + 1, f"{prefix} output interleaved"
+
+    def check_fail_fast(self):
+        self.log.info("Checking a failed release stops the rest")
+        os.environ["STUB_HELM_FAIL"] = "tank-0001"
+        try:
+            result, calls, output, _ = self.deploy(jobs=2)
+        finally:
+            del os.environ["STUB_HELM_FAIL"]
+        assert not result
+        assert len(calls) < 12, "releases kept starting after a failure"
+        assert "Failed to deploy node: tank-0001" in output
+
+    def check_skip_unchanged(self):
+        self.log.info("Checking running tanks with unchanged values are not redeployed")
+        _, calls, _, _ = self.deploy(jobs=4)
+        assert len(calls) == 12
+        # Play the part of the cluster: run each tank with the annotation helm was given
+        for call in calls:
+            annotations = yaml.safe_load(call["overrides"][1])["podAnnotations"]
+            assert VALUES_HASH_ANNOTATION in annotations
+            self.server.add_pod(
+                call["args"][2],
+                "warnet-test",
+                labels={"mission": TANK_MISSION},
+                annotations=annotations,
+            )
+        # The rendered overrides are gone once helm is done with them
+        override = next(c for c in calls if c["args"][2] == "tank-0000")["args"][-1]
+        assert override.endswith("tank-0000.yaml") and not Path(override).exists()
+        assert sorted(p.name for p in self.network_dir.iterdir()) == [
+            "network.yaml",
+            "node-defaults.yaml",
+        ]
+
+        result, calls, output, _ = self.deploy(jobs=4)
+        assert result
+        assert calls == []
+        assert "Skipping 12 unchanged nodes" in output
+
+        self.log.info("Checking tanks that aren't ready are redeployed")
+        self.server.set_pod_phase("tank-0005", "Failed", namespace="warnet-test")
+        result, calls, output, _ = self.deploy(jobs=4)
+        assert result
+        assert [c["args"][2] for c in calls] == ["tank-0005"]
+        self.server.set_pod_phase("tank-0005", "Running", namespace="warnet-test")
+
+        self.log.info("Checking only the edited node is redeployed")
+        network_file = self.network_dir / "network.yaml"
+        network = yaml.safe_load(network_file.read_text())
+        network["nodes"][3]["image"] = {"tag": "26.0"}
+        network_file.write_text(yaml.safe_dump(network))
+        result, calls, _, _ = self.deploy(jobs=4)
+        assert result
+        assert [c["args"][2] for c in calls] == ["tank-0003"]
+
+        self.log.info("Checking --force redeploys everything")
+        _, calls, _, _ = self.deploy(jobs=4, force=True)
+        assert len(calls) == 12
+
+    def check_bulk_options(self):
+        self.log.info("Checking --bulk rejects the per-release options")
+        for option in ["--jobs=4", "--force"]:
+            result = CliRunner().invoke(deploy, [str(self.network_dir), "--bulk", option])
+            assert result.exit_code == 2, result.output
+            assert "don't apply to --bulk" in result.output, result.output
+
+
+if __name__ == "__main__":
+    test = DeployJobsTest()
+    test.run_test()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import time
+
+from fake_api_server import FakeApiServer
+from rich.console import Console
+from test_base import TestBase
+
+from warnet import control, k8s
+from warnet.constants import (
+    BULK_NETWORK_RELEASE,
+    COMMANDER_MISSION,
+    TANK_MISSION,
+    TEST_FRAMEWORK_LABELS,
+)
+
+
+class DownFastTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        self.server.deletion_delay = 0.5
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.helm_log = self.install_stub_helm()
+            self.setup_network()
+            self.check_unsynced()
+            self.check_fast_down()
+        finally:
+            self.server.stop()
+
+    def add_release(self, name: str, namespace: str, revisions: int = 1):
+        for revision in range(1, revisions + 1):
+            self.server.add_object(
+                "secrets",
+                f"sh.helm.release.v1.{name}.v{revision}",
+                namespace,
+                labels={"owner": "helm", "name": name, "version": str(revision)},
+            )
+
+    def add_tank(self, name: str, namespace: str):
+        labels = {"app.kubernetes.io/instance": name}
+        self.server.add_pod(name, namespace, labels={"mission": TANK_MISSION, **labels})
+        self.server.add_object("configmaps", f"{name}-bitcoincore", namespace, labels=labels)
+        self.server.add_object("services", name, namespace, labels=labels)
+        # As the bitcoincore chart labels them when metricsExport is on
+        self.server.add_object(
+            "servicemonitors",
+            f"{name}-bitcoincore",
+            namespace,
+            labels={
+                "app.kubernetes.io/name": "bitcoind-metrics",
+                "release": "prometheus",
+                **labels,
+            },
+        )
+
+    def setup_network(self):
+        self.log.info("Creating 150 tanks as releases, a bulk network, a commander and caddy")
+        for i in range(150):
+            self.add_tank(f"tank-{i:04d}", "default")
+            self.add_release(f"tank-{i:04d}", "default", revisions=2)
+        for i in range(3):
+            self.add_tank(f"tank-{i:04d}", "wargames-red")
+        self.add_release(BULK_NETWORK_RELEASE, "wargames-red")
+        self.server.add_pod(
+            "commander-miner",
+            labels={"mission": COMMANDER_MISSION, "app.kubernetes.io/instance": "commander-miner"},
+        )
+        self.add_release("commander-miner", "default")
+        # Shared by commanders, so not part of any release
+        self.server.add_object(
+            "configmaps", "warnet-test-framework-0123456789abcdef", labels=TEST_FRAMEWORK_LABELS
+        )
+        self.add_release("caddy", "default")
+        self.server.add_object("services", "caddy", labels={"app.kubernetes.io/instance": "caddy"})
+        self.server.add_pod("caddy-0", labels={"app.kubernetes.io/instance": "caddy"})
+
+    def release_list(self, namespaces: list[str]) -> list[dict[str, str]]:
+        return [
+            {"namespace": ns, "name": name}
+            for ns in namespaces
+            for name in k8s.get_helm_releases(ns)
+        ]
+
+    def check_unsynced(self):
+        self.log.info("Deleting nothing when the pods can't be listed and watched")
+        self.server.failing_paths.add("/api/v1/pods")
+        output = io.StringIO()
+        control.console = Console(file=output, width=200)
+        requests_before = len(self.server.requests)
+        try:
+            result = control.fast_down(
+                ["default", "wargames-red"], self.release_list(["default"]), sync_timeout=2
+            )
+        finally:
+            self.server.failing_paths.clear()
+        self.log.info(output.getvalue())
+        assert result is False
+        assert "Falling back to helm uninstall" in output.getvalue()
+        assert not [m for m, _ in self.server.requests[requests_before:] if m == "DELETE"]
+        assert not self.helm_log.exists()
+
+    def check_fast_down(self):
+        self.log.info("Tearing down through the API")
+        namespaces = ["default", "wargames-red"]
+        release_list = self.release_list(namespaces)
+        assert len(release_list) == 153
+
+        requests_before = len(self.server.requests)
+        output = io.StringIO()
+        control.console = Console(file=output, width=200)
+        start = time.monotonic()
+        assert control.fast_down(namespaces, release_list, timeout=10)
+        elapsed = time.monotonic() - start
+        self.log.info(f"Teardown took {elapsed:.2f}s")
+        output = output.getvalue()
+        self.log.info(output)
+
+        deletes = [
+            path for method, path in self.server.requests[requests_before:] if method == "DELETE"
+        ]
+        pod_deletes = [path for path in deletes if "/pods" in path]
+        self.log.info(f"{len(deletes)} DELETE requests, {len(pod_deletes)} for pods")
+        assert len(pod_deletes) == 2, "expected one collection delete per namespace"
+        assert all("gracePeriodSeconds=0" in path for path in pod_deletes)
+        # 151 release names in batches of 100, and four object kinds per batch of instances
+        assert len(deletes) < 20
+
+        assert "Warnet teardown process completed." in output
+        assert "Pods remaining: 0" in output
+        assert [pod["metadata"]["name"] for pod in self.server.pods.values()] == ["caddy-0"]
+        assert k8s.get_helm_releases("default") == ["caddy"]
+        assert k8s.get_helm_releases("wargames-red") == []
+        assert (
+            self.server.list_objects("services", "default", None)[0]["metadata"]["name"] == "caddy"
+        )
+        assert self.server.list_objects("configmaps", "default", None) == []
+        for namespace in namespaces:
+            assert self.server.list_objects("servicemonitors", namespace, None) == []
+
+        self.log.info("Checking releases that are not warnet's still go through helm")
+        deadline = time.monotonic() + 5
+        while not self.helm_log.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        with open(self.helm_log) as f:
+            calls = [json.loads(line)["args"] for line in f]
+        assert calls == [["uninstall", "caddy", "--namespace", "default", "--wait=false"]]
+
+
+if __name__ == "__main__":
+    test = DownFastTest()
+    test.run_test()
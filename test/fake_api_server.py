@@ -0,0 +1,751 @@
+import base64
+import contextlib
+import copy
+import hashlib
+import json
+import re
+import struct
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+
+POD_PATH = re.compile(
+    r"^/api/v1/namespaces/(?P<namespace>[^/]+)/pods/(?P<name>[^/]+)(?P<status>/status)?$"
+)
+NAMESPACED_PODS_PATH = re.compile(r"^/api/v1/namespaces/(?P<namespace>[^/]+)/pods$")
+POD_LOG_PATH = re.compile(r"^/api/v1/namespaces/(?P<namespace>[^/]+)/pods/(?P<name>[^/]+)/log$")
+POD_EXEC_PATH = re.compile(r"^/api/v1/namespaces/(?P<namespace>[^/]+)/pods/(?P<name>[^/]+)/exec$")
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Channels of the v4.channel.k8s.io exec protocol
+STDIN_CHANNEL, STDOUT_CHANNEL, STDERR_CHANNEL, ERROR_CHANNEL = 0, 1, 2, 3
+# Core objects, and the prometheus operator's servicemonitors
+OBJECTS_PATH = re.compile(
+    r"^/(?:api/v1|apis/monitoring\.coreos\.com/v1)/namespaces/(?P<namespace>[^/]+)"
+    r"/(?P<plural>secrets|configmaps|services|servicemonitors)$"
+)
+OBJECT_PATH = re.compile(
+    r"^/(?:api/v1|apis/monitoring\.coreos\.com/v1)/namespaces/(?P<namespace>[^/]+)"
+    r"/(?P<plural>secrets|configmaps|services|servicemonitors)/(?P<name>[^/]+)$"
+)
+
+
+def parse_label_selector(selector: str) -> list[tuple[str, str, list[str]]]:
+    """Parse a label selector into (key, operator, values) requirements"""
+    requirements = []
+    for term in re.findall(r"[^,(]+(?:\([^)]*\))?", selector or ""):
+        term = term.strip()
+        if not term:
+            continue
+        match = re.match(r"^(\S+)\s+(in|notin)\s+\((.*)\)$", term)
+        if match:
+            values = [v.strip() for v in match.group(3).split(",")]
+            requirements.append((match.group(1), match.group(2), values))
+        elif "!=" in term:
+            key, value = term.split("!=", 1)
+            requirements.append((key, "notin", [value]))
+        elif "=" in term:
+            key, value = term.split("=", 1)
+            requirements.append((key, "in", [value.lstrip("=")]))
+        elif term.startswith("!"):
+            requirements.append((term[1:], "!", []))
+        else:
+            requirements.append((term, "exists", []))
+    return requirements
+
+
+def parse_timestamp(timestamp: str) -> float:
+    head, _, fraction = timestamp.rstrip("Z").partition(".")
+    seconds = datetime.strptime(head, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return seconds.timestamp() + float(f"0.{fraction or 0}")
+
+
+def labels_match(labels: dict[str, str], selector: Optional[str]) -> bool:
+    for key, operator, values in parse_label_selector(selector):
+        if operator == "in" and labels.get(key) not in values:
+            return False
+        if operator == "notin" and labels.get(key) in values:
+            return False
+        if operator == "exists" and key not in labels:
+            return False
+        if operator == "!" and key in labels:
+            return False
+    return True
+
+
+def fields_match(pod: dict, selector: Optional[str]) -> bool:
+    """Match the metadata.name, metadata.namespace and status.phase field selectors"""
+    for term in (selector or "").split(","):
+        if not term:
+            continue
+        negate = "!=" in term
+        key, value = re.split(r"!=|==|=", term, maxsplit=1)
+        section, field = key.split(".", 1)
+        if (pod[section].get(field) == value) == negate:
+            return False
+    return True
+
+
+class FakeApiServer:
+    """
+    A tiny in-process stand-in for the Kubernetes API server, good enough for the
+    CoreV1Api calls warnet makes. Every request is recorded in `requests` and every
+    accepted TCP connection is counted in `connections`. Pod changes are journaled so
+    watches started from a resourceVersion replay them in order, and every event sent to a
+    watch is counted in `watch_events_sent`. Deleted pods stay around with a
+    deletionTimestamp for `deletion_delay` seconds, like a terminating pod would.
+    Secrets, configmaps and services are stored without history in `objects`, and pod
+    logs as (RFC3339 timestamp, line) pairs in `logs`. Exec runs the command locally over
+    a websocket, with a mount path (/root/.bitcoin by default) mapped to the pod's
+    directory in `roots`.
+    """
+
+    def __init__(self):
+        self.pods: dict[tuple[str, str], dict] = {}
+        self.objects: dict[tuple[str, str, str], dict] = {}
+        self.deletion_delay = 0.0
+        self.logs: dict[tuple[str, str], list[tuple[str, str]]] = {}
+        self.roots: dict[tuple[str, str], tuple[Path, str]] = {}
+        self.active_execs = 0
+        self.max_active_execs = 0
+        self.ended_logs: set[tuple[str, str]] = set()
+        self.log_delay = 0.0
+        self.active_log_streams = 0
+        self.max_active_log_streams = 0
+        self.stopping = False
+        self.forbidden_paths: set[str] = set()
+        # Paths that fail with 500 Internal Server Error
+        self.failing_paths: set[str] = set()
+        self.requests: list[tuple[str, str]] = []
+        self.connections = 0
+        self.watch_events_sent = 0
+        self.lock = threading.Condition()
+        self.resource_version = 0
+        self.events: list[tuple[int, str, dict]] = []
+        self.compacted_version = -1
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeApiServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self.lock:
+            self.stopping = True
+            self.lock.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def write_kubeconfig(self, path: Path, namespace: str = "default") -> Path:
+        kubeconfig = {
+            "apiVersion": "v1",
+            "kind": "Config",
+            "clusters": [{"name": "fake", "cluster": {"server": self.url}}],
+            "users": [{"name": "fake", "user": {"token": "fake-token"}}],
+            "contexts": [
+                {
+                    "name": "fake",
+                    "context": {"cluster": "fake", "user": "fake", "namespace": namespace},
+                }
+            ],
+            "current-context": "fake",
+        }
+        with open(path, "w") as f:
+            yaml.safe_dump(kubeconfig, f)
+        return Path(path)
+
+    def _record(self, event_type: str, pod: dict) -> None:
+        with self.lock:
+            self.resource_version += 1
+            pod["metadata"]["resourceVersion"] = str(self.resource_version)
+            self.events.append((self.resource_version, event_type, copy.deepcopy(pod)))
+            self.lock.notify_all()
+
+    def add_pod(
+        self,
+        name: str,
+        namespace: str = "default",
+        labels: Optional[dict[str, str]] = None,
+        annotations: Optional[dict[str, str]] = None,
+        phase: str = "Running",
+        image: str = "bitcoindevproject/bitcoin",
+    ) -> dict:
+        pod = {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "name": name,
+                "namespace": namespace,
+                "labels": labels or {},
+                "annotations": annotations or {},
+                "creationTimestamp": "2024-01-01T00:00:00Z",
+            },
+            "spec": {"containers": [{"name": "bitcoincore", "image": image}]},
+            "status": {
+                "phase": phase,
+                "podIP": "10.0.0.1",
+                "conditions": [{"type": "Ready", "status": str(phase == "Running")}],
+            },
+        }
+        with self.lock:
+            self.pods[(namespace, name)] = pod
+            self._record("ADDED", pod)
+        return pod
+
+    def set_pod_phase(self, name: str, phase: str, namespace: str = "default") -> None:
+        with self.lock:
+            pod = self.pods[(namespace, name)]
+            pod["status"]["phase"] = phase
+            pod["status"]["conditions"] = [{"type": "Ready", "status": str(phase == "Running")}]
+            self._record("MODIFIED", pod)
+
+    def set_pod_labels(self, name: str, labels: dict[str, str], namespace: str = "default") -> None:
+        with self.lock:
+            pod = self.pods[(namespace, name)]
+            pod["metadata"]["labels"] = labels
+            self._record("MODIFIED", pod)
+
+    def set_init_running(self, name: str, namespace: str = "default") -> None:
+        """Mark the pod's init container as running, as while it waits for a commander upload"""
+        with self.lock:
+            pod = self.pods[(namespace, name)]
+            pod["status"]["phase"] = "Pending"
+            pod["status"]["initContainerStatuses"] = [
+                {
+                    "name": "init",
+                    "image": "busybox",
+                    "imageID": "",
+                    "ready": False,
+                    "restartCount": 0,
+                    "state": {"running": {"startedAt": "2024-01-01T00:00:00Z"}},
+                }
+            ]
+            self._record("MODIFIED", pod)
+
+    def remove_pod(self, name: str, namespace: str = "default") -> None:
+        with self.lock:
+            pod = self.pods.pop((namespace, name))
+            self._record("DELETED", pod)
+
+    def delete_pods(
+        self, namespace: str, label_selector: Optional[str], name: Optional[str] = None
+    ) -> list[dict]:
+        """Start terminating the matching pods; they disappear after `deletion_delay`"""
+        with self.lock:
+            pods = [
+                pod
+                for pod in self.list_pods(namespace, label_selector)
+                if "deletionTimestamp" not in pod["metadata"]
+                and (name is None or pod["metadata"]["name"] == name)
+            ]
+            for pod in pods:
+                pod["metadata"]["deletionTimestamp"] = "2024-01-01T00:00:00Z"
+                self._record("MODIFIED", pod)
+        for pod in pods:
+            name = pod["metadata"]["name"]
+            timer = threading.Timer(self.deletion_delay, self.remove_pod, (name, namespace))
+            timer.daemon = True
+            timer.start()
+        return pods
+
+    def add_object(
+        self,
+        plural: str,
+        name: str,
+        namespace: str = "default",
+        labels: Optional[dict[str, str]] = None,
+    ) -> dict:
+        api_version, kind = {
+            "secrets": ("v1", "Secret"),
+            "configmaps": ("v1", "ConfigMap"),
+            "services": ("v1", "Service"),
+            "servicemonitors": ("monitoring.coreos.com/v1", "ServiceMonitor"),
+        }[plural]
+        obj = {
+            "apiVersion": api_version,
+            "kind": kind,
+            "metadata": {"name": name, "namespace": namespace, "labels": labels or {}},
+        }
+        with self.lock:
+            self.objects[(plural, namespace, name)] = obj
+        return obj
+
+    def list_objects(self, plural: str, namespace: str, label_selector: Optional[str]) -> list:
+        with self.lock:
+            return [
+                obj
+                for (p, ns, _), obj in sorted(self.objects.items())
+                if p == plural
+                and ns == namespace
+                and labels_match(obj["metadata"]["labels"], label_selector)
+            ]
+
+    def delete_objects(self, plural: str, namespace: str, label_selector: Optional[str]) -> list:
+        with self.lock:
+            objects = self.list_objects(plural, namespace, label_selector)
+            for obj in objects:
+                del self.objects[(plural, namespace, obj["metadata"]["name"])]
+            return objects
+
+    def set_pod_log(
+        self, name: str, lines: list[tuple[str, str]], namespace: str = "default"
+    ) -> None:
+        with self.lock:
+            self.logs[(namespace, name)] = lines
+
+    def append_pod_log(
+        self, name: str, lines: list[tuple[str, str]], namespace: str = "default"
+    ) -> None:
+        """Add lines to a pod's log as its container runs; followers receive them"""
+        with self.lock:
+            self.logs.setdefault((namespace, name), []).extend(lines)
+            self.lock.notify_all()
+
+    def end_pod_log(self, name: str, namespace: str = "default") -> None:
+        """The container exited, so followers of its log reach the end"""
+        with self.lock:
+            self.ended_logs.add((namespace, name))
+            self.lock.notify_all()
+
+    def read_log(self, namespace: str, name: str, query: dict[str, str]) -> Optional[bytes]:
+        with self.lock:
+            lines = self.logs.get((namespace, name))
+        if lines is None:
+            return None
+        log = self.format_log(self.select_log(lines, query), query)
+        if "limitBytes" in query:
+            # The API stops after limitBytes, even in the middle of a line
+            log = log[: int(query["limitBytes"])]
+        return log
+
+    def select_log(self, lines: list[tuple[str, str]], query: dict[str, str]) -> list:
+        if "sinceSeconds" in query:
+            cutoff = time.time() - int(query["sinceSeconds"])
+            lines = [(ts, line) for ts, line in lines if parse_timestamp(ts) >= cutoff]
+        if "tailLines" in query:
+            lines = lines[len(lines) - int(query["tailLines"]) :]
+        return lines
+
+    def format_log(self, lines: list[tuple[str, str]], query: dict[str, str]) -> bytes:
+        if query.get("timestamps", "").lower() == "true":
+            return "".join(f"{ts} {line}\n" for ts, line in lines).encode()
+        return "".join(f"{line}\n" for _, line in lines).encode()
+
+    def set_pod_root(
+        self, name: str, root: Path, namespace: str = "default", mount: str = "/root/.bitcoin"
+    ) -> None:
+        with self.lock:
+            self.roots[(namespace, name)] = (Path(root), mount)
+
+    def compact(self) -> None:
+        """
+        Forget the event journal, as etcd compaction does. Watches at or before the current
+        resourceVersion get 410 Gone and have to LIST again.
+        """
+        with self.lock:
+            self.events.clear()
+            self.compacted_version = self.resource_version
+            self.resource_version += 1
+            self.lock.notify_all()
+
+    def list_pods(
+        self,
+        namespace: Optional[str],
+        label_selector: Optional[str],
+        field_selector: Optional[str] = None,
+    ) -> list[dict]:
+        with self.lock:
+            return [
+                pod
+                for (ns, _), pod in sorted(self.pods.items())
+                if (namespace is None or ns == namespace)
+                and labels_match(pod["metadata"]["labels"], label_selector)
+                and fields_match(pod, field_selector)
+            ]
+
+    def namespaces(self) -> list[str]:
+        with self.lock:
+            return sorted({"default"} | {ns for ns, _ in self.pods})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                # Clients close watches they no longer need while they are still open here
+                with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+                    super().handle()
+
+            def send_json(self, obj: dict, status: int = 200):
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_status(self, status: int, reason: str, message: str):
+                self.send_json(
+                    {
+                        "kind": "Status",
+                        "apiVersion": "v1",
+                        "status": "Failure",
+                        "message": message,
+                        "reason": reason,
+                        "code": status,
+                    },
+                    status,
+                )
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with server.lock:
+                    server.requests.append(("GET", self.path))
+                if url.path in server.forbidden_paths:
+                    return self.send_status(403, "Forbidden", f"{url.path} is forbidden")
+                if url.path in server.failing_paths:
+                    return self.send_status(500, "InternalError", f"{url.path} failed")
+                selector = query.get("labelSelector")
+
+                if url.path == "/api/v1/namespaces":
+                    items = [
+                        {"metadata": {"name": ns}, "status": {"phase": "Active"}}
+                        for ns in server.namespaces()
+                    ]
+                    return self.send_json({"kind": "NamespaceList", "items": items, "metadata": {}})
+                if url.path == "/api/v1/pods":
+                    if query.get("watch", "").lower() == "true":
+                        return self.send_watch(None, query)
+                    return self.send_pod_list(
+                        server.list_pods(None, selector, query.get("fieldSelector"))
+                    )
+                match = NAMESPACED_PODS_PATH.match(url.path)
+                if match:
+                    if query.get("watch", "").lower() == "true":
+                        return self.send_watch(match["namespace"], query)
+                    return self.send_pod_list(
+                        server.list_pods(match["namespace"], selector, query.get("fieldSelector"))
+                    )
+                match = POD_LOG_PATH.match(url.path)
+                if match and query.get("follow", "").lower() == "true":
+                    return self.send_log_follow(match["namespace"], match["name"], query)
+                if match:
+                    log = server.read_log(match["namespace"], match["name"], query)
+                    if log is None:
+                        return self.send_status(
+                            400,
+                            "BadRequest",
+                            f'container "bitcoincore" in pod "{match["name"]}" is waiting to start',
+                        )
+                    with server.lock:
+                        server.active_log_streams += 1
+                        server.max_active_log_streams = max(
+                            server.max_active_log_streams, server.active_log_streams
+                        )
+                    try:
+                        time.sleep(server.log_delay)
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/plain")
+                        self.send_header("Content-Length", str(len(log)))
+                        self.end_headers()
+                        self.wfile.write(log)
+                    finally:
+                        with server.lock:
+                            server.active_log_streams -= 1
+                    return
+                match = POD_EXEC_PATH.match(url.path)
+                if match:
+                    with server.lock:
+                        root = server.roots.get((match["namespace"], match["name"]))
+                    if root is None:
+                        return self.send_status(
+                            404, "NotFound", f'pods "{match["name"]}" not found'
+                        )
+                    query = parse_qs(url.query)
+                    stdin = query.get("stdin", ["false"])[0].lower() == "true"
+                    return self.send_exec(*root, query["command"], stdin)
+                match = OBJECTS_PATH.match(url.path)
+                if match:
+                    items = server.list_objects(match["plural"], match["namespace"], selector)
+                    return self.send_json({"kind": "List", "metadata": {}, "items": items})
+                match = OBJECT_PATH.match(url.path)
+                if match:
+                    with server.lock:
+                        obj = server.objects.get(
+                            (match["plural"], match["namespace"], match["name"])
+                        )
+                    if obj:
+                        return self.send_json(obj)
+                    return self.send_status(
+                        404, "NotFound", f'{match["plural"]} "{match["name"]}" not found'
+                    )
+                match = POD_PATH.match(url.path)
+                if match:
+                    with server.lock:
+                        pod = server.pods.get((match["namespace"], match["name"]))
+                    if pod:
+                        return self.send_json(pod)
+                    return self.send_status(404, "NotFound", f'pods "{match["name"]}" not found')
+                return self.send_status(404, "NotFound", f"{url.path} not found")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                with server.lock:
+                    server.requests.append(("POST", self.path))
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                match = OBJECTS_PATH.match(url.path)
+                if not match:
+                    return self.send_status(404, "NotFound", f"{url.path} not found")
+                key = (match["plural"], match["namespace"], body["metadata"]["name"])
+                with server.lock:
+                    if key in server.objects:
+                        return self.send_status(
+                            409, "AlreadyExists", f'{key[0]} "{key[2]}" already exists'
+                        )
+                    body["metadata"].setdefault("labels", {})
+                    body["metadata"]["namespace"] = match["namespace"]
+                    server.objects[key] = body
+                return self.send_json(body, 201)
+
+            def do_DELETE(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with server.lock:
+                    server.requests.append(("DELETE", self.path))
+                if url.path in server.forbidden_paths:
+                    return self.send_status(403, "Forbidden", f"{url.path} is forbidden")
+                selector = query.get("labelSelector")
+
+                match = NAMESPACED_PODS_PATH.match(url.path)
+                if match:
+                    return self.send_pod_list(server.delete_pods(match["namespace"], selector))
+                match = POD_PATH.match(url.path)
+                if match:
+                    pods = server.delete_pods(match["namespace"], None, match["name"])
+                    if pods:
+                        return self.send_json(pods[0])
+                    return self.send_status(404, "NotFound", f'pods "{match["name"]}" not found')
+                match = OBJECTS_PATH.match(url.path)
+                if match:
+                    items = server.delete_objects(match["plural"], match["namespace"], selector)
+                    return self.send_json({"kind": "List", "metadata": {}, "items": items})
+                return self.send_status(404, "NotFound", f"{url.path} not found")
+
+            def send_frame(self, payload: bytes, opcode: int = 0x2):
+                # Server frames are never masked
+                if len(payload) < 126:
+                    header = struct.pack("!BB", 0x80 | opcode, len(payload))
+                elif len(payload) < 1 << 16:
+                    header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+                else:
+                    header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+                self.wfile.write(header + payload)
+
+            def read_frame(self) -> tuple[int, bytes]:
+                # Client frames are always masked
+                header = self.rfile.read(2)
+                if len(header) < 2:
+                    return 0x8, b""
+                opcode, length = header[0] & 0x0F, header[1] & 0x7F
+                if length == 126:
+                    (length,) = struct.unpack("!H", self.rfile.read(2))
+                elif length == 127:
+                    (length,) = struct.unpack("!Q", self.rfile.read(8))
+                mask = self.rfile.read(4)
+                payload = self.rfile.read(length)
+                mask = (mask * (length // 4 + 1))[:length]
+                unmasked = int.from_bytes(payload, "big") ^ int.from_bytes(mask, "big")
+                return opcode, unmasked.to_bytes(length, "big")
+
+            def pipe_stdin(self, process: subprocess.Popen):
+                try:
+                    while True:
+                        opcode, payload = self.read_frame()
+                        if opcode == 0x8:
+                            break
+                        if payload[:1] == bytes([STDIN_CHANNEL]):
+                            process.stdin.write(payload[1:])
+                            process.stdin.flush()
+                except (BrokenPipeError, OSError, ValueError):
+                    pass
+                finally:
+                    with contextlib.suppress(BrokenPipeError):
+                        process.stdin.close()
+
+            def send_exec(self, root: Path, mount: str, command: list[str], stdin: bool):
+                key = self.headers["Sec-WebSocket-Key"] + WEBSOCKET_GUID
+                accept = base64.b64encode(hashlib.sha1(key.encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.send_header("Sec-WebSocket-Protocol", "v4.channel.k8s.io")
+                self.end_headers()
+                self.close_connection = True
+
+                with server.lock:
+                    server.active_execs += 1
+                    server.max_active_execs = max(server.max_active_execs, server.active_execs)
+                try:
+                    command = [arg.replace(mount, str(root)) for arg in command]
+                    process = subprocess.Popen(
+                        command,
+                        stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                    )
+                    if stdin:
+                        threading.Thread(
+                            target=self.pipe_stdin, args=(process,), daemon=True
+                        ).start()
+                    while chunk := process.stdout.read(1 << 16):
+                        self.send_frame(bytes([STDOUT_CHANNEL]) + chunk)
+                    stderr = process.stderr.read()
+                    if stderr:
+                        self.send_frame(bytes([STDERR_CHANNEL]) + stderr)
+                    code = process.wait()
+                finally:
+                    with server.lock:
+                        server.active_execs -= 1
+                if code == 0:
+                    status = {"metadata": {}, "status": "Success"}
+                else:
+                    status = {
+                        "metadata": {},
+                        "status": "Failure",
+                        "message": f"command terminated with non-zero exit code: {code}",
+                        "reason": "NonZeroExitCode",
+                        "details": {"causes": [{"reason": "ExitCode", "message": str(code)}]},
+                    }
+                self.send_frame(bytes([ERROR_CHANNEL]) + json.dumps(status).encode())
+                self.send_frame(struct.pack("!H", 1000), opcode=0x8)
+
+            def send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def send_watch(self, namespace: Optional[str], query: dict[str, str]):
+                selector = query.get("labelSelector")
+                field_selector = query.get("fieldSelector")
+                timeout = float(query.get("timeoutSeconds", 5))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                if query.get("resourceVersion"):
+                    version = int(query["resourceVersion"])
+                else:
+                    # Like the API server, start with the current state as ADDED events
+                    with server.lock:
+                        version = server.resource_version
+                        pods = copy.deepcopy(server.list_pods(namespace, selector, field_selector))
+                        server.watch_events_sent += len(pods)
+                    for pod in pods:
+                        line = json.dumps({"type": "ADDED", "object": pod}).encode()
+                        self.send_chunk(line + b"\n")
+
+                deadline = time.monotonic() + timeout
+                while time.monotonic() < deadline:
+                    with server.lock:
+                        if version <= server.compacted_version:
+                            return self.send_gone()
+                        pending = [e for e in server.events if e[0] > version]
+                        if not pending:
+                            server.lock.wait(deadline - time.monotonic())
+                            continue
+                    for event_version, event_type, pod in pending:
+                        version = event_version
+                        if namespace and pod["metadata"]["namespace"] != namespace:
+                            continue
+                        if not labels_match(pod["metadata"]["labels"], selector):
+                            continue
+                        if not fields_match(pod, field_selector):
+                            continue
+                        with server.lock:
+                            server.watch_events_sent += 1
+                        line = json.dumps({"type": event_type, "object": pod}).encode()
+                        self.send_chunk(line + b"\n")
+                self.send_chunk(b"")
+
+            def send_log_follow(self, namespace: str, name: str, query: dict[str, str]):
+                """Stream the log, then each line appended to it until the container exits"""
+                key = (namespace, name)
+                with server.lock:
+                    lines = server.logs.get(key)
+                    if lines is None:
+                        return self.send_status(
+                            400, "BadRequest", f'container in pod "{name}" is waiting to start'
+                        )
+                    position = len(lines)
+                    server.active_log_streams += 1
+                    server.max_active_log_streams = max(
+                        server.max_active_log_streams, server.active_log_streams
+                    )
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    backlog = server.select_log(lines[:position], query)
+                    if backlog:
+                        # An empty chunk would end the response
+                        self.send_chunk(server.format_log(backlog, query))
+                    done = False
+                    while not done:
+                        with server.lock:
+                            while (
+                                len(server.logs[key]) == position
+                                and key not in server.ended_logs
+                                and not server.stopping
+                            ):
+                                server.lock.wait()
+                            new = server.logs[key][position:]
+                            position += len(new)
+                            done = key in server.ended_logs or server.stopping
+                        if new:
+                            self.send_chunk(server.format_log(new, query))
+                    self.send_chunk(b"")
+                finally:
+                    with server.lock:
+                        server.active_log_streams -= 1
+
+            def send_gone(self):
+                gone = {"kind": "Status", "code": 410, "reason": "Expired", "message": "too old"}
+                self.send_chunk(json.dumps({"type": "ERROR", "object": gone}).encode() + b"\n")
+                self.send_chunk(b"")
+
+            def send_pod_list(self, pods: list[dict]):
+                self.send_json(
+                    {
+                        "kind": "PodList",
+                        "apiVersion": "v1",
+                        "metadata": {"resourceVersion": str(server.resource_version)},
+                        "items": pods,
+                    }
+                )
+
+        return Handler
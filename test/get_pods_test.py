@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+from warnet.k8s import get_mission, get_pods
+
+TANK_SELECTOR = f"labelSelector=mission%3D{TANK_MISSION}"
+
+
+class GetPodsTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.setup_pods()
+            self.check_selector()
+            self.check_namespace()
+            self.check_forbidden_cluster_scope()
+        finally:
+            self.server.stop()
+
+    def setup_pods(self):
+        self.log.info("Creating tanks in two namespaces, a commander and a kube-system pod")
+        for i in range(3):
+            self.server.add_pod(f"tank-{i:04d}", labels={"mission": TANK_MISSION})
+            self.server.add_pod(f"tank-{i:04d}", "wargames-red", labels={"mission": TANK_MISSION})
+        self.server.add_pod("commander-miner", labels={"mission": COMMANDER_MISSION})
+        self.server.add_pod("coredns", "kube-system", labels={"mission": TANK_MISSION})
+
+    def pod_requests(self, since: int) -> list[str]:
+        return [path for _, path in self.server.requests[since:] if "/pods" in path]
+
+    def names(self, pods) -> list[tuple[str, str]]:
+        return sorted((pod.metadata.namespace, pod.metadata.name) for pod in pods)
+
+    def check_selector(self):
+        self.log.info("Filtering by mission in a single cluster-wide LIST")
+        before = len(self.server.requests)
+        tanks = get_mission(TANK_MISSION)
+        assert self.names(tanks) == [
+            (namespace, f"tank-{i:04d}")
+            for namespace in ["default", "wargames-red"]
+            for i in range(3)
+        ], self.names(tanks)
+        requests = self.pod_requests(before)
+        assert len(requests) == 1, requests
+        assert requests[0].startswith("/api/v1/pods?") and TANK_SELECTOR in requests[0]
+
+    def check_namespace(self):
+        self.log.info("Listing a single namespace")
+        before = len(self.server.requests)
+        tanks = get_mission(TANK_MISSION, namespace="wargames-red")
+        assert self.names(tanks) == [("wargames-red", f"tank-{i:04d}") for i in range(3)]
+        requests = self.pod_requests(before)
+        assert len(requests) == 1, requests
+        assert requests[0].startswith("/api/v1/namespaces/wargames-red/pods?")
+        assert TANK_SELECTOR in requests[0]
+
+    def check_forbidden_cluster_scope(self):
+        self.log.info("Falling back to one LIST per namespace when the cluster-wide one is denied")
+        self.server.forbidden_paths.add("/api/v1/pods")
+        before = len(self.server.requests)
+        tanks = get_mission(TANK_MISSION)
+        assert len(tanks) == 6, self.names(tanks)
+        requests = self.pod_requests(before)
+        assert requests[0].startswith("/api/v1/pods?"), requests
+        namespaced = requests[1:]
+        assert all(path.startswith("/api/v1/namespaces/") for path in namespaced), requests
+        assert all(TANK_SELECTOR in path for path in namespaced), requests
+        assert k8s.get_api_client() in k8s._cluster_scope_forbidden
+
+        self.log.info("Not retrying the cluster-wide LIST with the same credentials")
+        before = len(self.server.requests)
+        assert len(get_pods(label_selector=f"mission={COMMANDER_MISSION}")) == 1
+        requests = self.pod_requests(before)
+        assert not [path for path in requests if path.startswith("/api/v1/pods")], requests
+
+
+if __name__ == "__main__":
+    test = GetPodsTest()
+    test.run_test()
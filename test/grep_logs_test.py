@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import io
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.bitcoin import grep_logs, grep_tank_logs
+from warnet.constants import TANK_MISSION
+from warnet.k8s import get_mission
+from warnet.util import normalize_k8s_timestamp
+
+TXID = "94cacabc09b024b56dcbed9ccad15c90340c596e883159bcb5f1d2152997322d"
+
+
+class GrepLogsTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.start = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    def run_test(self):
+        try:
+            self.setup_logs()
+            self.check_merged_order()
+            self.check_unsorted()
+            self.check_pushdown()
+            self.check_command_output()
+        finally:
+            self.server.stop()
+
+    def timestamp(self, seconds: float, digits: int = 9) -> str:
+        moment = self.start + timedelta(seconds=seconds)
+        fraction = f"{moment.microsecond:06d}000"[:digits].rstrip("0") or "0"
+        return f"{moment:%Y-%m-%dT%H:%M:%S}.{fraction}Z"
+
+    def setup_logs(self):
+        self.log.info("Creating three tanks with interleaved logs")
+        for i in range(3):
+            namespace = "wargames-red" if i == 2 else "default"
+            self.server.add_pod(f"tank-{i:04d}", namespace, labels={"mission": TANK_MISSION})
+            lines = []
+            for n in range(3000):
+                # Tanks log at different offsets, and the API trims trailing zeros
+                seconds = n + i / 3 + 0.05
+                if n % 500 == 0:
+                    text = f"[validation] Enqueuing TransactionAddedToMempool: txid={TXID} n={n}"
+                else:
+                    text = f"[net] received: ping ({n} bytes) peer=0"
+                lines.append((self.timestamp(seconds, digits=3 + n % 7), f"BTC{n} {text}"))
+            self.server.set_pod_log(f"tank-{i:04d}", lines, namespace)
+        # Exists but has no log yet
+        self.server.add_pod("tank-0003", labels={"mission": TANK_MISSION}, phase="Pending")
+
+    def check_merged_order(self):
+        self.log.info("Checking logs are merged in time order")
+        results = list(grep_tank_logs(TXID, get_mission(TANK_MISSION), buffer_lines=10))
+        errors = [(tank.metadata.name, e) for ts, tank, e in results if ts is None]
+        matches = [(ts, tank.metadata.name, entry) for ts, tank, entry in results if ts]
+        assert len(errors) == 1 and errors[0][0] == "tank-0003", errors
+        assert "waiting to start" in str(errors[0][1])
+        assert len(matches) == 18
+        assert [ts for ts, _, _ in matches] == sorted(ts for ts, _, _ in matches)
+        assert [name for _, name, _ in matches[:3]] == ["tank-0000", "tank-0001", "tank-0002"]
+        assert all(len(ts) == len("2024-01-01T00:00:00.000000000Z") for ts, _, _ in matches)
+
+    def check_unsorted(self):
+        self.log.info("Checking --no-sort returns the same entries")
+        tanks = get_mission(TANK_MISSION)
+        sorted_entries = sorted(
+            (ts, tank.metadata.name) for ts, tank, _ in grep_tank_logs(TXID, tanks) if ts
+        )
+        unsorted_entries = sorted(
+            (ts, tank.metadata.name)
+            for ts, tank, _ in grep_tank_logs(TXID, tanks, sort=False)
+            if ts
+        )
+        assert sorted_entries == unsorted_entries
+
+    def check_pushdown(self):
+        self.log.info("Checking --tail and --since are sent to the log API")
+        tanks = [t for t in get_mission(TANK_MISSION) if t.metadata.name != "tank-0003"]
+        before = len(self.server.requests)
+        tail = [ts for ts, _, _ in grep_tank_logs(TXID, tanks, tail_lines=1000)]
+        log_requests = [path for _, path in self.server.requests[before:] if path.count("/log")]
+        assert all("tailLines=1000" in path and "timestamps=True" in path for path in log_requests)
+        assert len(tail) == 6, tail
+
+        # Logs end 600s ago, so the last 1500s hold n >= 2100
+        recent = list(grep_tank_logs(TXID, tanks, since_seconds=1500))
+        assert len(recent) == 3 and all("n=2500" in entry for _, _, entry in recent), recent
+
+    def check_command_output(self):
+        self.log.info("Checking the grep-logs command output")
+        output = io.StringIO()
+        with redirect_stdout(output):
+            grep_logs.main([TXID, "--tail", "600"], standalone_mode=False)
+        lines = output.getvalue().splitlines()
+        self.log.info("\n".join(lines))
+        assert (
+            lines[0] == 'tank-0003: container "bitcoincore" in pod "tank-0003" is waiting to start'
+        )
+        assert lines[1].startswith("tank-0000 default      BTC2500 [validation]")
+        assert lines[3].startswith("tank-0002 wargames-red BTC2500")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            grep_logs.main([TXID, "--since", "25m", "--show-k8s-timestamps"], standalone_mode=False)
+        lines = output.getvalue().splitlines()[1:]
+        assert len(lines) == 3
+        expected = normalize_k8s_timestamp(self.timestamp(2500.05, digits=3 + 2500 % 7))
+        assert lines[0].split()[2] == expected, lines[0]
+
+
+if __name__ == "__main__":
+    test = GrepLogsTest()
+    test.run_test()
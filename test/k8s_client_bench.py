@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Measure the per-call overhead of the k8s helpers before and after ApiClient caching.
+# "uncached" reproduces the old get_static_client(): parse the kubeconfig and build a new
+# CoreV1Api (and urllib3 pool) for every call. "cached" goes through warnet.k8s.
+
+import sys
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+
+from fake_api_server import FakeApiServer
+from kubernetes import client, config
+
+from warnet import k8s
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+
+def uncached_get_pod(name: str):
+    config.load_kube_config(config_file=k8s.KUBECONFIG)
+    return client.CoreV1Api().read_namespaced_pod(name=name, namespace="default")
+
+
+def cached_get_pod(name: str):
+    return k8s.get_pod(name, namespace="default")
+
+
+def bench(server: FakeApiServer, label: str, func) -> float:
+    connections = server.connections
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        func("tank-0000")
+    per_call = (time.perf_counter() - start) / CALLS
+    print(
+        f"{label:<10} {per_call * 1e6:10.1f} us/call  "
+        f"{server.connections - connections:5d} TCP connections for {CALLS} calls"
+    )
+    return per_call
+
+
+def main():
+    server = FakeApiServer().start()
+    server.add_pod("tank-0000", labels={"mission": "tank"})
+    k8s.KUBECONFIG = str(server.write_kubeconfig(Path(mkdtemp()) / "config"))
+    try:
+        before = bench(server, "uncached", uncached_get_pod)
+        after = bench(server, "cached", cached_get_pod)
+        print(f"speedup    {before / after:10.1f}x")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import time
+
+import yaml
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import DEFAULT_NAMESPACE
+from warnet.k8s import (
+    get_default_namespace,
+    get_kubeconfig,
+    get_kubeconfig_value,
+    write_kubeconfig,
+)
+
+
+def kubeconfig(context: str, namespace=None, extra_contexts=()) -> dict:
+    contexts = [
+        {"name": context, "context": {"cluster": context, "user": context}},
+        *({"name": name, "context": {"cluster": name, "user": name}} for name in extra_contexts),
+    ]
+    if namespace:
+        contexts[0]["context"]["namespace"] = namespace
+    names = [context, *extra_contexts]
+    return {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": n, "cluster": {"server": f"https://{n}:6443"}} for n in names],
+        "users": [{"name": n, "user": {"token": f"{n}-token"}} for n in names],
+        "contexts": contexts,
+        "current-context": context,
+    }
+
+
+class KubeconfigTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.path = self.tmpdir / "kubeconfig"
+        k8s.KUBECONFIG = str(self.path)
+
+    def run_test(self):
+        self.check_namespace()
+        self.check_rewrite()
+        self.check_jsonpath()
+        self.check_merged_paths()
+        self.check_no_subprocess()
+        self.check_write()
+
+    def write(self, path, data: dict, mtime: float):
+        with open(path, "w") as f:
+            yaml.safe_dump(data, f)
+        # Editors and `kubectl config` can rewrite the file within one mtime tick
+        os.utime(path, (mtime, mtime))
+
+    def check_namespace(self):
+        self.log.info("Resolving the default namespace from the current context")
+        assert get_default_namespace() == DEFAULT_NAMESPACE
+        self.write(self.path, kubeconfig("kind", namespace="alice"), 1_000)
+        assert get_default_namespace() == "alice"
+        self.write(self.path, kubeconfig("kind"), 2_000)
+        assert get_default_namespace() == DEFAULT_NAMESPACE
+
+    def check_rewrite(self):
+        self.log.info("Picking up a switched context once the file changes")
+        self.write(self.path, kubeconfig("kind", namespace="alice", extra_contexts=["gke"]), 3_000)
+        assert get_kubeconfig() is get_kubeconfig()
+        data = kubeconfig("kind", namespace="alice", extra_contexts=["gke"])
+        data["current-context"] = "gke"
+        data["contexts"][1]["context"]["namespace"] = "bob"
+        self.write(self.path, data, 4_000)
+        assert get_kubeconfig().current_context == "gke"
+        assert get_default_namespace() == "bob"
+        assert get_kubeconfig().cluster["cluster"] == {"server": "https://gke:6443"}
+
+    def check_jsonpath(self):
+        self.log.info("Evaluating JSONPath against the minified kubeconfig")
+        assert get_kubeconfig_value("{.current-context}") == "gke"
+        assert get_kubeconfig_value("'{..namespace}'") == "bob"
+        assert get_kubeconfig_value("{.clusters[0].cluster.server}") == "https://gke:6443"
+        assert get_kubeconfig_value("{.users[0].user.token}") == "gke-token"
+        assert get_kubeconfig_value("{.contexts[0].name}") == "gke"
+        assert get_kubeconfig_value("{.missing}") == ""
+
+    def check_merged_paths(self):
+        self.log.info("Merging several files listed in KUBECONFIG")
+        first = self.tmpdir / "first"
+        second = self.tmpdir / "second"
+        self.write(first, {"contexts": [], "current-context": "eks"}, 5_000)
+        self.write(second, kubeconfig("eks", namespace="carol", extra_contexts=["kind"]), 5_000)
+        missing = self.tmpdir / "missing"
+        k8s.KUBECONFIG = os.pathsep.join([str(first), str(missing), str(second), str(self.path)])
+        assert get_kubeconfig().current_context == "eks"
+        assert get_default_namespace() == "carol"
+        # "kind" comes from the second file, before the last file's definition
+        kind = get_kubeconfig()._entry("contexts", "kind")
+        assert "namespace" not in kind["context"], kind
+        assert len(get_kubeconfig().data["contexts"]) == 3
+
+        self.log.info("Building a new ApiClient once any of the files changes")
+        api_client = k8s.get_api_client()
+        assert api_client.configuration.host == "https://eks:6443"
+        assert k8s.get_api_client() is api_client
+        data = kubeconfig("eks", namespace="carol", extra_contexts=["kind"])
+        data["clusters"][0]["cluster"]["server"] = "https://eks-2:6443"
+        self.write(second, data, 6_000)
+        assert k8s.get_api_client().configuration.host == "https://eks-2:6443"
+        k8s.KUBECONFIG = str(self.path)
+
+    def check_no_subprocess(self):
+        self.log.info("Resolving the namespace many times without kubectl")
+        old_path = os.environ["PATH"]
+        os.environ["PATH"] = ""
+        try:
+            assert shutil.which("kubectl") is None
+            start = time.monotonic()
+            for _ in range(1000):
+                assert get_default_namespace() == "bob"
+            elapsed = time.monotonic() - start
+        finally:
+            os.environ["PATH"] = old_path
+        self.log.info(f"1000 lookups took {elapsed * 1000:.1f}ms")
+        assert elapsed < 1, elapsed
+
+    def check_write(self):
+        self.log.info("Picking up a kubeconfig warnet rewrites within one mtime tick")
+        data = yaml.safe_load(self.path.read_text())
+        data["contexts"][1]["context"]["namespace"] = "dave"
+        write_kubeconfig(data, str(self.path))
+        os.utime(self.path, (4_000, 4_000))
+        assert get_default_namespace() == "dave"
+
+
+if __name__ == "__main__":
+    test = KubeconfigTest()
+    test.run_test()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import io
+import tempfile
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import click
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s, pod_logs
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+from warnet.control import logs
+
+TANKS = 40
+LINES = 500
+
+
+class CountingOutput(io.StringIO):
+    """Captures stdout and counts how many writes it took"""
+
+    writes = 0
+
+    def write(self, s: str) -> int:
+        self.writes += 1
+        return super().write(s)
+
+
+class LogsTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.start = datetime.now(timezone.utc) - timedelta(hours=1)
+
+    def run_test(self):
+        try:
+            self.setup_logs()
+            self.check_selector()
+            self.check_names()
+            self.check_follow()
+            self.check_follow_limit()
+        finally:
+            self.server.stop()
+
+    def timestamp(self, seconds: float, digits: int = 9) -> str:
+        moment = self.start + timedelta(seconds=seconds)
+        fraction = f"{moment.microsecond:06d}000"[:digits].rstrip("0") or "0"
+        return f"{moment:%Y-%m-%dT%H:%M:%S}.{fraction}Z"
+
+    def setup_logs(self):
+        self.log.info(f"Creating {TANKS} tanks with interleaved logs and a commander")
+        for i in range(TANKS):
+            name = f"tank-{i:04d}"
+            self.server.add_pod(name, labels={"mission": TANK_MISSION, "app": name})
+            lines = [
+                # The API trims trailing zeros from timestamps
+                (self.timestamp(n + i / TANKS + 0.001, digits=3 + n % 7), f"{n} {i} [net] ping")
+                for n in range(LINES)
+            ]
+            self.server.set_pod_log(name, lines)
+        self.server.add_pod("commander-miner", labels={"mission": COMMANDER_MISSION})
+        self.server.set_pod_log(
+            "commander-miner",
+            # Only "\n" ends a line in a log
+            [(self.timestamp(0.5), "Mined a block"), (self.timestamp(0.6), "Tip:\r1\x0b2\u2028")],
+        )
+
+    def logs(self, *args: str) -> CountingOutput:
+        output = CountingOutput()
+        with redirect_stdout(output):
+            logs.main(list(args), standalone_mode=False)
+        return output
+
+    def parse(self, output: str) -> list[tuple[int, int]]:
+        """The (line, tank) of each prefixed tank log line, checking its prefix"""
+        lines = []
+        for line in output.splitlines():
+            pod, n, i, _ = line.split(maxsplit=3)
+            assert pod == f"tank-{int(i):04d}", line
+            lines.append((int(n), int(i)))
+        return lines
+
+    def check_selector(self):
+        self.log.info("Merging the logs of more tanks than streams through temporary files")
+        self.server.log_delay = 0.05
+        output = self.logs("--selector", f"mission={TANK_MISSION}", "--max-streams", "8")
+        self.server.log_delay = 0
+        lines = self.parse(output.getvalue())
+        assert lines == sorted(lines), "Lines are not in timestamp order"
+        assert len(lines) == TANKS * LINES
+        assert 1 < self.server.max_active_log_streams <= 8, self.server.max_active_log_streams
+        self.log.info(f"Printed {len(lines)} lines in {output.writes} writes")
+        assert output.writes <= 10, output.writes
+
+    def check_names(self):
+        spooled = []
+
+        def temporary_directory(**kwargs):
+            spooled.append(kwargs)
+            return tempfile.TemporaryDirectory(**kwargs)
+
+        pod_logs.tempfile = SimpleNamespace(TemporaryDirectory=temporary_directory)
+        try:
+            self.log.info("Merging some pods by name straight from their streams")
+            lines = self.parse(self.logs("tank-0003", "tank-0001").getvalue())
+            assert {i for _, i in lines} == {1, 3}
+            assert lines == sorted(lines)
+
+            self.log.info("Streaming a single pod's log without a prefix")
+            output = self.logs("commander-miner").getvalue()
+            tank = self.logs("tank-0002").getvalue().splitlines()
+        finally:
+            pod_logs.tempfile = tempfile
+        assert output == "Mined a block\nTip:\r1\x0b2\u2028\n", repr(output)
+        assert tank == [f"{n} 2 [net] ping" for n in range(LINES)], tank[:3]
+        assert spooled == [], spooled
+
+    def check_follow(self):
+        self.log.info("Following several logs as they grow")
+        names = [f"tank-{i:04d}" for i in range(3)]
+        output = CountingOutput()
+
+        def follow():
+            with redirect_stdout(output):
+                logs.main(
+                    ["--follow", "--selector", "app in (tank-0000,tank-0001,tank-0002)"],
+                    standalone_mode=False,
+                )
+
+        thread = threading.Thread(target=follow)
+        thread.start()
+        for n in range(LINES, LINES + 20):
+            for i, name in enumerate(names):
+                line = (self.timestamp(n + i / TANKS + 0.001), f"{n} {i} [net] ping")
+                self.server.append_pod_log(name, [line])
+        for name in names:
+            self.server.end_pod_log(name)
+        thread.join(timeout=10)
+        assert not thread.is_alive(), "Following didn't end with the logs"
+        lines = self.parse(output.getvalue())
+        assert len(lines) == 3 * (LINES + 20), len(lines)
+        assert lines == sorted(lines), "Followed lines are not in timestamp order"
+
+    def check_follow_limit(self):
+        self.log.info("Following needs a stream per pod")
+        try:
+            self.logs("--follow", "--selector", f"mission={TANK_MISSION}", "--max-streams", "8")
+        except click.UsageError as e:
+            assert "--max-streams 40" in str(e), e
+        else:
+            raise AssertionError("Following 40 pods with 8 streams should fail")
+
+
+if __name__ == "__main__":
+    test = LogsTest()
+    test.run_test()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Measure message capture parsing on a synthetic capture file.
+# "legacy" reproduces the old parse_raw_messages(): the whole file as one bytes blob, a
+# BytesIO per record and `messages = messages + parsed` per file. It only runs on the
+# first LEGACY_MB of the file, the new parser runs on all of it from an mmap.
+# Max RSS includes the mapped pages of the capture files the kernel has paged in.
+#
+#   python3 test/message_capture_bench.py [size in MB, default 300]
+
+import heapq
+import mmap
+import os
+import random
+import resource
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkdtemp
+
+from test_framework.messages import (
+    CBlockHeader,
+    CInv,
+    COutPoint,
+    CTransaction,
+    CTxIn,
+    CTxOut,
+    msg_headers,
+    msg_inv,
+    msg_ping,
+    msg_tx,
+)
+from test_framework.p2p import MESSAGEMAP
+
+from warnet.capture import CAPTURE_HEADER, iter_raw_messages, to_jsonable
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+LEGACY_MB = 20
+
+
+def payloads() -> list[tuple[bytes, bytes]]:
+    rand = random.Random(0)
+    tx = CTransaction()
+    tx.vin = [CTxIn(COutPoint(rand.getrandbits(256), i), b"\x51" * 72) for i in range(2)]
+    tx.vout = [CTxOut(1000 * i, b"\x00\x14" + rand.randbytes(20)) for i in range(2)]
+    headers = msg_headers()
+    headers.headers = [CBlockHeader() for _ in range(20)]
+    for header in headers.headers:
+        header.hashPrevBlock = rand.getrandbits(256)
+    inv = msg_inv([CInv(1, rand.getrandbits(256)) for _ in range(10)])
+    return [
+        (b"ping", msg_ping(rand.getrandbits(64)).serialize()),
+        (b"inv", inv.serialize()),
+        (b"tx", msg_tx(tx).serialize()),
+        (b"inv", inv.serialize()),
+        (b"headers", headers.serialize()),
+    ]
+
+
+def write_capture(path: Path, size: int, start: int) -> int:
+    records = 0
+    timestamp = start
+    templates = payloads()
+    with path.open("wb") as f:
+        written = 0
+        while written < size:
+            chunk = []
+            for msgtype, payload in templates:
+                timestamp += 137
+                chunk.append(CAPTURE_HEADER.pack(timestamp, msgtype, len(payload)) + payload)
+            data = b"".join(chunk)
+            f.write(data)
+            written += len(data)
+            records += len(templates)
+    return records
+
+
+def legacy_parse(blob: bytes, outbound: bool) -> list:
+    messages = []
+    offset = 0
+    while True:
+        tmp_header_raw = blob[offset : offset + 24]
+        offset = offset + 24
+        if not tmp_header_raw:
+            break
+        tmp_header = BytesIO(tmp_header_raw)
+        timestamp = int.from_bytes(tmp_header.read(8), "little")
+        msgtype = tmp_header.read(12).split(b"\x00", 1)[0]
+        length = int.from_bytes(tmp_header.read(4), "little")
+        msg_dict = {"outbound": outbound, "time": timestamp, "size": length}
+        msg_ser = BytesIO(blob[offset : offset + length])
+        offset = offset + length
+        msg = MESSAGEMAP[msgtype]()
+        msg_dict["msgtype"] = msgtype.decode()
+        msg.deserialize(msg_ser)
+        if length:
+            msg_dict["body"] = to_jsonable(msg)
+        messages.append(msg_dict)
+    return messages
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report(label: str, records: int, size: int, elapsed: float):
+    print(
+        f"{label:<34} {records:>9} records {size / 1e6 / elapsed:8.1f} MB/s "
+        f"{records / elapsed:10.0f} rec/s  max RSS {max_rss_mb():7.1f} MB"
+    )
+
+
+def run_new(label: str, recv: Path, sent: Path, **kwargs):
+    size = recv.stat().st_size + sent.stat().st_size
+    with (
+        recv.open("rb") as fr,
+        sent.open("rb") as fs,
+        mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ) as mr,
+        mmap.mmap(fs.fileno(), 0, access=mmap.ACCESS_READ) as ms,
+    ):
+        streams = [
+            iter_raw_messages(mr, False, **kwargs),
+            iter_raw_messages(ms, True, **kwargs),
+        ]
+        start = time.perf_counter()
+        records = 0
+        last = 0
+        for message in heapq.merge(*streams, key=lambda m: m["time"]):
+            assert message["time"] >= last
+            last = message["time"]
+            records += 1
+        report(label, records, size, time.perf_counter() - start)
+        for stream in streams:
+            stream.close()
+
+
+def main():
+    tmp = Path(mkdtemp())
+    recv, sent = tmp / "msgs_recv.dat", tmp / "msgs_sent.dat"
+    half = SIZE_MB * 1_000_000 // 2
+    print(f"Writing {SIZE_MB} MB of synthetic captures to {tmp}")
+    write_capture(recv, half, 0)
+    write_capture(sent, half, 50)
+
+    legacy_size = LEGACY_MB * 1_000_000 // 2
+    legacy_recv, legacy_sent = tmp / "legacy_recv.dat", tmp / "legacy_sent.dat"
+    write_capture(legacy_recv, legacy_size, 0)
+    write_capture(legacy_sent, legacy_size, 50)
+
+    start = time.perf_counter()
+    messages = []
+    for path, outbound in [(legacy_recv, False), (legacy_sent, True)]:
+        messages = messages + legacy_parse(path.read_bytes(), outbound)
+    messages.sort(key=lambda m: m["time"])
+    report(
+        f"legacy, full decode ({LEGACY_MB} MB)",
+        len(messages),
+        2 * legacy_size,
+        time.perf_counter() - start,
+    )
+    del messages
+
+    run_new(f"mmap, full decode ({LEGACY_MB} MB)", legacy_recv, legacy_sent)
+    run_new(f"mmap, summary ({LEGACY_MB} MB)", legacy_recv, legacy_sent, level="summary")
+    run_new(f"mmap, headers only ({SIZE_MB} MB)", recv, sent, level="header")
+    run_new(f"mmap, decode ping only ({SIZE_MB} MB)", recv, sent, msgtypes={"ping"})
+
+    for path in tmp.iterdir():
+        os.unlink(path)
+    tmp.rmdir()
+
+
+if __name__ == "__main__":
+    main()
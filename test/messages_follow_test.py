@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+
+from test_base import TestBase
+from test_framework.messages import msg_ping, msg_pong
+
+from warnet.bitcoin import follow_messages
+from warnet.capture import CAPTURE_HEADER
+
+# Stands in for `kubectl`: answers tank IP lookups and runs exec commands against a local
+# directory standing in for /root/.bitcoin, recording each invocation
+STUB_KUBECTL = """#!{python}
+import json, os, subprocess, sys
+args = sys.argv[1:]
+with open(os.environ["STUB_KUBECTL_LOG"], "a") as f:
+    f.write(json.dumps(args) + "\\n")
+if args[0] == "get":
+    print({{"pod": "10.0.0.2", "service": "10.96.0.3"}}[args[1]], end="")
+elif args[0] == "exec":
+    command = [a.replace("/root/.bitcoin", os.environ["STUB_TANK_ROOT"]) for a in args]
+    sys.exit(subprocess.run(command[command.index("--") + 1 :]).returncode)
+"""
+
+
+class MessagesFollowTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.bin_dir = self.tmpdir / "bin"
+        self.kubectl_log = self.tmpdir / "kubectl.jsonl"
+        self.tank_root = self.tmpdir / "tank-0000"
+        self.capture_dir = self.tank_root / "regtest" / "message_capture"
+        self.time = 0
+
+    def run_test(self):
+        self.install_stub_kubectl()
+        self.check_follow()
+
+    def install_stub_kubectl(self):
+        self.bin_dir.mkdir()
+        kubectl = self.bin_dir / "kubectl"
+        kubectl.write_text(STUB_KUBECTL.format(python=sys.executable))
+        kubectl.chmod(0o755)
+        os.environ["PATH"] = f"{self.bin_dir}{os.pathsep}{os.environ['PATH']}"
+        os.environ["STUB_KUBECTL_LOG"] = str(self.kubectl_log)
+        os.environ["STUB_TANK_ROOT"] = str(self.tank_root)
+
+    def record(self, msg) -> bytes:
+        self.time += 1000
+        payload = msg.serialize()
+        return CAPTURE_HEADER.pack(self.time, msg.msgtype, len(payload)) + payload
+
+    def append(self, peer_dir: str, file: str, data: bytes):
+        path = self.capture_dir / peer_dir / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("ab") as f:
+            f.write(data)
+
+    def tail_offsets(self) -> list[tuple[str, int]]:
+        offsets = []
+        with open(self.kubectl_log) as f:
+            for line in f:
+                args = json.loads(line)
+                if "tail" in args:
+                    offsets.append((args[-1].rsplit("/", 1)[1], int(args[-2].lstrip("+"))))
+        self.kubectl_log.unlink()
+        return offsets
+
+    def check_follow(self):
+        self.log.info("Following a link with existing captures")
+        peer = "10.96.0.3_18444"
+        for n in range(3):
+            self.append(peer, "msgs_sent.dat", self.record(msg_ping(n)))
+            self.append(peer, "msgs_recv.dat", self.record(msg_pong(n)))
+        # Another peer of tank-0000, not followed
+        self.append("10.0.0.9_40000", "msgs_sent.dat", self.record(msg_ping(99)))
+
+        messages = follow_messages(
+            "tank-0000", "tank-0001", "regtest", "default", "default", interval=0.1
+        )
+        first = [next(messages) for _ in range(6)]
+        assert [m["msgtype"] for m in first] == ["ping", "pong"] * 3
+        assert [m["outbound"] for m in first] == [True, False] * 3
+        assert [m["time"] for m in first] == sorted(m["time"] for m in first)
+        assert "offset" not in first[0]
+        assert sorted(self.tail_offsets()) == [("msgs_recv.dat", 1), ("msgs_sent.dat", 1)]
+
+        self.log.info("Appending records and half of one more")
+        record_size = len(self.record(msg_ping(0)))
+        partial = self.record(msg_ping(5))
+        self.append(peer, "msgs_sent.dat", self.record(msg_ping(3)) + self.record(msg_ping(4)))
+        self.append(peer, "msgs_sent.dat", partial[:30])
+        assert [next(messages)["body"]["nonce"] for _ in range(2)] == [3, 4]
+
+        self.log.info("Completing the partial record")
+        self.append(peer, "msgs_sent.dat", partial[30:])
+        assert next(messages)["body"]["nonce"] == 5
+        offsets = self.tail_offsets()
+        # Only the sent file grew: the new records, then the partial record again
+        assert set(offsets) == {
+            ("msgs_sent.dat", 3 * record_size + 1),
+            ("msgs_sent.dat", 5 * record_size + 1),
+        }, offsets
+        messages.close()
+
+
+if __name__ == "__main__":
+    test = MessagesFollowTest()
+    test.run_test()
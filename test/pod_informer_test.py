@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+from warnet.k8s import PodInformer
+
+
+class PodInformerTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.informer = None
+
+    def run_test(self):
+        try:
+            self.setup_pods()
+            self.check_initial_list()
+            self.check_wait_for_running()
+            self.check_delete()
+            self.check_relabel()
+            self.check_relist_after_compaction()
+            self.check_backoff()
+        finally:
+            if self.informer:
+                self.informer.stop()
+            self.server.stop()
+
+    def setup_pods(self):
+        self.log.info("Creating pending tanks, a commander and an unrelated pod")
+        for i in range(3):
+            self.server.add_pod(f"tank-{i:04d}", labels={"mission": TANK_MISSION}, phase="Pending")
+        self.server.add_pod("tank-0003", "wargames-red", labels={"mission": TANK_MISSION})
+        self.server.add_pod("commander-miner", labels={"mission": COMMANDER_MISSION})
+        self.server.add_pod("loki-0", "warnet-logging")
+
+    def list_requests(self) -> int:
+        return len([path for _, path in self.server.requests if "watch" not in path])
+
+    def check_initial_list(self):
+        self.log.info("Checking the informer syncs from a single LIST")
+        self.informer = PodInformer(watch_timeout=1).start()
+        assert self.informer.wait_for(lambda informer: True, timeout=5)
+        assert len(self.informer.pods(mission=TANK_MISSION)) == 4
+        assert len(self.informer.pods(mission=TANK_MISSION, namespace="default")) == 3
+        assert len(self.informer.pods(mission=COMMANDER_MISSION)) == 1
+        assert self.informer.get("loki-0", "warnet-logging") is None
+        assert self.list_requests() == 1
+
+    def check_wait_for_running(self):
+        self.log.info("Checking callers can block until all tanks are running")
+
+        def start_tanks():
+            for i in range(3):
+                self.server.set_pod_phase(f"tank-{i:04d}", "Running")
+
+        def all_running(informer):
+            tanks = informer.pods(mission=TANK_MISSION)
+            return all(tank.status.phase == "Running" for tank in tanks)
+
+        assert not all_running(self.informer)
+        threading.Timer(0.2, start_tanks).start()
+        assert self.informer.wait_for(all_running, timeout=5)
+        assert self.list_requests() == 1, "informer should not re-list while the watch is live"
+
+    def check_delete(self):
+        self.log.info("Checking deleted pods leave the index")
+        self.server.remove_pod("commander-miner")
+        assert self.informer.wait_for(
+            lambda informer: not informer.pods(mission=COMMANDER_MISSION), timeout=5
+        )
+        assert self.informer.get("commander-miner", "default") is None
+
+    def check_relabel(self):
+        self.log.info("Checking a pod whose mission changes moves to the new mission")
+        self.server.set_pod_labels("tank-0002", {"mission": COMMANDER_MISSION})
+        assert self.informer.wait_for(
+            lambda informer: len(informer.pods(mission=COMMANDER_MISSION)) == 1, timeout=5
+        )
+        assert "tank-0002" not in [p.metadata.name for p in self.informer.pods(TANK_MISSION)]
+        self.server.set_pod_labels("tank-0002", {"mission": TANK_MISSION})
+        assert self.informer.wait_for(
+            lambda informer: not informer.pods(mission=COMMANDER_MISSION), timeout=5
+        )
+
+    def check_relist_after_compaction(self):
+        self.log.info("Checking the informer re-lists after 410 Gone")
+        # Drop a pod without an event, then compact: only a fresh LIST can notice
+        with self.server.lock:
+            del self.server.pods[("wargames-red", "tank-0003")]
+        self.server.compact()
+        assert self.informer.wait_for(
+            lambda informer: len(informer.pods(mission=TANK_MISSION)) == 3, timeout=5
+        )
+        assert self.list_requests() == 2
+
+    def check_backoff(self):
+        self.log.info("Checking failing requests are logged and retried less and less often")
+        warnings = []
+        handler = logging.Handler(logging.WARNING)
+        handler.emit = lambda record: warnings.append(record.getMessage())
+        logging.getLogger("warnet.k8s").addHandler(handler)
+        path = "/api/v1/namespaces/wargames-red/pods"
+        self.server.failing_paths.add(path)
+        informer = PodInformer(namespace="wargames-red", watch_timeout=1, max_retry_delay=2)
+        informer.start()
+        try:
+            time.sleep(4.5)
+            # Tries at 0, 1, 3 and 5 seconds, rather than every second
+            attempts = len([p for _, p in self.server.requests if p.startswith(path)])
+            assert attempts == 3, attempts
+            assert len(warnings) == 3 and "failed 3 time(s) in a row" in warnings[-1], warnings
+            assert not informer.synced
+            self.server.failing_paths.clear()
+            self.server.add_pod("tank-0004", "wargames-red", labels={"mission": TANK_MISSION})
+            assert informer.wait_for(lambda i: len(i.pods(mission=TANK_MISSION)) == 1, timeout=5)
+        finally:
+            informer.stop()
+            logging.getLogger("warnet.k8s").removeHandler(handler)
+
+
+if __name__ == "__main__":
+    test = PodInformerTest()
+    test.run_test()
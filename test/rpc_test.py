@@ -2,10 +2,15 @@
 
 import json
 import os
+import time
 from pathlib import Path
 
 from test_base import TestBase
 
+from warnet.bitcoin import _rpc, _rpc_exec
+from warnet.k8s import get_default_namespace, get_mission
+from warnet.network import get_connectivity
+
 
 class RPCTest(TestBase):
     def __init__(self):
@@ -16,6 +21,8 @@ class RPCTest(TestBase):
         try:
             self.setup_network()
             self.test_rpc_commands()
+            self.test_rpc_transports()
+            self.test_connectivity_report()
             self.test_transaction_propagation()
             self.test_message_exchange()
             self.test_address_manager()
@@ -35,6 +42,53 @@ class RPCTest(TestBase):
         self.warnet("bitcoin rpc tank-0001 -generate 101")
         self.wait_for_predicate(lambda: "101" in self.warnet("bitcoin rpc tank-0000 getblockcount"))
 
+    def test_rpc_transports(self):
+        self.log.info("Testing direct JSON-RPC matches bitcoin-cli")
+        namespace = get_default_namespace()
+        best = _rpc("tank-0000", "getbestblockhash", [], namespace).strip()
+        for tank, method, params in [
+            ("tank-0000", "getblockcount", []),
+            ("tank-0000", "getbestblockhash", []),
+            ("tank-0000", "getblockhash", ["0"]),
+            ("tank-0000", "getblockheader", [best, "false"]),
+            ("tank-0000", "getrawmempool", []),
+            # Amounts print with all eight decimals, e.g. 50.00000000, not 50.0
+            ("tank-0001", "getbalance", []),
+            ("tank-0001", "getwalletinfo", []),
+        ]:
+            direct = _rpc(tank, method, params, namespace)
+            via_exec = _rpc_exec(tank, method, params, namespace)
+            assert direct == via_exec, f"{method}: {direct!r} != {via_exec!r}"
+
+        errors = []
+        for rpc in [_rpc, _rpc_exec]:
+            try:
+                rpc("tank-0000", "getblockhash", ["1000000"], namespace)
+            except Exception as e:
+                errors.append(str(e).strip())
+        assert len(errors) == 2 and errors[0] == errors[1], errors
+
+        tanks = get_mission("tank")
+        start = time.monotonic()
+        for tank in tanks:
+            _rpc(tank.metadata.name, "getpeerinfo", [], tank.metadata.namespace)
+        first = time.monotonic() - start
+        start = time.monotonic()
+        for tank in tanks:
+            _rpc(tank.metadata.name, "getpeerinfo", [], tank.metadata.namespace)
+        pooled = time.monotonic() - start
+        self.log.info(f"getpeerinfo on {len(tanks)} tanks: {first:.2f}s, then {pooled:.2f}s pooled")
+
+    def test_connectivity_report(self):
+        self.log.info("Testing the concurrent connectivity report")
+        start = time.monotonic()
+        report = get_connectivity(jobs=4)
+        self.log.info(f"Checked {len(report)} tanks in {time.monotonic() - start:.2f}s")
+        assert len(report) == 12
+        for tank in report:
+            assert tank["error"] is None, tank
+            assert tank["connected"] and tank["actual"] >= tank["expected"] == 1, tank
+
     def test_transaction_propagation(self):
         self.log.info("Testing transaction propagation")
         address = "bcrt1qthmht0k2qnh3wy7336z05lu2km7emzfpm3wg46"
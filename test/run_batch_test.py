@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import click
+import yaml
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import control, k8s
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+
+
+class RunBatchTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        control.SCENARIO_CACHE_DIR = self.tmpdir / "cache"
+        self.project_dir = self.tmpdir / "project"
+        self.stop_commanders = threading.Event()
+
+    def run_test(self):
+        try:
+            # Installs take a while, so overlapping ones show
+            self.helm_log = self.install_stub_helm(
+                """
+                time.sleep(0.3)
+                if args[-2].split("-")[1] in os.environ.get("FAIL_SCENARIOS", "").split(","):
+                    exit_code = 1
+                """
+            )
+            self.setup_project()
+            self.check_batch()
+            self.check_failures()
+            self.check_invalid()
+        finally:
+            self.stop_commanders.set()
+            self.server.stop()
+
+    def setup_project(self):
+        self.log.info("Creating three tanks in two namespaces and a batch of five scenarios")
+        for i in range(3):
+            self.server.add_pod(
+                f"tank-{i:04d}",
+                # Scenarios get every tank, not just those in the commander's namespace
+                namespace="wargames-red" if i == 2 else "default",
+                labels={
+                    "mission": TANK_MISSION,
+                    "chain": "regtest",
+                    "RPCPort": "18443",
+                    "rpcpassword": "gn0cchi",
+                },
+            )
+        shutil.copytree(
+            Path(os.path.dirname(__file__)).parent / "resources" / "scenarios",
+            self.project_dir / "scenarios",
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+        self.batch_file = self.project_dir / "batch.yaml"
+        with open(self.batch_file, "w") as f:
+            yaml.dump(
+                {
+                    "scenarios": [
+                        {"file": "scenarios/miner_std.py", "args": ["--allnodes", "--interval=10"]},
+                        {"file": "scenarios/tx_flood.py", "count": 4},
+                    ]
+                },
+                f,
+            )
+        threading.Thread(target=self.run_commanders, daemon=True).start()
+
+    def run_commanders(self):
+        """Create a commander pod waiting in its init container for each Helm install"""
+        seen = set()
+        while not self.stop_commanders.wait(0.05):
+            if not self.helm_log.exists():
+                continue
+            with open(self.helm_log) as f:
+                installs = [json.loads(line)["args"] for line in f]
+            for args in installs:
+                name = args[-2]
+                if name in seen:
+                    continue
+                seen.add(name)
+                shared = self.tmpdir / "commanders" / name
+                shared.mkdir(parents=True)
+                self.server.add_pod(name, labels={"mission": COMMANDER_MISSION}, phase="Pending")
+                self.server.set_pod_root(name, shared, mount="/shared")
+                self.server.set_init_running(name)
+
+    def check_batch(self):
+        self.log.info("Running the batch")
+        output = io.StringIO()
+        start = time.monotonic()
+        with redirect_stdout(output):
+            control.run_batch.main(
+                [str(self.batch_file), "--jobs", "5", "--namespace", "default"],
+                standalone_mode=False,
+            )
+        self.log.info(f"Started in {time.monotonic() - start:.1f}s:\n{output.getvalue()}")
+        assert "Successfully started 5 scenarios" in output.getvalue(), output.getvalue()
+
+        with open(self.helm_log) as f:
+            installs = [json.loads(line) for line in f]
+        assert len(installs) == 5
+        # Installs overlap rather than running one after another
+        assert max(i["start"] for i in installs) < min(i["end"] for i in installs)
+        layers = {arg for i in installs for arg in i["args"] if arg.startswith("testFramework.")}
+        assert len(layers) == 1, layers
+        miner = [i["args"] for i in installs if "minerstd" in i["args"][-2]]
+        assert "args=--allnodes --interval=10" in miner[0]
+
+        archives = {}
+        for args in [i["args"] for i in installs]:
+            shared = self.tmpdir / "commanders" / args[-2]
+            tanks = json.loads((shared / "warnet.json").read_text())
+            assert [t["tank"] for t in tanks] == ["tank-0000", "tank-0001", "tank-0002"]
+            archives.setdefault(args[-2].split("-")[1], set()).add(
+                (shared / "archive.pyz").read_bytes()
+            )
+        # One archive per scenario, shared by all of its commanders
+        assert {k: len(v) for k, v in archives.items()} == {"minerstd": 1, "txflood": 1}
+
+        posts = [path for method, path in self.server.requests if method == "POST"]
+        assert len(posts) == 1, posts
+        # All commanders are waited on together, from one list and at most one watch
+        commander_requests = [
+            path
+            for method, path in self.server.requests
+            if method == "GET" and "/pods?" in path and "mission%3Dcommander" in path
+        ]
+        assert len([p for p in commander_requests if "watch=True" not in p]) == 1
+        assert len([p for p in commander_requests if "watch=True" in p]) <= 1
+
+    def check_failures(self):
+        self.log.info("Naming the scenarios that failed to start")
+        batch_file = self.tmpdir / "failing.yaml"
+        with open(batch_file, "w") as f:
+            yaml.dump({"scenarios": [{"file": "scenarios/tx_flood.py", "count": 2}]}, f)
+        os.environ["FAIL_SCENARIOS"] = "txflood"
+        output = io.StringIO()
+        try:
+            with redirect_stdout(output):
+                control.run_batch.main(
+                    [str(batch_file), "--namespace", "default"], standalone_mode=False
+                )
+        finally:
+            del os.environ["FAIL_SCENARIOS"]
+        summary = output.getvalue().strip().splitlines()[-3:]
+        assert summary[0] == "Started 0 of 2 scenarios, these failed:", summary
+        assert all(line.startswith("  commander-txflood-") for line in summary[1:]), summary
+
+    def check_invalid(self):
+        self.log.info("Rejecting batch entries without a file")
+        batch_file = self.tmpdir / "invalid.yaml"
+        for entries, message in [
+            ([{"file": "scenarios/miner_std.py"}, {"args": ["--allnodes"]}], "Scenario 1 "),
+            ([{"file": "scenarios/tx_flood.py", "count": 0}], "count of scenario 0 "),
+            ({"file": "scenarios/tx_flood.py"}, "must be a list"),
+        ]:
+            with open(batch_file, "w") as f:
+                yaml.dump({"scenarios": entries}, f)
+            try:
+                control.run_batch.main([str(batch_file)], standalone_mode=False)
+            except click.UsageError as e:
+                assert message in str(e), e
+            else:
+                raise AssertionError(f"{entries} was accepted")
+
+
+if __name__ == "__main__":
+    test = RunBatchTest()
+    test.run_test()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import TEST_FRAMEWORK_CONFIG_MAP_PREFIX
+from warnet.k8s import ensure_config_map, write_file_to_container
+from warnet.scenario_bundle import (
+    CONFIG_MAP_LIMIT,
+    cached_archive,
+    scenario_module,
+    scenario_sources,
+    test_framework_sources,
+)
+
+
+class ScenarioBundleTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.scenario_dir = self.tmpdir / "scenarios"
+        shutil.copytree(
+            Path(os.path.dirname(__file__)).parent / "resources" / "scenarios",
+            self.scenario_dir,
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+        self.cache_dir = self.tmpdir / "cache"
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.check_archives()
+            self.check_layer_import()
+            self.check_config_map()
+            self.check_upload()
+        finally:
+            self.server.stop()
+
+    def bundle(self, scenario: str):
+        scenario_path = self.scenario_dir / scenario
+        main = f"{scenario_module(scenario_path, self.scenario_dir)}:main"
+        sources = scenario_sources(scenario_path, self.scenario_dir)
+        return cached_archive(sources, self.scenario_dir, self.cache_dir, main=main)
+
+    def check_archives(self):
+        self.log.info("Checking scenario archives are cached by content")
+        digest, archive = self.bundle("miner_std.py")
+        with zipfile.ZipFile(self.cache_dir / f"{digest}.zip") as z:
+            names = set(z.namelist())
+        assert {"miner_std.py", "commander.py", "__main__.py"} <= names, names
+        assert not any(name.startswith("test_framework/") for name in names)
+        assert "tx_flood.py" not in names
+        assert len(list(self.cache_dir.iterdir())) == 1
+
+        # The same sources give the same archive, even once their mtimes change
+        os.utime(self.scenario_dir / "miner_std.py", (0, 0))
+        assert self.bundle("miner_std.py") == (digest, archive)
+        assert len(list(self.cache_dir.iterdir())) == 1
+
+        with open(self.scenario_dir / "miner_std.py", "a") as f:
+            f.write("\n# changed\n")
+        assert self.bundle("miner_std.py")[0] != digest
+        assert len(list(self.cache_dir.iterdir())) == 2
+
+        framework = test_framework_sources(self.scenario_dir)
+        self.layer_digest, self.layer = cached_archive(framework, self.scenario_dir, self.cache_dir)
+        assert len(self.layer) <= CONFIG_MAP_LIMIT, len(self.layer)
+        # Changing a scenario leaves the test_framework layer alone
+        assert cached_archive(framework, self.scenario_dir, self.cache_dir)[0] == self.layer_digest
+
+    def check_layer_import(self):
+        self.log.info("Running a scenario archive with test_framework from its layer")
+        archive = self.tmpdir / "archive.pyz"
+        archive.write_bytes(self.bundle("miner_std.py")[1])
+        layer = self.tmpdir / "test_framework.zip"
+        layer.write_bytes(self.layer)
+        result = subprocess.run(
+            # -S leaves out site-packages, so test_framework can only come from the layer
+            [sys.executable, "-S", archive, "--help"],
+            env={**os.environ, "PYTHONPATH": str(layer)},
+            capture_output=True,
+            text=True,
+            cwd=self.tmpdir,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "--allnodes" in result.stdout, result.stdout
+
+    def check_config_map(self):
+        self.log.info("Creating the test_framework layer once")
+        name = f"{TEST_FRAMEWORK_CONFIG_MAP_PREFIX}{self.layer_digest[:16]}"
+        assert ensure_config_map(name, {"test_framework.zip": self.layer}, "default")
+        assert not ensure_config_map(name, {"test_framework.zip": self.layer}, "default")
+        config_map = self.server.objects[("configmaps", "default", name)]
+        assert base64.b64decode(config_map["binaryData"]["test_framework.zip"]) == self.layer
+        posts = [path for method, path in self.server.requests if method == "POST"]
+        assert len(posts) == 1, posts
+
+    def check_upload(self):
+        self.log.info("Uploading a file to a container in verified chunks")
+        shared = self.tmpdir / "shared"
+        shared.mkdir()
+        self.server.add_pod("commander-minerstd-1")
+        self.server.set_pod_root("commander-minerstd-1", shared, mount="/shared")
+        data = os.urandom(1_000_000)
+        assert write_file_to_container(
+            "commander-minerstd-1", "init", "/shared/archive.pyz", data, namespace="default"
+        )
+        assert (shared / "archive.pyz").read_bytes() == data
+        assert not (shared / "archive.pyz.tmp").exists()
+
+
+if __name__ == "__main__":
+    test = ScenarioBundleTest()
+    test.run_test()
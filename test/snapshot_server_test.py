@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import tarfile
+from contextlib import redirect_stdout
+
+import yaml
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import SNAPSHOT_SERVER_DIR, SNAPSHOT_SERVER_RELEASE
+from warnet.deploy import deploy_network, deploy_network_bulk
+from warnet.snapshot_store import SnapshotStore
+
+
+class SnapshotServerTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.network_dir = self.tmpdir / "network"
+        self.served_dir = self.tmpdir / "served"
+
+    def run_test(self):
+        try:
+            self.helm_log = self.install_stub_helm()
+            self.setup_network()
+            self.check_deploy()
+            self.check_cached()
+            self.check_bulk()
+        finally:
+            self.server.stop()
+
+    def setup_network(self):
+        self.log.info("Creating a network loading three distinct snapshots")
+        (self.network_dir / "snapshots").mkdir(parents=True)
+        self.tarball = os.urandom(300_000)
+        (self.network_dir / "snapshots" / "miner_bitcoin_data.tar.gz").write_bytes(self.tarball)
+        self.remote = self.tmpdir / "remote_bitcoin_data.tar.gz"
+        self.remote.write_bytes(os.urandom(1000))
+
+        store = SnapshotStore(self.network_dir / "store")
+        self.blocks = os.urandom(100_000)
+        store.write_manifest(
+            "after-ibd",
+            "tank-0000",
+            "default",
+            "regtest",
+            {"blocks/blk00000.dat": store.add_file(io.BytesIO(self.blocks))},
+        )
+
+        from_file = {"enabled": True, "file": "snapshots/miner_bitcoin_data.tar.gz"}
+        from_store = {"enabled": True, "store": {"path": "store", "tank": "tank-0000"}}
+        from_url = {"enabled": True, "url": self.remote.as_uri()}
+        nodes = [{"name": f"tank-{i:04d}", "loadSnapshot": from_file} for i in range(4)]
+        nodes += [{"name": f"tank-{i:04d}", "loadSnapshot": from_store} for i in range(4, 7)]
+        nodes += [{"name": "tank-0007", "loadSnapshot": from_url}, {"name": "tank-0008"}]
+        with open(self.network_dir / "network.yaml", "w") as f:
+            yaml.dump({"nodes": nodes}, f)
+        with open(self.network_dir / "node-defaults.yaml", "w") as f:
+            yaml.dump({"chain": "regtest"}, f)
+
+        self.served_dir.mkdir()
+        self.server.add_pod(SNAPSHOT_SERVER_RELEASE)
+        self.server.set_pod_root(
+            SNAPSHOT_SERVER_RELEASE, self.served_dir, mount=SNAPSHOT_SERVER_DIR
+        )
+
+    def helm_calls(self) -> list[dict]:
+        with open(self.helm_log) as f:
+            calls = [json.loads(line) for line in f]
+        self.helm_log.unlink()
+        return calls
+
+    def uploads(self, since: int) -> int:
+        return sum(
+            1
+            for _, path in self.server.requests[since:]
+            if path.count("/exec") and "stdin=true" in path.lower()
+        )
+
+    def deploy(self, function) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            result = function(self.network_dir, namespace="default")
+        assert result is not False, output.getvalue()
+        self.log.info(output.getvalue())
+        return output.getvalue()
+
+    def check_deploy(self):
+        self.log.info("Deploying uploads each snapshot once")
+        before = len(self.server.requests)
+        output = self.deploy(deploy_network)
+        assert "Serving 3 snapshots to 8 nodes (0 already cached)" in output, output
+        assert self.uploads(before) == 2
+
+        calls = self.helm_calls()
+        assert calls[0]["args"][2] == SNAPSHOT_SERVER_RELEASE
+        urls = {}
+        for call in calls[1:]:
+            values = yaml.safe_load(call["overrides"][-1])
+            if "loadSnapshot" in values:
+                load_snapshot = values["loadSnapshot"]
+                assert set(load_snapshot) == {"enabled", "url"}, load_snapshot
+                urls[call["args"][2]] = load_snapshot["url"]
+        assert len(urls) == 8 and len(set(urls.values())) == 3
+        assert urls["tank-0000"] == urls["tank-0003"]
+        server_url = f"http://{SNAPSHOT_SERVER_RELEASE}.default.svc/"
+        assert all(url.startswith(server_url) for url in urls.values())
+        self.urls = urls
+
+        served = lambda tank: self.served_dir / urls[tank].removeprefix(server_url)  # noqa: E731
+        assert served("tank-0000").read_bytes() == self.tarball
+        assert served("tank-0007").read_bytes() == self.remote.read_bytes()
+        with tarfile.open(served("tank-0004")) as tar:
+            assert tar.extractfile("./blocks/blk00000.dat").read() == self.blocks
+        assert sorted(p.name for p in self.served_dir.iterdir()) == sorted(
+            {served(tank).name for tank in urls}
+        )
+
+    def check_cached(self):
+        self.log.info("Redeploying reuses the cached snapshots")
+        before = len(self.server.requests)
+        output = self.deploy(deploy_network)
+        assert "Serving 3 snapshots to 8 nodes (3 already cached)" in output, output
+        assert self.uploads(before) == 0
+        self.helm_calls()
+
+    def check_bulk(self):
+        self.log.info("Bulk deploys load the same snapshots")
+        self.deploy(deploy_network_bulk)
+        calls = self.helm_calls()
+        nodes = yaml.safe_load(calls[-1]["overrides"][0])["nodes"]
+        urls = {
+            n["name"]: n["values"]["loadSnapshot"]["url"]
+            for n in nodes
+            if n["values"]["loadSnapshot"]["enabled"]
+        }
+        assert urls == self.urls, urls
+        assert not any("file" in n["values"]["loadSnapshot"] for n in nodes)
+
+
+if __name__ == "__main__":
+    test = SnapshotServerTest()
+    test.run_test()
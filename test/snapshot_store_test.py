@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import io
+import random
+import tarfile
+from urllib.parse import parse_qs, urlparse
+
+from fake_api_server import FakeApiServer
+from rich.console import Console
+from test_base import TestBase
+
+from warnet import control, k8s
+from warnet.constants import TANK_MISSION
+from warnet.snapshot_store import CHUNK_SIZE, SnapshotStore
+
+TANKS = 8
+
+
+class SnapshotStoreTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.output = io.StringIO()
+        control.console = Console(file=self.output, width=200)
+        self.store_dir = self.tmpdir / "store"
+        rand = random.Random(0)
+        # Every tank has the same chain, as after IBD
+        self.blocks = rand.randbytes(3 * CHUNK_SIZE + 1000)
+        self.undo = rand.randbytes(CHUNK_SIZE // 2)
+
+    def run_test(self):
+        try:
+            self.setup_tanks()
+            self.check_dedup()
+            self.check_incremental()
+            self.check_restore()
+        finally:
+            self.server.stop()
+
+    def datadir(self, i: int):
+        return self.tmpdir / "tanks" / f"tank-{i:04d}" / "regtest"
+
+    def setup_tanks(self):
+        self.log.info(f"Creating {TANKS} tanks with the same blocks")
+        for i in range(TANKS):
+            name = f"tank-{i:04d}"
+            self.server.add_pod(name, labels={"mission": TANK_MISSION, "chain": "regtest"})
+            datadir = self.datadir(i)
+            (datadir / "blocks").mkdir(parents=True)
+            (datadir / "blocks" / "blk00000.dat").write_bytes(self.blocks)
+            (datadir / "blocks" / "rev00000.dat").write_bytes(self.undo)
+            (datadir / "debug.log").write_text(f"{name} log\n")
+            self.server.set_pod_root(name, datadir.parent)
+
+    def snapshot(self, *args: str) -> str:
+        self.output.seek(0)
+        self.output.truncate()
+        control.snapshot.main(list(args), standalone_mode=False)
+        output = self.output.getvalue()
+        self.log.info(output)
+        return output
+
+    def tar_paths(self, since: int) -> list[str]:
+        """Paths requested by tar execs since request number `since`"""
+        paths = []
+        for _, path in self.server.requests[since:]:
+            if path.count("/exec"):
+                command = parse_qs(urlparse(path).query)["command"]
+                if command[0] == "tar":
+                    paths.extend(command[command.index("-C") + 2 :])
+        return paths
+
+    def check_dedup(self):
+        self.log.info("Snapshotting all tanks into the store")
+        before = len(self.server.requests)
+        output = self.snapshot(
+            "--all", "--store", "-o", str(self.store_dir), "--name", "first", "-j", "1"
+        )
+        assert "All tank snapshots completed." in output
+        # Four chunks of blocks, one of undo data and one debug.log per tank
+        assert f"stored {5 + TANKS} new chunks" in output, output
+        # Only the first tank sends its block files
+        tar_paths = self.tar_paths(before)
+        assert sorted(tar_paths).count("blocks/blk00000.dat") == 1, tar_paths
+        assert tar_paths.count("debug.log") == TANKS
+        chunks = list((self.store_dir / "chunks").glob("*/*"))
+        assert len(chunks) == 5 + TANKS
+
+    def check_incremental(self):
+        self.log.info("Snapshotting again after new blocks")
+        for i in range(TANKS):
+            with open(self.datadir(i) / "blocks" / "blk00000.dat", "ab") as f:
+                f.write(b"\x01" * 100)
+        before = len(self.server.requests)
+        output = self.snapshot("--all", "--store", "-o", str(self.store_dir), "--name", "second")
+        # Only the last block file chunk changed; the debug logs did not
+        assert "stored 1 new chunks" in output, output
+        assert self.tar_paths(before).count("blocks/blk00000.dat") >= 1
+        store = SnapshotStore(self.store_dir)
+        assert store.snapshots() == ["first", "second"]
+
+    def check_restore(self):
+        self.log.info("Restoring a tank from the store")
+        destination = self.tmpdir / "restored"
+        self.output.seek(0)
+        self.output.truncate()
+        control.restore_snapshot.main(
+            [str(self.store_dir), "tank-0003", str(destination), "--name", "first"],
+            standalone_mode=False,
+        )
+        assert "Restored 3 files of tank-0003 from snapshot first" in self.output.getvalue()
+        assert (destination / "blocks" / "blk00000.dat").read_bytes() == self.blocks
+        assert (destination / "blocks" / "rev00000.dat").read_bytes() == self.undo
+        assert (destination / "debug.log").read_text() == "tank-0003 log\n"
+
+        self.log.info("Refusing manifest paths outside the destination")
+        store = SnapshotStore(self.store_dir)
+        manifest = store.read_manifest("tank-0003", "first")
+        digest = manifest["files"]["debug.log"]
+        for path in ["../escaped.log", str(self.tmpdir / "absolute.log"), "blocks/../../up.log"]:
+            bad = {**manifest, "files": {"debug.log": digest, path: digest}}
+            try:
+                store.restore(bad, self.tmpdir / "refused")
+            except ValueError as e:
+                assert "is outside" in str(e), e
+            else:
+                raise AssertionError(f"{path} was restored")
+        for name in ["escaped.log", "absolute.log", "up.log"]:
+            assert not (self.tmpdir / name).exists(), name
+        assert not (self.tmpdir / "refused").exists()
+
+        self.log.info("Restoring the latest snapshot of a tank as a tarball")
+        tarball = self.tmpdir / "tank-0005_bitcoin_data.tar.gz"
+        control.restore_snapshot.main(
+            [str(self.store_dir), "tank-0005", str(tarball), "--tar"], standalone_mode=False
+        )
+        with tarfile.open(tarball) as tar:
+            members = {m.name: tar.extractfile(m).read() for m in tar.getmembers()}
+        assert members["./blocks/blk00000.dat"] == self.blocks + b"\x01" * 100
+        assert members["./debug.log"] == b"tank-0005 log\n"
+
+
+if __name__ == "__main__":
+    test = SnapshotStoreTest()
+    test.run_test()
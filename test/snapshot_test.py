@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import io
+import shutil
+import subprocess
+import tarfile
+from pathlib import Path
+
+from fake_api_server import FakeApiServer
+from rich.console import Console
+from test_base import TestBase
+
+from warnet import control, k8s
+from warnet.constants import TANK_MISSION
+
+
+class SnapshotTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+        self.output = io.StringIO()
+        control.console = Console(file=self.output, width=200)
+
+    def run_test(self):
+        try:
+            self.setup_tanks()
+            self.check_snapshot_all()
+            self.check_filters()
+            self.check_failure()
+        finally:
+            self.server.stop()
+
+    def setup_tanks(self):
+        self.log.info("Creating six tanks with datadirs")
+        for i in range(6):
+            name = f"tank-{i:04d}"
+            namespace = "wargames-red" if i == 5 else "default"
+            self.server.add_pod(
+                name, namespace, labels={"mission": TANK_MISSION, "chain": "regtest"}
+            )
+            datadir = self.tmpdir / "tanks" / name / "regtest"
+            (datadir / "blocks").mkdir(parents=True)
+            (datadir / "chainstate").mkdir()
+            (datadir / "wallets" / "miner").mkdir(parents=True)
+            (datadir / "blocks" / "blk00000.dat").write_bytes(bytes(range(256)) * 4000 * (i + 1))
+            (datadir / "chainstate" / "000003.ldb").write_bytes(b"utxo" * 1000)
+            (datadir / "wallets" / "miner" / "wallet.dat").write_bytes(b"keys")
+            (datadir / "debug.log").write_text(f"{name} log\n")
+            self.server.set_pod_root(name, self.tmpdir / "tanks" / name, namespace)
+
+    def snapshot(self, *args: str):
+        self.output.seek(0)
+        self.output.truncate()
+        control.snapshot.main(list(args), standalone_mode=False)
+        output = self.output.getvalue()
+        self.log.info(output)
+        return output
+
+    def members(self, path) -> dict[str, bytes]:
+        with tarfile.open(path) if isinstance(path, Path) else tarfile.open(fileobj=path) as tar:
+            return {m.name: tar.extractfile(m).read() for m in tar.getmembers() if m.isfile()}
+
+    def check_snapshot_all(self):
+        self.log.info("Snapshotting all tanks three at a time")
+        out = self.tmpdir / "all"
+        output = self.snapshot("--all", "-o", str(out), "--jobs", "3")
+        assert "All tank snapshots completed." in output
+        assert 1 < self.server.max_active_execs <= 3, self.server.max_active_execs
+        snapshots = sorted(p.name for p in out.iterdir())
+        assert snapshots == [f"tank-{i:04d}_bitcoin_data.tar.gz" for i in range(6)], snapshots
+        for i in range(6):
+            members = self.members(out / f"tank-{i:04d}_bitcoin_data.tar.gz")
+            assert members["./blocks/blk00000.dat"] == bytes(range(256)) * 4000 * (i + 1)
+            assert members["./debug.log"] == f"tank-{i:04d} log\n".encode()
+            assert set(members) == {
+                "./blocks/blk00000.dat",
+                "./chainstate/000003.ldb",
+                "./wallets/miner/wallet.dat",
+                "./debug.log",
+            }
+
+    def check_filters(self):
+        self.log.info("Snapshotting one tank with filters and no compression")
+        out = self.tmpdir / "filtered"
+        output = self.snapshot(
+            "tank-0005", "-o", str(out), "-f", "blocks,miner", "--compression", "none"
+        )
+        assert "Successfully created snapshot for tank: tank-0005" in output
+        path = out / "tank-0005_bitcoin_data.tar"
+        assert set(self.members(path)) == {"./blocks/blk00000.dat", "./wallets/miner/wallet.dat"}
+        assert f"tar -xf {path.resolve()}" in output
+
+        if shutil.which("zstd"):
+            self.snapshot("tank-0003", "-o", str(out), "-f", "chainstate", "--compression", "zstd")
+            path = out / "tank-0003_bitcoin_data.tar.zst"
+            tar = subprocess.run(["zstd", "-dc", path], capture_output=True, check=True).stdout
+            assert set(self.members(io.BytesIO(tar))) == {"./chainstate/000003.ldb"}
+
+        output = self.snapshot("tank-0001", "-o", str(out), "-f", "nothing-matches")
+        assert not (out / "tank-0001_bitcoin_data.tar.gz").exists()
+
+    def check_failure(self):
+        self.log.info("Checking a failed snapshot leaves no file behind")
+        out = self.tmpdir / "failed"
+        # tar fails when the datadir is missing
+        self.server.set_pod_root("tank-0002", self.tmpdir / "missing")
+        output = self.snapshot("--all", "-o", str(out))
+        assert "Failed to create snapshot for tank tank-0002" in output
+        assert "1 of 6 tank snapshots failed." in output
+        names = sorted(p.name for p in out.iterdir())
+        assert "tank-0002_bitcoin_data.tar.gz" not in names and len(names) == 5, names
+        assert not any(name.endswith(".partial") for name in names)
+
+
+if __name__ == "__main__":
+    test = SnapshotTest()
+    test.run_test()
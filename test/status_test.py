@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import threading
+import time
+from contextlib import redirect_stdout
+
+from click.testing import CliRunner
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+from warnet.status import _watch_status, status
+
+TANKS = 1000
+
+
+class StatusTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.setup_pods()
+            self.check_json()
+            self.check_summary()
+            self.check_watch()
+        finally:
+            self.server.stop()
+
+    def setup_pods(self):
+        self.log.info(f"Creating {TANKS} tanks in two namespaces and two commanders")
+        for i in range(TANKS):
+            self.server.add_pod(
+                f"tank-{i:04d}",
+                namespace="default" if i % 4 else "wargames-red",
+                labels={"mission": TANK_MISSION},
+                phase="Pending" if i < 10 else "Running",
+                image=f"bitcoindevproject/bitcoin:{'26.0' if i % 2 else '27.0'}",
+            )
+        self.server.add_pod("commander-miner", labels={"mission": COMMANDER_MISSION})
+        self.server.add_pod(
+            "commander-done", labels={"mission": COMMANDER_MISSION}, phase="Succeeded"
+        )
+        self.server.add_pod("loki-0", "warnet-logging", labels={"mission": "logging"})
+
+    def pod_lists(self) -> list[str]:
+        return [path for _, path in self.server.requests if "/pods?" in path]
+
+    def status(self, *args: str) -> str:
+        result = CliRunner().invoke(status, list(args), catch_exceptions=False)
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    def check_json(self):
+        self.log.info("Reporting JSON from a single pod listing")
+        lists = len(self.pod_lists())
+        start = time.monotonic()
+        document = json.loads(self.status("--output", "json"))
+        elapsed = time.monotonic() - start
+        self.log.info(f"Status of {TANKS} tanks took {elapsed:.2f}s")
+        # Under a second here, with room for slow CI machines
+        assert elapsed < 2, elapsed
+        assert len(self.pod_lists()) - lists == 1, self.pod_lists()[lists:]
+        assert len(document["tanks"]) == TANKS
+        assert {s["name"] for s in document["scenarios"]} == {"commander-miner", "commander-done"}
+        assert "connectivity" not in document
+        assert document["summary"] == {
+            "tanks": {
+                "total": TANKS,
+                "status": {"pending": 10, "running": TANKS - 10},
+                "namespace": {"default": 750, "wargames-red": 250},
+                "version": {"26.0": 500, "27.0": 500},
+            },
+            "scenarios": {
+                "total": 2,
+                "active": 1,
+                "status": {"running": 1, "succeeded": 1},
+                "namespace": {"default": 2},
+            },
+        }, document["summary"]
+
+    def check_summary(self):
+        self.log.info("Summarizing counts instead of listing every tank")
+        output = self.status("--output", "summary")
+        assert "tank-0001" not in output
+        assert "wargames-red" in output and "27.0" in output
+        assert f"Total Tanks: {TANKS} | Active Scenarios: 1" in output, output
+
+        output = self.status("--no-connectivity")
+        assert "tank-0999" in output and "commander-miner" in output
+        assert "Network connected" not in output
+
+    def check_watch(self):
+        self.log.info("Watching only emits when the summary changes")
+        stop = threading.Event()
+        output = io.StringIO()
+
+        def watch():
+            with redirect_stdout(output):
+                _watch_status("json", stop)
+
+        def last() -> dict:
+            return json.loads(output.getvalue().splitlines()[-1])["summary"]
+
+        thread = threading.Thread(target=watch)
+        thread.start()
+        try:
+            self.wait_for_predicate(
+                lambda: output.getvalue().count("\n") == 1, timeout=10, interval=0.1
+            )
+            lists = len(self.pod_lists())
+            # Status updates that leave the phase alone change nothing shown
+            for i in range(20):
+                namespace = "default" if i % 4 else "wargames-red"
+                self.server.set_pod_phase(f"tank-{i:04d}", "Running", namespace)
+            self.wait_for_predicate(
+                lambda: last()["tanks"]["status"] == {"running": TANKS}, timeout=10, interval=0.1
+            )
+            self.server.remove_pod("commander-miner")
+            self.wait_for_predicate(
+                lambda: last()["scenarios"]["active"] == 0, timeout=10, interval=0.1
+            )
+        finally:
+            stop.set()
+            thread.join()
+        lines = [json.loads(line)["summary"] for line in output.getvalue().splitlines()]
+        self.log.info(f"Watch printed {len(lines)} summaries")
+        assert len(lines) <= 12, len(lines)
+        assert len({json.dumps(line) for line in lines}) == len(lines)
+        # The watch never went back to listing pods
+        assert len([p for p in self.pod_lists()[lists:] if "watch=" not in p]) == 0
+
+
+if __name__ == "__main__":
+    test = StatusTest()
+    test.run_test()
@@ -3,17 +3,38 @@ import logging
 import logging.config
 import os
 import re
+import sys
 import threading
 from pathlib import Path
 from subprocess import run
 from tempfile import mkdtemp
+from textwrap import dedent
 from time import sleep
 
 from warnet import SRC_DIR
-from warnet.k8s import get_pod_exit_status
-from warnet.network import _connected as network_connected
+from warnet.constants import TANK_MISSION
+from warnet.k8s import get_pod_exit_status, get_pod_informer
+from warnet.network import get_connectivity
 from warnet.status import _get_deployed_scenarios as scenarios_deployed
-from warnet.status import _get_tank_status as network_status
+
+# Stands in for `helm`: runs a test's behaviour, then records the call as a JSON line with
+# its arguments, the contents of its -f override files, and when it started and ended
+STUB_HELM = """#!{python}
+import json, os, sys, time
+args = sys.argv[1:]
+start = time.monotonic()
+exit_code = 0
+{behaviour}
+overrides = [open(args[i + 1]).read() for i, arg in enumerate(args) if arg == "-f"]
+with open({log!r}, "a") as f:
+    f.write(json.dumps({{
+        "args": args,
+        "overrides": overrides,
+        "start": start,
+        "end": time.monotonic(),
+    }}) + "\\n")
+sys.exit(exit_code)
+"""
 
 
 class TestBase:
@@ -46,7 +67,7 @@ class TestBase:
             self.log.info("Stopping network")
             if self.network:
                 self.warnet("down --force")
-                self.wait_for_all_tanks_status(target="stopped", timeout=60, interval=1)
+                self.wait_for_all_tanks_status(target="stopped", timeout=60)
         except Exception as e:
             self.log.error(f"Error bringing network down: {e}")
         finally:
@@ -73,6 +94,22 @@ class TestBase:
             raise Exception(proc.stderr.decode().strip())
         return proc.stdout.decode().strip()
 
+    def install_stub_helm(self, behaviour: str = "") -> Path:
+        """
+        Put a stub `helm` first on PATH, and return the file it records its calls in.
+        `behaviour` is Python each call runs first: it can read `args` and set `exit_code`.
+        """
+        bin_dir = self.tmpdir / "bin"
+        bin_dir.mkdir(exist_ok=True)
+        log = self.tmpdir / "helm.jsonl"
+        helm = bin_dir / "helm"
+        helm.write_text(
+            STUB_HELM.format(python=sys.executable, log=str(log), behaviour=dedent(behaviour))
+        )
+        helm.chmod(0o755)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+        return log
+
     def output_reader(self, pipe, func):
         while not self.stop_threads.is_set():
             line = pipe.readline().strip()
@@ -99,31 +136,48 @@ class TestBase:
         # TODO
         return None
 
-    def wait_for_all_tanks_status(self, target="running", timeout=20 * 60, interval=5):
-        """Poll the warnet server for container status
+    def wait_for_all_tanks_status(self, target="running", timeout=20 * 60):
+        """Watch the shared pod informer for container status
         Block until all tanks are running
         """
+        last_stats = None
 
-        def check_status():
-            tanks = network_status()
+        def check_status(informer):
+            nonlocal last_stats
+            tanks = informer.pods(mission=TANK_MISSION)
             stats = {"total": 0}
             # "Probably" means all tanks are stopped and deleted
             if len(tanks) == 0:
                 return True
             for tank in tanks:
-                status = tank["status"]
+                status = tank.status.phase.lower()
                 stats["total"] += 1
                 stats[status] = stats.get(status, 0) + 1
-            self.log.info(f"Waiting for all tanks to reach '{target}': {stats}")
+            if stats != last_stats:
+                self.log.info(f"Waiting for all tanks to reach '{target}': {stats}")
+                last_stats = stats
             return target in stats and stats[target] == stats["total"]
 
-        self.wait_for_predicate(check_status, timeout, interval)
+        if not get_pod_informer().wait_for(check_status, timeout):
+            raise Exception(f"Timed out waiting for all tanks to reach '{target}'")
 
-    def wait_for_all_edges(self, timeout=20 * 60, interval=5):
+    def wait_for_all_edges(self, timeout=20 * 60, interval=1):
         """Ensure all tanks have all the connections they are supposed to have
         Block until all success
         """
-        self.wait_for_predicate(network_connected, timeout, interval)
+        informer = get_pod_informer()
+        last_waiting = None
+
+        def check_edges():
+            nonlocal last_waiting
+            report = get_connectivity(tanks=informer.pods(mission=TANK_MISSION))
+            waiting = sorted(tank["tank"] for tank in report if not tank["connected"])
+            if waiting != last_waiting:
+                self.log.info(f"Waiting for edges of {len(waiting)}/{len(report)} tanks")
+                last_waiting = waiting
+            return report and not waiting
+
+        self.wait_for_predicate(check_edges, timeout, interval)
 
     def wait_for_all_scenarios(self):
         def check_scenarios():
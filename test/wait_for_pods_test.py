@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+from fake_api_server import FakeApiServer
+from test_base import TestBase
+
+from warnet import k8s
+from warnet.constants import COMMANDER_MISSION, TANK_MISSION
+from warnet.k8s import wait_for_init, wait_for_inits, wait_for_pod, wait_for_pod_ready
+
+TANKS = 200
+
+
+class WaitForPodsTest(TestBase):
+    def __init__(self):
+        super().__init__()
+        self.server = FakeApiServer().start()
+        k8s.KUBECONFIG = str(self.server.write_kubeconfig(self.tmpdir / "kubeconfig"))
+
+    def run_test(self):
+        try:
+            self.setup_pods()
+            self.check_already_ready()
+            self.check_targeted_watch()
+            self.check_multi_pod()
+            self.check_relist_after_compaction()
+            self.check_wait_for_pod()
+        finally:
+            self.server.stop()
+
+    def setup_pods(self):
+        self.log.info(f"Creating {TANKS} tanks")
+        for i in range(TANKS):
+            self.server.add_pod(f"tank-{i:04d}", labels={"mission": TANK_MISSION})
+
+    def watches(self) -> int:
+        return len([path for _, path in self.server.requests if "watch=True" in path])
+
+    def later(self, delay: float, action):
+        timer = threading.Timer(delay, action)
+        timer.start()
+        return timer
+
+    def churn_tanks(self):
+        """Status updates from every tank, which a namespace-wide watch would all receive"""
+        for i in range(TANKS):
+            self.server.set_pod_phase(f"tank-{i:04d}", "Running")
+
+    def check_already_ready(self):
+        self.log.info("A pod that is already ready needs no watch")
+        watches = self.watches()
+        start = time.monotonic()
+        assert wait_for_pod_ready("tank-0007", "default", timeout=10)
+        assert time.monotonic() - start < 1
+        assert self.watches() == watches
+
+    def check_targeted_watch(self):
+        self.log.info("Waiting on one commander only receives its own events")
+        self.server.add_pod("commander-a", labels={"mission": COMMANDER_MISSION}, phase="Pending")
+        sent = self.server.watch_events_sent
+        self.later(0.2, self.churn_tanks)
+        self.later(0.5, lambda: self.server.set_init_running("commander-a"))
+        assert wait_for_init("commander-a", timeout=10, namespace="default")
+        assert self.server.watch_events_sent - sent == 1, self.server.watch_events_sent - sent
+        watch = [path for _, path in self.server.requests if "watch=True" in path][-1]
+        assert "fieldSelector=metadata.name%3Dcommander-a" in watch, watch
+        assert "resourceVersion=" in watch
+
+    def check_multi_pod(self):
+        self.log.info("Waiting on several commanders shares one watch")
+        names = [f"commander-{i}" for i in range(5)]
+        for name in names:
+            self.server.add_pod(name, labels={"mission": COMMANDER_MISSION}, phase="Pending")
+        # One is already waiting for its upload
+        self.server.set_init_running("commander-3")
+        order = ["commander-1", "commander-4", "commander-0", "commander-2"]
+        for i, name in enumerate(order):
+            self.later(0.1 * (i + 1), lambda name=name: self.server.set_init_running(name))
+        watches = self.watches()
+        ready = list(
+            wait_for_inits(
+                names, "default", timeout=10, label_selector=f"mission={COMMANDER_MISSION}"
+            )
+        )
+        assert ready == ["commander-3", *order], ready
+        assert self.watches() - watches == 1
+
+    def check_relist_after_compaction(self):
+        self.log.info("Relisting when the watch's resourceVersion has been compacted")
+        self.server.add_pod("commander-b", labels={"mission": COMMANDER_MISSION}, phase="Pending")
+
+        def compact_then_start():
+            self.server.compact()
+            self.server.set_init_running("commander-b")
+
+        self.later(0.3, compact_then_start)
+        assert wait_for_init("commander-b", timeout=10, namespace="default")
+
+    def check_wait_for_pod(self):
+        self.log.info("Waiting for a pod to leave Pending without polling")
+        self.server.add_pod("commander-c", labels={"mission": COMMANDER_MISSION}, phase="Pending")
+        self.later(0.3, lambda: self.server.set_pod_phase("commander-c", "Running"))
+        reads = len([path for _, path in self.server.requests if path.endswith("/status")])
+        start = time.monotonic()
+        wait_for_pod("commander-c", timeout_seconds=10, namespace="default")
+        assert 0.2 < time.monotonic() - start < 2
+        assert len([path for _, path in self.server.requests if path.endswith("/status")]) == reads
+
+
+if __name__ == "__main__":
+    test = WaitForPodsTest()
+    test.run_test()